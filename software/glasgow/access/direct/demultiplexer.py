@@ -49,14 +49,77 @@ _max_packets_per_ep = 1024
 # each time it sends an IN token, they will all be read before the read finishes; if we request
 # a read of dozens of megabytes, this can take seconds.
 #
-# To try and balance these effects, we choose a medium buffer size that should work well with most
-# applications. It's possible that this will need to become customizable later, but for now
-# a single fixed value works.
+# To try and balance these effects, we choose a medium buffer size that works well with most
+# applications by default. Applets that stream large amounts of data (or have no idea how much
+# data they will be streaming) can select a different transfer profile when claiming an interface.
 _packets_per_xfer = 32
 
 # Queue as many transfers as we can, but no more than 16, as the returns beyond that point
 # are diminishing.
-_xfers_per_queue = min(16, _max_packets_per_ep // _packets_per_xfer)
+_max_xfers_per_queue = 16
+
+# Each transfer profile is a range of transfer sizes, in packets, that the interface may use.
+# The queue depth is derived from the transfer size such that the amount of in-flight requests
+# on each endpoint never exceeds `_max_packets_per_ep`.
+#  * The "latency" profile uses the fixed medium buffer size described above. It is the default.
+#  * The "throughput" profile uses the largest transfers allowed by the cutoff, which minimizes
+#    CPU load at the cost of latency; it is appropriate for applets that stream data continuously.
+#  * The "auto" profile starts out with the medium buffer size, and then grows the transfers when
+#    they are consistently filled to capacity (or when the queue is consistently full), and shrinks
+#    them when they are consistently partially filled, i.e. when traffic is latency-bound.
+_xfer_profiles = {
+    "latency":    (_packets_per_xfer, _packets_per_xfer),
+    "throughput": (_max_packets_per_ep // 4, _max_packets_per_ep // 4),
+    "auto":       (_packets_per_xfer // 4, _max_packets_per_ep // 4),
+}
+
+# In the "auto" profile, the transfer size is only changed after this many consecutive transfers
+# indicate that it should be, to avoid thrashing when the traffic pattern is irregular.
+_xfers_per_adjustment = 8
+
+
+class _TransferSizing:
+    def __init__(self, packet_size, profile):
+        if profile not in _xfer_profiles:
+            raise ValueError(f"unknown transfer profile {profile!r}")
+
+        self.packet_size = packet_size
+        self.profile     = profile
+        self._min_packets, self._max_packets = _xfer_profiles[profile]
+        self._packets = min(max(_packets_per_xfer, self._min_packets), self._max_packets)
+        self._balance = 0
+
+    @property
+    def packets_per_xfer(self):
+        return self._packets
+
+    @property
+    def xfers_per_queue(self):
+        return min(_max_xfers_per_queue, _max_packets_per_ep // self._packets)
+
+    @property
+    def xfer_size(self):
+        return self.packet_size * self._packets
+
+    def update(self, saturated):
+        """
+        Record whether the most recent transfer was limited by the transfer size or the queue
+        depth (``saturated``) or by the amount of data available (not ``saturated``). Returns
+        ``True`` if the transfer size has changed as a result.
+        """
+        if saturated:
+            self._balance = max(self._balance, 0) + 1
+        else:
+            self._balance = min(self._balance, 0) - 1
+
+        if self._balance >= _xfers_per_adjustment and self._packets < self._max_packets:
+            self._packets = min(self._packets * 2, self._max_packets)
+        elif self._balance <= -_xfers_per_adjustment and self._packets > self._min_packets:
+            self._packets = max(self._packets // 2, self._min_packets)
+        else:
+            return False
+        self._balance = 0
+        return True
 
 
 class DirectDemultiplexer(AccessDemultiplexer):
@@ -79,11 +142,12 @@ class DirectDemultiplexer(AccessDemultiplexer):
             assert False
 
     async def claim_interface(self, applet, mux_interface, args, pull_low=set(), pull_high=set(),
-                              **kwargs):
+                              profile="latency", **kwargs):
         assert mux_interface._pipe_num not in self._claimed
         self._claimed.add(mux_interface._pipe_num)
 
-        iface = DirectDemultiplexerInterface(self.device, applet, mux_interface, **kwargs)
+        iface = DirectDemultiplexerInterface(self.device, applet, mux_interface,
+                                             profile=profile, **kwargs)
         self._interfaces.append(iface)
 
         if hasattr(args, "mirror_voltage") and args.mirror_voltage:
@@ -140,12 +204,13 @@ class DirectDemultiplexer(AccessDemultiplexer):
 
 class DirectDemultiplexerInterface(AccessDemultiplexerInterface):
     def __init__(self, device, applet, mux_interface,
-                 read_buffer_size=None, write_buffer_size=None):
+                 read_buffer_size=None, write_buffer_size=None, profile="latency"):
         super().__init__(device, applet)
 
         self._write_buffer_size = write_buffer_size
         self._read_buffer_size  = read_buffer_size
         self._in_pushback  = asyncio.Condition()
+        self._in_inflight  = 0
         self._out_inflight = 0
 
         self._pipe_num   = mux_interface._pipe_num
@@ -173,9 +238,13 @@ class DirectDemultiplexerInterface(AccessDemultiplexerInterface):
                 self._out_packet_size = packet_size
         assert self._endpoint_in != None and self._endpoint_out != None
 
+        self._in_sizing  = _TransferSizing(self._in_packet_size,  profile)
+        self._out_sizing = _TransferSizing(self._out_packet_size, profile)
+
         self._interface  = self.device.usb_handle.claimInterface(self._pipe_num)
         self._in_tasks   = TaskQueue()
         self._in_buffer  = ChunkedFIFO()
+        self._in_pool    = []
         self._out_tasks  = TaskQueue()
         self._out_buffer = ChunkedFIFO()
 
@@ -203,28 +272,66 @@ class DirectDemultiplexerInterface(AccessDemultiplexerInterface):
         # streaming data, there are no overflows. (This is perhaps not the best way to implement
         # an applet, but we can support it easily enough, and it avoids surprise overflows.)
         self.logger.trace("FIFO: pipelining reads")
-        for _ in range(_xfers_per_queue):
-            self._in_tasks.submit(self._in_task())
+        while len(self._in_pool) < self._in_sizing.xfers_per_queue:
+            self._in_pool.append(bytearray(self._in_sizing.xfer_size))
+        self._in_inflight = 0
+        self._in_submit()
         # Give the IN tasks a chance to submit their transfers before deasserting reset.
         await asyncio.sleep(0)
 
         self.logger.trace("deasserting reset")
         await self.device.write_register(self._addr_reset, 0)
 
-    async def _in_task(self):
-        if self._read_buffer_size is not None:
-            async with self._in_pushback:
-                while len(self._in_buffer) > self._read_buffer_size:
-                    self.logger.trace("FIFO: read pushback")
-                    await self._in_pushback.wait()
+    def _in_submit(self):
+        # Top up the queue of reads to the current queue depth. If the queue depth has shrunk,
+        # the excess reads are retired as they complete.
+        while self._in_inflight < self._in_sizing.xfers_per_queue:
+            self._in_inflight += 1
+            self._in_tasks.submit(self._in_task())
+
+    def _adjust(self, sizing, saturated):
+        if sizing.update(saturated):
+            self.logger.trace("FIFO: %s transfers resized to %d × %d packets",
+                              "IN" if sizing is self._in_sizing else "OUT",
+                              sizing.xfers_per_queue, sizing.packets_per_xfer)
+
+    # IN transfers are received directly into preallocated buffers, which are kept in a pool and
+    # recycled once all of the data in them has been consumed from the FIFO. This avoids both
+    # allocating a new buffer and copying the data out of it for every transfer; it is safe because
+    # the data in the FIFO is only ever copied out of it (see `read_into`), never referenced.
+    def _in_acquire(self):
+        size = self._in_sizing.xfer_size
+        while self._in_pool:
+            buffer = self._in_pool.pop()
+            if len(buffer) == size:
+                return buffer
+        return bytearray(size)
+
+    def _in_release(self, buffer):
+        # Buffers for a transfer size that is no longer used (with the "auto" profile) are dropped.
+        if (len(buffer) == self._in_sizing.xfer_size and
+                len(self._in_pool) < self._in_sizing.xfers_per_queue * 2):
+            self._in_pool.append(buffer)
 
-        size = self._in_packet_size * _packets_per_xfer
-        data = await self.device.bulk_read(self._endpoint_in, size)
-        self._in_buffer.write(data)
+    async def _in_task(self):
+        try:
+            if self._read_buffer_size is not None:
+                async with self._in_pushback:
+                    while len(self._in_buffer) > self._read_buffer_size:
+                        self.logger.trace("FIFO: read pushback")
+                        await self._in_pushback.wait()
+
+            buffer = self._in_acquire()
+            length = await self.device.bulk_read_into(self._endpoint_in, buffer)
+            self._in_buffer.write(memoryview(buffer)[:length],
+                                  release=lambda: self._in_release(buffer))
+        finally:
+            self._in_inflight -= 1
 
-        self._in_tasks.submit(self._in_task())
+        self._adjust(self._in_sizing, saturated=(length == len(buffer)))
+        self._in_submit()
 
-    async def read(self, length=None, *, flush=True):
+    async def _read_wait(self, length, flush):
         if flush and len(self._out_buffer) > 0:
             # Flush the buffer, so that everything written before the read reaches the device.
             await self.flush(wait=False)
@@ -245,28 +352,39 @@ class DirectDemultiplexerInterface(AccessDemultiplexerInterface):
             while len(self._in_buffer) < length:
                 self.logger.trace("FIFO: need %d bytes", length - len(self._in_buffer))
                 await self._in_tasks.wait_one()
+        return length
+
+    async def read(self, length=None, *, flush=True):
+        length = await self._read_wait(length, flush)
 
+        # Always return a memoryview object, to avoid hard to detect edge cases downstream.
+        result = memoryview(bytearray(length))
         async with self._in_pushback:
-            result = self._in_buffer.read(length)
+            self._in_buffer.read_into(result)
             self._in_pushback.notify_all()
-        if len(result) < length:
-            chunks  = [result]
-            length -= len(result)
-            while length > 0:
-                async with self._in_pushback:
-                    chunk = self._in_buffer.read(length)
-                    self._in_pushback.notify_all()
-                chunks.append(chunk)
-                length -= len(chunk)
-            # Always return a memoryview object, to avoid hard to detect edge cases downstream.
-            result = memoryview(b"".join(chunks))
 
         self.logger.trace("FIFO: read <%s>", dump_hex(result))
         return result
 
+    async def read_into(self, buffer, *, flush=True):
+        """
+        Read exactly ``len(buffer)`` bytes into ``buffer``, which must be a writable bytes-like
+        object. Unlike :meth:`read`, this method does not allocate any memory, and the data
+        is copied only once, from the buffer the USB transfer was received into.
+        """
+        buffer = memoryview(buffer).cast("B")
+        await self._read_wait(len(buffer), flush)
+
+        async with self._in_pushback:
+            self._in_buffer.read_into(buffer)
+            self._in_pushback.notify_all()
+
+        self.logger.trace("FIFO: read <%s>", dump_hex(buffer))
+        return len(buffer)
+
     def _out_slice(self):
         # Fast path: read as much contiguous data as possible, up to our transfer size.
-        size = self._out_packet_size * _packets_per_xfer
+        size = self._out_sizing.xfer_size
         data = self._out_buffer.read(size)
 
         if len(data) < self._out_packet_size:
@@ -282,7 +400,7 @@ class DirectDemultiplexerInterface(AccessDemultiplexerInterface):
 
     @property
     def _out_threshold(self):
-        out_xfer_size = self._out_packet_size * _packets_per_xfer
+        out_xfer_size = self._out_sizing.xfer_size
         if self._write_buffer_size is None:
             return out_xfer_size
         else:
@@ -296,6 +414,8 @@ class DirectDemultiplexerInterface(AccessDemultiplexerInterface):
         finally:
             self._out_inflight -= len(data)
 
+        self._adjust(self._out_sizing, saturated=(len(data) == self._out_sizing.xfer_size))
+
         # See the comment in `write` below for an explanation of the following code.
         if len(self._out_buffer) >= self._out_threshold:
             self._out_tasks.submit(self._out_task(self._out_slice()))
@@ -306,6 +426,7 @@ class DirectDemultiplexerInterface(AccessDemultiplexerInterface):
             # write buffer size, then wait until the inflight requests arrive before continuing.
             if self._out_inflight >= self._write_buffer_size:
                 self._out_stalls += 1
+                self._adjust(self._out_sizing, saturated=True)
             while self._out_inflight >= self._write_buffer_size:
                 self.logger.trace("FIFO: write pushback")
                 await self._out_tasks.wait_one()
@@ -319,7 +440,7 @@ class DirectDemultiplexerInterface(AccessDemultiplexerInterface):
         # The write scheduling algorithm attempts to satisfy several partially conflicting goals:
         #  * We want to schedule writes as early as possible, because this reduces buffer bloat and
         #    can dramatically improve responsiveness of the system.
-        #  * We want to schedule writes that are as large as possible, up to _packets_per_xfer,
+        #  * We want to schedule writes that are as large as possible, up to the transfer size,
         #    because this reduces CPU utilization and improves latency.
         #  * We never want to automatically schedule writes smaller than _out_packet_size,
         #    because they occupy a whole microframe anyway.
@@ -327,17 +448,18 @@ class DirectDemultiplexerInterface(AccessDemultiplexerInterface):
         # We use an approach that performs well when fed with a steady sequence of very large
         # FIFO chunks, yet scales down to packet-size and byte-size FIFO chunks as well.
         #  * We only submit a write automatically once the buffer level crosses the threshold of
-        #    `_out_packet_size * _packets_per_xfer`. In this case, _slice_packet always returns
-        #    `_out_packet_size * n` bytes, where n is between 1 and _packet_per_xfer.
+        #    `_out_packet_size * packets_per_xfer`. In this case, _slice_packet always returns
+        #    `_out_packet_size * n` bytes, where n is between 1 and packets_per_xfer.
         #  * We submit enough writes that there is at least one write for each transfer worth
-        #    of data in the buffer, up to _xfers_per_queue outstanding writes.
+        #    of data in the buffer, up to xfers_per_queue outstanding writes.
         #  * We submit another write once one finishes, if the buffer level is still above
         #    the threshold, even if no more explicit write calls are performed.
         #
-        # This provides predictable write behavior; only _packets_per_xfer packet writes are
+        # This provides predictable write behavior; only packets_per_xfer packet writes are
         # automatically submitted, and only the minimum necessary number of tasks are scheduled on
-        # calls to `write`.
-        while len(self._out_tasks) < _xfers_per_queue and \
+        # calls to `write`. (The transfer size and queue depth are given by the transfer profile,
+        # and may change over time in the "auto" profile.)
+        while len(self._out_tasks) < self._out_sizing.xfers_per_queue and \
                     len(self._out_buffer) >= self._out_threshold:
             self._out_tasks.submit(self._out_task(self._out_slice()))
 
@@ -345,21 +467,22 @@ class DirectDemultiplexerInterface(AccessDemultiplexerInterface):
         self.logger.trace("FIFO: flush")
 
         # First, we ensure we can submit one more task. (There can be more tasks than
-        # _xfers_per_queue because a task may spawn another one just before it terminates.)
-        if len(self._out_tasks) >= _xfers_per_queue:
+        # xfers_per_queue because a task may spawn another one just before it terminates.)
+        if len(self._out_tasks) >= self._out_sizing.xfers_per_queue:
             self._out_stalls += 1
-        while len(self._out_tasks) >= _xfers_per_queue:
+            self._adjust(self._out_sizing, saturated=True)
+        while len(self._out_tasks) >= self._out_sizing.xfers_per_queue:
             await self._out_tasks.wait_one()
 
-        # At this point, the buffer can contain at most _packets_per_xfer packets worth
-        # of data, as anything beyond that crosses the threshold of automatic submission.
-        # So, we can simply submit the rest of data, which by definition fits into a single
-        # transfer.
-        assert len(self._out_buffer) <= self._out_packet_size * _packets_per_xfer
-        if self._out_buffer:
+        # At this point, the buffer usually contains at most packets_per_xfer packets worth
+        # of data, as anything beyond that crosses the threshold of automatic submission, and
+        # we can simply submit the rest of data, which by definition fits into a single transfer.
+        # However, if the transfer size has shrunk since the data was buffered, it may take
+        # several transfers.
+        while self._out_buffer:
             data = bytearray()
-            while self._out_buffer:
-                data += self._out_buffer.read()
+            while self._out_buffer and len(data) < self._out_sizing.xfer_size:
+                data += self._out_buffer.read(self._out_sizing.xfer_size - len(data))
             self._out_inflight += len(data)
             self._out_tasks.submit(self._out_task(data))
 
@@ -388,3 +511,9 @@ class DirectDemultiplexerInterface(AccessDemultiplexerInterface):
                          self._in_tasks.total_wait_count)
         self.logger.info("  write wakeups : %d",
                          self._out_tasks.total_wait_count)
+        self.logger.info("  read xfers    : %d × %d B (%s)",
+                         self._in_sizing.xfers_per_queue, self._in_sizing.xfer_size,
+                         self._in_sizing.profile)
+        self.logger.info("  write xfers   : %d × %d B (%s)",
+                         self._out_sizing.xfers_per_queue, self._out_sizing.xfer_size,
+                         self._out_sizing.profile)
@@ -14,6 +14,42 @@ __all__ = ["GlasgowAppletMetadata", "GlasgowAppletError", "GlasgowApplet", "Glas
 class GlasgowAppletMetadata(PluginMetadata):
     GROUP_NAME = "glasgow.applet"
 
+    @classmethod
+    def _describe(cls, applet_cls):
+        attributes = {
+            "preview":           applet_cls.preview,
+            "required_revision": applet_cls.required_revision,
+            "has_tests":         applet_cls.tests() is not None,
+        }
+        if hasattr(applet_cls, "tool_cls"):
+            attributes["tool_synopsis"] = applet_cls.tool_cls.help
+            attributes["tool_description"] = applet_cls.tool_cls.description
+        return attributes
+
+    @property
+    def preview(self):
+        return self.attributes["preview"]
+
+    @property
+    def required_revision(self):
+        return self.attributes["required_revision"]
+
+    @property
+    def has_tests(self):
+        return self.attributes["has_tests"]
+
+    @property
+    def has_tool(self):
+        return "tool_synopsis" in self.attributes
+
+    @property
+    def tool_synopsis(self):
+        return self.attributes["tool_synopsis"]
+
+    @property
+    def tool_description(self):
+        return self.attributes["tool_description"]
+
     @property
     def applet_cls(self):
         return self.load()
@@ -107,6 +143,7 @@ import types
 import threading
 import inspect
 import json
+import collections
 from amaranth.sim import *
 
 from ..access.simulation import *
@@ -120,7 +157,7 @@ from ..platform.rev_ab import GlasgowRevABPlatform
 
 
 __all__ += ["GlasgowAppletTestCase", "synthesis_test", "applet_simulation_test",
-            "applet_hardware_test"]
+            "applet_hardware_test", "async_test", "MockResponseQueue"]
 
 
 class MockRecorder:
@@ -206,6 +243,27 @@ class MockReplayer:
         return mock
 
 
+class MockResponseQueue:
+    # Responses of a mock lower interface, in the order in which they were requested. Keeps track
+    # of the largest number of responses that were requested but not yet read, which is the depth
+    # of the request pipeline of the interface under test.
+    def __init__(self):
+        self._responses   = collections.deque()
+        self.max_inflight = 0
+
+    def __len__(self):
+        return len(self._responses)
+
+    def push(self, response):
+        self._responses.append(response)
+        self.max_inflight = max(self.max_inflight, len(self._responses))
+
+    def pop(self, length=None):
+        response = self._responses.popleft()
+        assert length is None or len(response) == length
+        return response
+
+
 class GlasgowAppletTestCase(unittest.TestCase):
     def __init_subclass__(cls, applet, **kwargs):
         super().__init_subclass__(**kwargs)
@@ -276,9 +334,9 @@ class GlasgowAppletTestCase(unittest.TestCase):
 
         old_run_lower = self.applet.run_lower
 
-        async def run_lower(cls, device, args):
+        async def run_lower(cls, device, args, **kwargs):
             if mode == "record":
-                lower_iface = await old_run_lower(cls, device, args)
+                lower_iface = await old_run_lower(cls, device, args, **kwargs)
                 recorder = MockRecorder(case, lower_iface, fixture)
                 self._recorders.append(recorder)
                 return recorder
@@ -386,3 +444,15 @@ def applet_hardware_test(setup="run_hardware_applet", args=[]):
         return wrapper
 
     return decorator
+
+
+def async_test(case):
+    @functools.wraps(case)
+    def wrapper(self):
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(case(self))
+        finally:
+            loop.close()
+
+    return wrapper
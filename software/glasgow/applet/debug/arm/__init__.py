@@ -9,7 +9,7 @@ from ....arch.arm.dap import *
 from ... import *
 
 
-__all__ = ["ARMDPInterface", "ARMAPTransactionError", "DebugARMAppletMixin"]
+__all__ = ["ARMDPInterface", "ARMDPError", "ARMAPTransactionError", "DebugARMAppletMixin"]
 
 
 class ARMDPError(GlasgowAppletError):
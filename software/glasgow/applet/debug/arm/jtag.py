@@ -21,6 +21,10 @@ class ARMJTAGDPInterface(ARMDPInterface, aobject):
         CDBGPWRUPREQ=0b1, CDBGPWRUPACK=0b1,
         CSYSPWRUPREQ=0b1, CSYSPWRUPACK=0b1).to_int()
 
+    # Expected value and mask for xPACC captures that are only checked for an OK/FAULT response.
+    _DR_xPACC_ACK_OK_FAULT_bits = DR_xPACC_capture(ACK=DR_xPACC_ACK.OK_FAULT).to_bits()
+    _DR_xPACC_ACK_mask_bits     = DR_xPACC_capture(ACK=0b111).to_bits()
+
     async def __init__(self, interface, logger):
         self.lower   = interface
         self._logger = logger
@@ -34,24 +38,35 @@ class ARMJTAGDPInterface(ARMDPInterface, aobject):
 
     # Low-level xPACC operations
 
+    async def _update_xpacc(self, dr_update):
+        # The ACK response is compared by the probe; the returned future is resolved together
+        # with the next operation that reads data back, or by `_check_xpacc`.
+        await self.lower.compare_dr(dr_update.to_bits(),
+            self._DR_xPACC_ACK_OK_FAULT_bits, self._DR_xPACC_ACK_mask_bits)
+        return await self.lower.get_compare(defer=True)
+
+    async def _check_xpacc(self, compare):
+        if not compare.done():
+            await self.lower.flush()
+        if compare.result() is not None:
+            raise ARMDPError("xPACC transaction was not acknowledged with OK/FAULT")
+
     async def _write_dpacc(self, addr, value):
         await self.lower.write_ir(IR_DPACC)
 
         dr_update = DR_xPACC_update(RnW=0, A=(addr & 0xf) >> 2, DATAIN=value)
-        # TODO: use JTAG masked compare when implemented
-        dr_capture = DR_xPACC_capture.from_bits(await self.lower.exchange_dr(dr_update.to_bits()))
-        assert dr_capture.ACK == DR_xPACC_ACK.OK_FAULT
+        compare = await self._update_xpacc(dr_update)
+        await self._check_xpacc(compare)
 
     async def _read_dpacc(self, addr):
         await self.lower.write_ir(IR_DPACC)
 
         dr_update = DR_xPACC_update(RnW=1, A=(addr & 0xf) >> 2)
-        # TODO: use JTAG masked compare when implemented
-        dr_capture = DR_xPACC_capture.from_bits(await self.lower.exchange_dr(dr_update.to_bits()))
-        assert dr_capture.ACK == DR_xPACC_ACK.OK_FAULT
+        compare = await self._update_xpacc(dr_update)
 
         # TODO: pick a better nop than repeated read?
         dr_capture = DR_xPACC_capture.from_bits(await self.lower.exchange_dr(dr_update.to_bits()))
+        await self._check_xpacc(compare)
         assert dr_capture.ACK == DR_xPACC_ACK.OK_FAULT
 
         return dr_capture.ReadResult
@@ -86,21 +101,20 @@ class ARMJTAGDPInterface(ARMDPInterface, aobject):
         await self.lower.write_ir(IR_APACC)
 
         dr_update = DR_xPACC_update(RnW=0, A=(addr & 0xf) >> 2, DATAIN=value)
-        # TODO: use JTAG masked compare when implemented
-        dr_capture = DR_xPACC_capture.from_bits(await self.lower.exchange_dr(dr_update.to_bits()))
-        assert dr_capture.ACK == DR_xPACC_ACK.OK_FAULT
+        compare = await self._update_xpacc(dr_update)
 
         await self._poll_apacc()
+        await self._check_xpacc(compare)
 
     async def _read_apacc(self, addr):
         await self.lower.write_ir(IR_APACC)
 
         dr_update = DR_xPACC_update(RnW=1, A=(addr & 0xf) >> 2)
-        # TODO: use JTAG masked compare when implemented
-        dr_capture = DR_xPACC_capture.from_bits(await self.lower.exchange_dr(dr_update.to_bits()))
-        assert dr_capture.ACK == DR_xPACC_ACK.OK_FAULT
+        compare = await self._update_xpacc(dr_update)
 
-        return await self._poll_apacc()
+        result = await self._poll_apacc()
+        await self._check_xpacc(compare)
+        return result
 
     # High-level DP and AP register operations
 
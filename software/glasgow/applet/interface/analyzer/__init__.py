@@ -43,6 +43,10 @@ class AnalyzerInterface:
         self.decoder.process(await self.lower.read())
         return self.decoder.flush()
 
+    async def read_batch(self):
+        self.decoder.process(await self.lower.read())
+        return self.decoder.flush_batch()
+
 
 class AnalyzerApplet(GlasgowApplet):
     logger = logging.getLogger(__name__)
@@ -88,7 +92,8 @@ class AnalyzerApplet(GlasgowApplet):
         if args.pull_downs:
             pull_low = set(args.pin_set_i)
         iface = await device.demultiplexer.claim_interface(self, self.mux_interface, args,
-                                                           pull_low=pull_low, pull_high=pull_high)
+                                                           pull_low=pull_low, pull_high=pull_high,
+                                                           profile="throughput")
         return AnalyzerInterface(iface, self._event_sources)
 
     @classmethod
@@ -108,21 +113,21 @@ class AnalyzerApplet(GlasgowApplet):
             overrun = False
             timestamp = 0
             while not overrun:
-                for cycle, events in await iface.read():
+                batch = await iface.read_batch()
+                for cycle, source, value in batch:
                     timestamp = cycle * 1_000_000_000 // self._sample_freq
 
-                    if events == "overrun":
-                        self.logger.error("FIFO overrun, shutting down")
-                        for signal in signals:
-                            vcd_writer.change(signal, timestamp, "x")
-                        overrun = True
-                        break
-
-                    if "pin" in events: # could be also "throttle"
-                        value = events["pin"]
+                    if source == 0: # could be also THROTTLE_SOURCE
                         for bit, signal in enumerate(signals):
                             vcd_writer.change(signal, timestamp, (value >> bit) & 1)
 
+                if batch.end == "overrun":
+                    timestamp = batch.end_timestamp * 1_000_000_000 // self._sample_freq
+                    self.logger.error("FIFO overrun, shutting down")
+                    for signal in signals:
+                        vcd_writer.change(signal, timestamp, "x")
+                    overrun = True
+
         finally:
             vcd_writer.close(timestamp)
 
@@ -3,6 +3,7 @@ import logging
 import math
 from amaranth import *
 
+from ....support.command_batch import CommandBatch
 from ....gateware.pads import *
 from ....gateware.i2c import I2CInitiator
 from ... import *
@@ -98,8 +99,20 @@ class I2CInitiatorSubtarget(Elaboratable):
                         self.in_fifo.w_data.eq(count),
                         self.in_fifo.w_en.eq(1),
                     ]
-                    m.d.sync += count.eq(0)
-                    m.next = "IDLE"
+                    with m.If(count > 1):
+                        # The bytes after the unacknowledged one are still in the FIFO; they must
+                        # be discarded, or they would be interpreted as commands.
+                        m.d.sync += count.eq(count - 1)
+                        m.next = "DISCARD"
+                    with m.Else():
+                        m.d.sync += count.eq(0)
+                        m.next = "IDLE"
+            with m.State("DISCARD"):
+                with m.If(self.out_fifo.r_rdy):
+                    m.d.comb += self.out_fifo.r_en.eq(1)
+                    m.d.sync += count.eq(count - 1)
+                    with m.If(count == 1):
+                        m.next = "IDLE"
 
             with m.State("READ-FIRST"):
                 m.d.comb += [
@@ -137,99 +150,35 @@ class I2CInitiatorInterface:
         self._logger.debug("I2C: reset")
         await self.lower.reset()
 
-    async def _cmd_start(self):
-        await self.lower.write([CMD_START])
-
-    async def _cmd_stop(self):
-        await self.lower.write([CMD_STOP])
-
-    async def _cmd_count(self, count):
-        assert count < 0xffff
-        msb = (count >> 8) & 0xff
-        lsb = (count >> 0) & 0xff
-        await self.lower.write([CMD_COUNT, msb, lsb])
-
-    async def _cmd_write(self):
-        await self.lower.write([CMD_WRITE])
-
-    async def _data_write(self, data):
-        await self.lower.write(data)
-
-    async def _cmd_read(self):
-        await self.lower.write([CMD_READ])
-
-    async def _data_read(self, size):
-        return await self.lower.read(size)
+    def batch(self):
+        return I2CInitiatorBatch(self)
 
     async def write(self, addr, data, stop=False):
-        data = bytes(data)
-
-        if stop:
-            self._logger.log(self._level, "I2C: start addr=%s write=<%s> stop",
-                             bin(addr), data.hex())
-        else:
-            self._logger.log(self._level, "I2C: start addr=%s write=<%s>",
-                             bin(addr), data.hex())
-
-        await self._cmd_start()
-        await self._cmd_count(1 + len(data))
-        await self._cmd_write()
-        await self._data_write([(addr << 1) | 0])
-        await self._data_write(data)
-        if stop: await self._cmd_stop()
-
-        unacked, = await self._data_read(1)
-        acked = len(data) - unacked
-        if unacked == 0:
-            self._logger.log(self._level, "I2C: acked")
-        else:
-            self._logger.log(self._level, "I2C: unacked=%d", unacked)
-
-        return unacked == 0
+        async with self.batch() as batch:
+            acked = batch.write(addr, data, stop)
+        return acked.result()
 
     async def read(self, addr, size, stop=False):
-        if stop:
-            self._logger.log(self._level, "I2C: start addr=%s read=%d stop",
-                             bin(addr), size)
+        async with self.batch() as batch:
+            data = batch.read(addr, size, stop)
+        return data.result()
+
+    async def write_read(self, addr, data, size, stop=False):
+        async with self.batch() as batch:
+            acked  = batch.write(addr, data)
+            result = batch.read(addr, size, stop)
+        if acked.result():
+            return result.result()
         else:
-            self._logger.log(self._level, "I2C: start addr=%s read=%d",
-                             bin(addr), size)
-
-        await self._cmd_start()
-        await self._cmd_count(1)
-        await self._cmd_write()
-        await self._data_write([(addr << 1) | 1])
-        await self._cmd_count(size)
-        await self._cmd_read()
-        if stop: await self._cmd_stop()
-
-        unacked, = await self._data_read(1)
-        data = await self._data_read(size)
-        if unacked == 0:
-            self._logger.log(self._level, "I2C: acked data=<%s>", data.hex())
-            return data
-        else:
-            self._logger.log(self._level, "I2C: unacked")
             return None
 
     async def poll(self, addr):
-        self._logger.trace("I2C: poll addr=%s", bin(addr))
-        await self._cmd_start()
-        await self._cmd_count(1)
-        await self._cmd_write()
-        await self._data_write([(addr << 1) | 0])
-        await self._cmd_stop()
-
-        unacked, = await self._data_read(1)
-        if unacked == 0:
-            self._logger.log(self._level, "I2C: poll addr=%s acked", bin(addr))
-
-        return unacked == 0
+        async with self.batch() as batch:
+            acked = batch.poll(addr)
+        return acked.result()
 
     async def device_id(self, addr):
-        if await self.write(0b1111_100, [addr]) is False:
-            return None
-        device_id = await self.read(0b1111_100, 3)
+        device_id = await self.write_read(0b1111_100, [addr], 3)
         if device_id is None:
             return None
         manufacturer = (device_id[0] << 8) | (device_id[1] >> 4)
@@ -240,26 +189,128 @@ class I2CInitiatorInterface:
     async def scan(self, addresses=range(0b0001_000, 0b1111_000), *, read=True, write=True):
         # default address range: don't scan reserved I2C addresses
         found = set()
-        for addr in addresses:
-            # Do write scanning before read scanning to reduce the likeliness of possible
-            # side effects due to really reading 1 byte in the read scan
-            if write:
-                if await self.write(addr, [], stop=True) is True:
+        # Do write scanning before read scanning to reduce the likeliness of possible
+        # side effects due to really reading 1 byte in the read scan
+        if write:
+            async with self.batch() as batch:
+                results = [(addr, batch.write(addr, [], stop=True)) for addr in addresses]
+            for addr, acked in results:
+                if acked.result() is True:
                     self._logger.log(self._level, "I2C scan: found write address %s",
                                         f"{addr:#09b}")
                     found.add(addr)
-                    # After a successful write detection no read scan is done anymore
-                    continue
-            if read:
+        if read:
+            async with self.batch() as batch:
+                # After a successful write detection no read scan is done anymore.
                 # We need to read at least one byte in order to transmit a NAK bit
                 # so that the addressed device releases SDA.
-                if await self.read(addr, 1, stop=True) is not None:
+                results = [(addr, batch.read(addr, 1, stop=True))
+                           for addr in addresses if addr not in found]
+            for addr, data in results:
+                if data.result() is not None:
                     self._logger.log(self._level, "I2C scan: found read address %s",
                                         f"{addr:#09b}")
                     found.add(addr)
         return found
 
 
+class I2CInitiatorBatch(CommandBatch):
+    """A group of I²C transactions that the applet performs back to back, without waiting for
+    the host in between.
+
+    :meth:`write`, :meth:`read`, and :meth:`poll` each queue one transaction, starting with
+    a START condition, and return an :class:`asyncio.Future`. It resolves to the value that
+    the :class:`I2CInitiatorInterface` method with the same name would have returned: whether
+    the target acknowledged, or the data that was read (``None`` if it did not acknowledge).
+    The transactions are performed by :meth:`execute`, or when an ``async with`` block exits::
+
+        async with i2c_iface.batch() as batch:
+            acked = batch.write(0x50, [0x00])
+            data  = batch.read(0x50, 16, stop=True)
+        if acked.result() and data.result() is not None:
+            print(data.result().hex())
+
+    Every queued transaction is performed even if an earlier one was not acknowledged; above,
+    the read is attempted whether or not the write succeeded. This makes a batch suited to
+    scanning the bus, or to accessing many registers of a target that is known to be present.
+    """
+
+    def __init__(self, interface):
+        super().__init__(interface.lower)
+        self._interface = interface
+
+    def _log(self, message, *args):
+        self._interface._logger.log(self._interface._level, message, *args)
+
+    def _count(self, count):
+        assert count < 0xffff
+        self._commands += bytes([CMD_COUNT, (count >> 8) & 0xff, (count >> 0) & 0xff])
+
+    def write(self, addr, data, stop=False):
+        data = bytes(data)
+
+        if stop:
+            self._log("I2C: start addr=%s write=<%s> stop", bin(addr), data.hex())
+        else:
+            self._log("I2C: start addr=%s write=<%s>", bin(addr), data.hex())
+
+        self._commands.append(CMD_START)
+        self._count(1 + len(data))
+        self._commands.append(CMD_WRITE)
+        self._commands.append((addr << 1) | 0)
+        self._commands += data
+        if stop: self._commands.append(CMD_STOP)
+
+        def decode(response):
+            unacked, = response
+            if unacked == 0:
+                self._log("I2C: addr=%s acked", bin(addr))
+            else:
+                self._log("I2C: addr=%s unacked=%d", bin(addr), unacked)
+            return unacked == 0
+        return self._result(1, decode)
+
+    def read(self, addr, size, stop=False):
+        if stop:
+            self._log("I2C: start addr=%s read=%d stop", bin(addr), size)
+        else:
+            self._log("I2C: start addr=%s read=%d", bin(addr), size)
+
+        self._commands.append(CMD_START)
+        self._count(1)
+        self._commands.append(CMD_WRITE)
+        self._commands.append((addr << 1) | 1)
+        self._count(size)
+        self._commands.append(CMD_READ)
+        if stop: self._commands.append(CMD_STOP)
+
+        def decode(response):
+            unacked, data = response[0], bytes(response[1:])
+            if unacked == 0:
+                self._log("I2C: addr=%s acked data=<%s>", bin(addr), data.hex())
+                return data
+            else:
+                self._log("I2C: addr=%s unacked", bin(addr))
+                return None
+        return self._result(1 + size, decode)
+
+    def poll(self, addr):
+        self._interface._logger.trace("I2C: poll addr=%s", bin(addr))
+
+        self._commands.append(CMD_START)
+        self._count(1)
+        self._commands.append(CMD_WRITE)
+        self._commands.append((addr << 1) | 0)
+        self._commands.append(CMD_STOP)
+
+        def decode(response):
+            unacked, = response
+            if unacked == 0:
+                self._log("I2C: poll addr=%s acked", bin(addr))
+            return unacked == 0
+        return self._result(1, decode)
+
+
 class I2CInitiatorApplet(GlasgowApplet):
     logger = logging.getLogger(__name__)
     help = "initiate I²C transactions"
@@ -1,3 +1,8 @@
+import types
+import asyncio
+from amaranth import *
+
+from ....gateware.i2c import I2CTarget
 from ... import *
 from . import I2CInitiatorApplet
 
@@ -6,3 +11,66 @@ class I2CInitiatorAppletTestCase(GlasgowAppletTestCase, applet=I2CInitiatorApple
     @synthesis_test
     def test_build(self):
         self.assertBuilds()
+
+    def setup_i2c_target(self):
+        self.build_simulated_applet()
+        mux_iface = self.applet.mux_interface
+
+        m = Module()
+        target_pads = types.SimpleNamespace(
+            scl_t=types.SimpleNamespace(i=Signal(), o=Signal(), oe=Signal()),
+            sda_t=types.SimpleNamespace(i=Signal(), o=Signal(), oe=Signal()),
+        )
+        m.submodules.target = target = I2CTarget(target_pads)
+        for pin in ("scl_t", "sda_t"):
+            initiator_pad = getattr(mux_iface.pads, pin)
+            target_pad    = getattr(target_pads, pin)
+            bus = ~initiator_pad.oe & ~target_pad.oe # open drain with a pull-up
+            m.d.comb += [
+                initiator_pad.i.eq(bus),
+                target_pad.i.eq(bus),
+            ]
+        data = Signal(8, init=0xa5)
+        m.d.comb += [
+            target.address.eq(0x50),
+            target.ack_o.eq(target.write & (target.data_i != 0xff)),
+            target.data_o.eq(data),
+        ]
+        with m.If(target.write):
+            m.d.sync += data.eq(target.data_i)
+        self.target.add_submodule(m)
+
+    @applet_simulation_test("setup_i2c_target", ["--bit-rate", "1000"])
+    @types.coroutine
+    def test_scan(self):
+        i2c_iface = yield from self.run_simulated_applet()
+
+        result = yield from i2c_iface.scan(range(0x4e, 0x53))
+        self.assertEqual(result, {0x50})
+
+    @applet_simulation_test("setup_i2c_target", ["--bit-rate", "1000"])
+    @types.coroutine
+    def test_batch(self):
+        i2c_iface = yield from self.run_simulated_applet()
+
+        batch = i2c_iface.batch()
+        acked_1 = batch.write(0x50, [0x12])
+        data_1  = batch.read(0x50, 2)
+        acked_2 = batch.write(0x51, [0x34, 0x56], stop=True)
+        acked_3 = batch.write(0x50, [0xff, 0x78], stop=True) # unacked data byte
+        data_2  = batch.read(0x50, 1, stop=True)
+        polled  = batch.poll(0x50)
+        with self.assertRaises(asyncio.InvalidStateError):
+            acked_1.result()
+        yield from batch.execute()
+        self.assertTrue(acked_1.result())
+        self.assertEqual(data_1.result(), b"\x12\x12")
+        self.assertFalse(acked_2.result())
+        self.assertFalse(acked_3.result())
+        self.assertEqual(data_2.result(), b"\xff")
+        self.assertTrue(polled.result())
+
+        result = yield from i2c_iface.write_read(0x50, [0x9a], 1, stop=True)
+        self.assertEqual(result, b"\x9a")
+        result = yield from i2c_iface.write_read(0x51, [0x9a], 1, stop=True)
+        self.assertIsNone(result)
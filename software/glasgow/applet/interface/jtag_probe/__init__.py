@@ -23,6 +23,7 @@ import struct
 import logging
 import argparse
 import enum
+import asyncio
 from amaranth import *
 from amaranth.lib import io, cdc
 
@@ -158,9 +159,11 @@ class JTAGProbeAdapter(Elaboratable):
 CMD_MASK       = 0b11110000
 CMD_SHIFT_TMS  = 0b00000000
 CMD_SHIFT_TDIO = 0b00010000
+CMD_SHIFT_CMP  = 0b00100000
 CMD_GET_AUX    = 0b10000000
 CMD_SET_AUX    = 0b10010000
-# CMD_SHIFT_{TMS,TDIO}
+CMD_GET_CMP    = 0b10100000
+# CMD_SHIFT_{TMS,TDIO,CMP}
 BIT_DATA_OUT   =     0b0001
 BIT_DATA_IN    =     0b0010
 BIT_LAST       =     0b0100
@@ -183,6 +186,22 @@ class JTAGProbeDriver(Elaboratable):
         shreg_o = Signal(8)
         shreg_i = Signal(8)
 
+        # CMD_SHIFT_CMP compares each byte of captured TDO data with an expected value under
+        # a mask, and records the offset of the first mismatching bit, counting from the last
+        # CMD_GET_CMP command, which returns the sticky failure flag and the offset.
+        cmp_data   = Signal(8)
+        cmp_size   = Signal(4)
+        cmp_expect = Signal(8)
+        cmp_diff   = Signal(8)
+        cmp_first  = Signal(3)
+        cmp_fail   = Signal()
+        cmp_offset = Signal(32)
+        cmp_result = Signal(32)
+        cmp_index  = Signal(range(5))
+        for bit in reversed(range(8)):
+            with m.If(cmp_diff[bit]):
+                m.d.comb += cmp_first.eq(bit)
+
         with m.FSM() as fsm:
             with m.State("RECV-COMMAND"):
                 m.d.comb += self._in_fifo.flush.eq(1)
@@ -193,12 +212,32 @@ class JTAGProbeDriver(Elaboratable):
 
             with m.State("COMMAND"):
                 with m.If(((cmd & CMD_MASK) == CMD_SHIFT_TMS) |
-                    ((cmd & CMD_MASK) == CMD_SHIFT_TDIO)):
+                    ((cmd & CMD_MASK) == CMD_SHIFT_TDIO) |
+                    ((cmd & CMD_MASK) == CMD_SHIFT_CMP)):
                     m.next = "RECV-COUNT-1"
                 with m.Elif((cmd & CMD_MASK) == CMD_GET_AUX):
                     m.next = "SEND-AUX"
                 with m.Elif((cmd & CMD_MASK) == CMD_SET_AUX):
                     m.next = "RECV-AUX"
+                with m.Elif((cmd & CMD_MASK) == CMD_GET_CMP):
+                    m.d.sync += cmp_index.eq(0)
+                    m.next = "SEND-CMP"
+
+            with m.State("SEND-CMP"):
+                with m.If(cmp_index == 5):
+                    m.d.sync += [
+                        cmp_fail.eq(0),
+                        cmp_offset.eq(0),
+                    ]
+                    m.next = "RECV-COMMAND"
+                with m.Elif(self._in_fifo.w_rdy):
+                    m.d.comb += self._in_fifo.w_en.eq(1)
+                    with m.If(cmp_index == 0):
+                        m.d.comb += self._in_fifo.w_data.eq(cmp_fail)
+                    with m.Else():
+                        m.d.comb += self._in_fifo.w_data.eq(cmp_result[0:8])
+                        m.d.sync += cmp_result.eq(cmp_result >> 8)
+                    m.d.sync += cmp_index.eq(cmp_index + 1)
 
             with m.State("SEND-AUX"):
                 with m.If(self._in_fifo.w_rdy):
@@ -273,7 +312,19 @@ class JTAGProbeDriver(Elaboratable):
                         m.next = "SHIFT-SETUP"
 
             with m.State("SEND-BITS"):
-                with m.If(cmd & BIT_DATA_IN):
+                with m.If((cmd & CMD_MASK) == CMD_SHIFT_CMP):
+                    with m.If(count == 0):
+                        m.d.sync += [
+                            cmp_data.eq(shreg_i >> align),
+                            cmp_size.eq(8 - align),
+                        ]
+                    with m.Else():
+                        m.d.sync += [
+                            cmp_data.eq(shreg_i),
+                            cmp_size.eq(8),
+                        ]
+                    m.next = "RECV-EXPECT"
+                with m.Elif(cmd & BIT_DATA_IN):
                     with m.If(self._in_fifo.w_rdy):
                         m.d.comb += self._in_fifo.w_en.eq(1),
                         with m.If(count == 0):
@@ -284,6 +335,26 @@ class JTAGProbeDriver(Elaboratable):
                 with m.Else():
                     m.next = "RECV-BITS"
 
+            with m.State("RECV-EXPECT"):
+                with m.If(self._out_fifo.r_rdy):
+                    m.d.comb += self._out_fifo.r_en.eq(1)
+                    m.d.sync += cmp_expect.eq(self._out_fifo.r_data)
+                    m.next = "RECV-MASK"
+
+            with m.State("RECV-MASK"):
+                with m.If(self._out_fifo.r_rdy):
+                    m.d.comb += [
+                        self._out_fifo.r_en.eq(1),
+                        cmp_diff.eq((cmp_data ^ cmp_expect) & self._out_fifo.r_data),
+                    ]
+                    with m.If((cmp_diff != 0) & ~cmp_fail):
+                        m.d.sync += [
+                            cmp_fail.eq(1),
+                            cmp_result.eq(cmp_offset + cmp_first),
+                        ]
+                    m.d.sync += cmp_offset.eq(cmp_offset + cmp_size)
+                    m.next = "RECV-BITS"
+
         return m
 
 
@@ -313,6 +384,34 @@ class JTAGProbeStateTransitionError(JTAGProbeError):
         self.new_state = new_state
 
 
+class _JTAGProbeCommandBuffer:
+    # Coalesces the many small writes performed for each operation into larger ones. Useful if
+    # many operations are performed without waiting for any replies, e.g. if TDO data is compared
+    # by the probe.
+    def __init__(self, lower, size):
+        self.lower   = lower
+        self._size   = size
+        self._buffer = bytearray()
+
+    async def _drain(self):
+        if self._buffer:
+            buffer, self._buffer = self._buffer, bytearray()
+            await self.lower.write(buffer)
+
+    async def write(self, data):
+        self._buffer += data
+        if len(self._buffer) >= self._size:
+            await self._drain()
+
+    async def read(self, length=None, *, flush=True):
+        await self._drain()
+        return await self.lower.read(length, flush=flush)
+
+    async def flush(self, wait=True):
+        await self._drain()
+        await self.lower.flush(wait)
+
+
 class JTAGProbeInterface:
     scan_ir_max_length = 128
     scan_dr_max_length = 1024
@@ -325,6 +424,7 @@ class JTAGProbeInterface:
         self.has_trst    = has_trst
         self._state      = JTAGState.UNKNOWN
         self._current_ir = None
+        self._deferred   = []
 
     def _log_l(self, message, *args):
         self._logger.log(self._level, "JTAG-L: " + message, *args)
@@ -333,17 +433,76 @@ class JTAGProbeInterface:
         self._logger.log(self._level, "JTAG-H: " + message, *args)
 
     # Low-level operations
+    #
+    # Operations that capture TDO data accept a `defer=` argument. If it is true, the operation
+    # is only queued, and an `asyncio.Future` is returned instead of the data. The TDO data of
+    # all queued operations is received at once, either on the next `flush()` call, or right
+    # before the next operation that is not deferred receives any data. This allows many
+    # operations to be performed with a single USB round trip.
 
     async def flush(self):
         self._log_l("flush")
+        await self._receive_deferred()
         await self.lower.flush()
 
+    @staticmethod
+    def _tdo_size(counts):
+        return sum((count + 7) // 8 for count in counts)
+
+    @staticmethod
+    def _tdo_bits(tdo_bytes, counts):
+        tdo_bits = bits()
+        offset = 0
+        for count in counts:
+            tdo_bits += bits(tdo_bytes[offset:offset + (count + 7) // 8], count)
+            offset += (count + 7) // 8
+        return tdo_bits
+
+    async def _receive_deferred(self):
+        if not self._deferred:
+            return
+        deferred, self._deferred = self._deferred, []
+        self._log_l("receive deferred count=%d", len(deferred))
+        try:
+            tdo_bytes = await self.lower.read(sum(self._tdo_size(counts)
+                                                  for counts, *_ in deferred))
+        except BaseException as exc:
+            for _counts, _complete, future in deferred:
+                future.set_exception(exc)
+            raise
+        offset = 0
+        for counts, complete, future in deferred:
+            size = self._tdo_size(counts)
+            future.set_result(complete(self._tdo_bits(tdo_bytes[offset:offset + size], counts)))
+            offset += size
+
+    async def _receive_tdo(self, counts, complete, *, defer):
+        # `counts` is the length of every chunk of TDO data sent by the probe for an operation.
+        # `complete` is called with the TDO data once it is received, and returns the result.
+        if defer:
+            future = asyncio.Future()
+            self._deferred.append((counts, complete, future))
+            return future
+        await self._receive_deferred()
+        if self._tdo_size(counts) == 0:
+            return complete(bits())
+        return complete(self._tdo_bits(await self.lower.read(self._tdo_size(counts)), counts))
+
+    @staticmethod
+    def _then(result, callback):
+        # Call `callback` with the result of an operation once it is available.
+        if isinstance(result, asyncio.Future):
+            result.add_done_callback(lambda future: callback(future.result()))
+        else:
+            callback(result)
+
     async def set_aux(self, value):
         self._log_l("set aux=%s", format(value, "08b"))
         await self.lower.write(struct.pack("<BB",
             CMD_SET_AUX, value))
 
     async def get_aux(self):
+        await self._receive_deferred()
         await self.lower.write(struct.pack("<B",
             CMD_GET_AUX))
         value, = await self.lower.read(1)
@@ -365,7 +524,7 @@ class JTAGProbeInterface:
         self._log_l("shift tms=<%s>", dump_bin(tms_bits))
         await self.lower.write(struct.pack("<BH",
             CMD_SHIFT_TMS|BIT_DATA_OUT|(BIT_TDI if tdi else 0), len(tms_bits)))
-        await self.lower.write(tms_bits)
+        await self.lower.write(bytes(tms_bits))
 
     def _shift_last(self, last):
         if last:
@@ -397,10 +556,10 @@ class JTAGProbeInterface:
             await self.lower.write(struct.pack("<BH",
                 CMD_SHIFT_TDIO|(BIT_LAST if chunk_last else 0), count))
 
-    async def shift_tdio(self, tdi_bits, *, prefix=0, suffix=0, last=True):
+    async def shift_tdio(self, tdi_bits, *, prefix=0, suffix=0, last=True, defer=False):
         assert self._state in (JTAGState.IRSHIFT, JTAGState.DRSHIFT)
         tdi_bits = bits(tdi_bits)
-        tdo_bits = bits()
+        counts   = []
         self._log_l("shift tdio-i=%d,<%s>,%d", prefix, dump_bin(tdi_bits), suffix)
         await self._shift_dummy(prefix)
         for tdi_bits, chunk_last in self._chunk_bits(tdi_bits, last and suffix == 0):
@@ -409,12 +568,14 @@ class JTAGProbeInterface:
                 len(tdi_bits)))
             tdi_bytes = bytes(tdi_bits)
             await self.lower.write(tdi_bytes)
-            tdo_bytes = await self.lower.read(len(tdi_bytes))
-            tdo_bits += bits(tdo_bytes, len(tdi_bits))
+            counts.append(len(tdi_bits))
         await self._shift_dummy(suffix, last)
-        self._log_l("shift tdio-o=%d,<%s>,%d", prefix, dump_bin(tdo_bits), suffix)
         self._shift_last(last)
-        return tdo_bits
+
+        def complete(tdo_bits):
+            self._log_l("shift tdio-o=%d,<%s>,%d", prefix, dump_bin(tdo_bits), suffix)
+            return tdo_bits
+        return await self._receive_tdo(counts, complete, defer=defer)
 
     async def shift_tdi(self, tdi_bits, *, prefix=0, suffix=0, last=True):
         assert self._state in (JTAGState.IRSHIFT, JTAGState.DRSHIFT)
@@ -430,20 +591,67 @@ class JTAGProbeInterface:
         await self._shift_dummy(suffix, last)
         self._shift_last(last)
 
-    async def shift_tdo(self, count, *, prefix=0, suffix=0, last=True):
+    async def shift_tdo(self, count, *, prefix=0, suffix=0, last=True, defer=False):
         assert self._state in (JTAGState.IRSHIFT, JTAGState.DRSHIFT)
-        tdo_bits = bits()
+        counts = []
         await self._shift_dummy(prefix)
         for count, chunk_last in self._chunk_count(count, last and suffix == 0):
             await self.lower.write(struct.pack("<BH",
                 CMD_SHIFT_TDIO|BIT_DATA_IN|(BIT_LAST if chunk_last else 0),
                 count))
-            tdo_bytes = await self.lower.read((count + 7) // 8)
-            tdo_bits += bits(tdo_bytes, count)
+            counts.append(count)
+        await self._shift_dummy(suffix, last)
+        self._shift_last(last)
+
+        def complete(tdo_bits):
+            self._log_l("shift tdo=%d,<%s>,%d", prefix, dump_bin(tdo_bits), suffix)
+            return tdo_bits
+        return await self._receive_tdo(counts, complete, defer=defer)
+
+    # Instead of capturing TDO data, `shift_compare` has the probe compare it against `tdo_bits`
+    # under `mask_bits`. The probe remembers whether any of the comparisons failed, and
+    # `get_compare` returns the offset of the first mismatching bit (counting only compared bits)
+    # or `None`, and restarts the comparison.
+
+    async def shift_compare(self, tdi_bits, tdo_bits, mask_bits, *, prefix=0, suffix=0,
+                            last=True):
+        assert self._state in (JTAGState.IRSHIFT, JTAGState.DRSHIFT)
+        tdi_bits  = bits(tdi_bits)
+        tdo_bits  = bits(tdo_bits)
+        mask_bits = bits(mask_bits)
+        assert len(tdi_bits) == len(tdo_bits) == len(mask_bits)
+        self._log_l("shift compare tdi=%d,<%s>,%d tdo=<%s> mask=<%s>", prefix,
+                    dump_bin(tdi_bits), suffix, dump_bin(tdo_bits), dump_bin(mask_bits))
+        await self._shift_dummy(prefix)
+        offset = 0
+        for tdi_bits_chunk, chunk_last in self._chunk_bits(tdi_bits, last and suffix == 0):
+            count = len(tdi_bits_chunk)
+            await self.lower.write(struct.pack("<BH",
+                CMD_SHIFT_CMP|BIT_DATA_OUT|(BIT_LAST if chunk_last else 0),
+                count))
+            tdi_bytes = bytes(tdi_bits_chunk)
+            chunk_bytes = bytearray(len(tdi_bytes) * 3)
+            chunk_bytes[0::3] = tdi_bytes
+            chunk_bytes[1::3] = bytes(tdo_bits[offset:offset + count])
+            chunk_bytes[2::3] = bytes(mask_bits[offset:offset + count])
+            await self.lower.write(chunk_bytes)
+            offset += count
         await self._shift_dummy(suffix, last)
-        self._log_l("shift tdo=%d,<%s>,%d", prefix, dump_bin(tdo_bits), suffix)
         self._shift_last(last)
-        return tdo_bits
+
+    async def get_compare(self, *, defer=False):
+        await self.lower.write(struct.pack("<B",
+            CMD_GET_CMP))
+
+        def complete(result_bits):
+            failed, offset = struct.unpack("<BL", bytes(result_bits))
+            if failed:
+                self._log_l("get compare fail offset=%d", offset)
+                return offset
+            else:
+                self._log_l("get compare pass")
+                return None
+        return await self._receive_tdo([40], complete, defer=defer)
 
     async def pulse_tck(self, count):
         assert self._state in (JTAGState.IDLE, JTAGState.IRPAUSE, JTAGState.DRPAUSE)
@@ -638,30 +846,32 @@ class JTAGProbeInterface:
         await self.enter_run_test_idle()
         await self.pulse_tck(count)
 
-    async def exchange_ir(self, data, *, prefix=0, suffix=0):
+    async def exchange_ir(self, data, *, prefix=0, suffix=0, defer=False):
         data = bits(data)
         self._current_ir = (prefix, data, suffix)
         self._log_h("exchange ir-i=%d,<%s>,%d", prefix, dump_bin(data), suffix)
         if not data:
             await self.enter_capture_ir()
-            data = bits()
+            data = await self._receive_tdo([], lambda data: data, defer=defer)
         else:
             await self.enter_shift_ir()
-            data = await self.shift_tdio(data, prefix=prefix, suffix=suffix)
+            data = await self.shift_tdio(data, prefix=prefix, suffix=suffix, defer=defer)
         await self.enter_update_ir()
-        self._log_h("exchange ir-o=%d,<%s>,%d", prefix, dump_bin(data), suffix)
+        self._then(data, lambda data:
+            self._log_h("exchange ir-o=%d,<%s>,%d", prefix, dump_bin(data), suffix))
         return data
 
-    async def read_ir(self, count, *, prefix=0, suffix=0):
+    async def read_ir(self, count, *, prefix=0, suffix=0, defer=False):
         self._current_ir = (prefix, bits((1,)) * count, suffix)
         if not count:
             await self.enter_capture_ir()
-            data = bits()
+            data = await self._receive_tdo([], lambda data: data, defer=defer)
         else:
             await self.enter_shift_ir()
-            data = await self.shift_tdo(count, prefix=prefix, suffix=suffix)
+            data = await self.shift_tdo(count, prefix=prefix, suffix=suffix, defer=defer)
         await self.enter_update_ir()
-        self._log_h("read ir=%d,<%s>,%d", prefix, dump_bin(data), suffix)
+        self._then(data, lambda data:
+            self._log_h("read ir=%d,<%s>,%d", prefix, dump_bin(data), suffix))
         return data
 
     async def write_ir(self, data, *, prefix=0, suffix=0, elide=True):
@@ -678,27 +888,29 @@ class JTAGProbeInterface:
             await self.shift_tdi(data, prefix=prefix, suffix=suffix)
         await self.enter_update_ir()
 
-    async def exchange_dr(self, data, *, prefix=0, suffix=0):
+    async def exchange_dr(self, data, *, prefix=0, suffix=0, defer=False):
         self._log_h("exchange dr-i=%d,<%s>,%d", prefix, dump_bin(data), suffix)
         if not data:
             await self.enter_capture_dr()
-            data = bits()
+            data = await self._receive_tdo([], lambda data: data, defer=defer)
         else:
             await self.enter_shift_dr()
-            data = await self.shift_tdio(data, prefix=prefix, suffix=suffix)
+            data = await self.shift_tdio(data, prefix=prefix, suffix=suffix, defer=defer)
         await self.enter_update_dr()
-        self._log_h("exchange dr-o=%d,<%s>,%d", prefix, dump_bin(data), suffix)
+        self._then(data, lambda data:
+            self._log_h("exchange dr-o=%d,<%s>,%d", prefix, dump_bin(data), suffix))
         return data
 
-    async def read_dr(self, count, *, prefix=0, suffix=0):
+    async def read_dr(self, count, *, prefix=0, suffix=0, defer=False):
         if not count:
             await self.enter_capture_dr()
-            data = bits()
+            data = await self._receive_tdo([], lambda data: data, defer=defer)
         else:
             await self.enter_shift_dr()
-            data = await self.shift_tdo(count, prefix=prefix, suffix=suffix)
+            data = await self.shift_tdo(count, prefix=prefix, suffix=suffix, defer=defer)
         await self.enter_update_dr()
-        self._log_h("read dr=%d,<%s>,%d", prefix, dump_bin(data), suffix)
+        self._then(data, lambda data:
+            self._log_h("read dr=%d,<%s>,%d", prefix, dump_bin(data), suffix))
         return data
 
     async def write_dr(self, data, *, prefix=0, suffix=0):
@@ -711,6 +923,25 @@ class JTAGProbeInterface:
             await self.shift_tdi(data, prefix=prefix, suffix=suffix)
         await self.enter_update_dr()
 
+    async def compare_ir(self, data, tdo, mask, *, prefix=0, suffix=0):
+        data = bits(data)
+        assert len(data) > 0
+        self._current_ir = (prefix, data, suffix)
+        self._log_h("compare ir=%d,<%s>,%d tdo=<%s> mask=<%s>",
+                    prefix, dump_bin(data), suffix, dump_bin(tdo), dump_bin(mask))
+        await self.enter_shift_ir()
+        await self.shift_compare(data, tdo, mask, prefix=prefix, suffix=suffix)
+        await self.enter_update_ir()
+
+    async def compare_dr(self, data, tdo, mask, *, prefix=0, suffix=0):
+        data = bits(data)
+        assert len(data) > 0
+        self._log_h("compare dr=%d,<%s>,%d tdo=<%s> mask=<%s>",
+                    prefix, dump_bin(data), suffix, dump_bin(tdo), dump_bin(mask))
+        await self.enter_shift_dr()
+        await self.shift_compare(data, tdo, mask, prefix=prefix, suffix=suffix)
+        await self.enter_update_dr()
+
     # Shift chain introspection
 
     async def _scan_xr(self, xr, *, max_length=None, check=True, idempotent=True):
@@ -936,20 +1167,23 @@ class TAPInterface:
     async def flush(self):
         await self.lower.flush()
 
+    async def get_compare(self, *, defer=False):
+        return await self.lower.get_compare(defer=defer)
+
     async def test_reset(self):
         await self.lower.test_reset()
 
     async def run_test_idle(self, count):
         await self.lower.run_test_idle(count)
 
-    async def exchange_ir(self, data):
+    async def exchange_ir(self, data, *, defer=False):
         data = bits(data)
         assert len(data) == self.ir_length
-        return await self.lower.exchange_ir(data,
+        return await self.lower.exchange_ir(data, defer=defer,
             prefix=self._ir_prefix, suffix=self._ir_suffix)
 
-    async def read_ir(self):
-        return await self.lower.read_ir(self.ir_length,
+    async def read_ir(self, *, defer=False):
+        return await self.lower.read_ir(self.ir_length, defer=defer,
             prefix=self._ir_prefix, suffix=self._ir_suffix)
 
     async def write_ir(self, data, *, elide=True):
@@ -958,18 +1192,28 @@ class TAPInterface:
         await self.lower.write_ir(data, elide=elide,
             prefix=self._ir_prefix, suffix=self._ir_suffix)
 
-    async def exchange_dr(self, data):
-        return await self.lower.exchange_dr(data,
+    async def exchange_dr(self, data, *, defer=False):
+        return await self.lower.exchange_dr(data, defer=defer,
             prefix=self._dr_prefix, suffix=self._dr_suffix)
 
-    async def read_dr(self, length):
-        return await self.lower.read_dr(length,
+    async def read_dr(self, length, *, defer=False):
+        return await self.lower.read_dr(length, defer=defer,
             prefix=self._dr_prefix, suffix=self._dr_suffix)
 
     async def write_dr(self, data):
         await self.lower.write_dr(data,
             prefix=self._dr_prefix, suffix=self._dr_suffix)
 
+    async def compare_ir(self, data, tdo, mask):
+        data = bits(data)
+        assert len(data) == self.ir_length
+        await self.lower.compare_ir(data, tdo, mask,
+            prefix=self._ir_prefix, suffix=self._ir_suffix)
+
+    async def compare_dr(self, data, tdo, mask):
+        await self.lower.compare_dr(data, tdo, mask,
+            prefix=self._dr_prefix, suffix=self._dr_suffix)
+
     async def scan_dr(self, *, check=True, max_length=None):
         if max_length is not None:
             max_length = self._dr_prefix + max_length + self._dr_suffix
@@ -1059,8 +1303,12 @@ class JTAGProbeApplet(GlasgowApplet):
             "--ir-lengths", metavar="IR-LENGTH,...", default=None, type=ir_lengths,
             help="set IR lengths of each TAP to corresponding IR-LENGTH (default: autodetect)")
 
-    async def run(self, device, args):
+    async def run(self, device, args, *, buffer_size=None):
+        # If `buffer_size` is specified, writes to the probe are coalesced until that many bytes
+        # are buffered, or until the probe is flushed or any data is read back.
         iface = await device.demultiplexer.claim_interface(self, self.mux_interface, args)
+        if buffer_size is not None:
+            iface = _JTAGProbeCommandBuffer(iface, buffer_size)
         jtag_iface = JTAGProbeInterface(iface, self.logger, has_trst=args.pin_trst is not None)
         jtag_iface.scan_ir_max_length = args.scan_ir_max_length
         jtag_iface.scan_dr_max_length = args.scan_dr_max_length
@@ -1,8 +1,14 @@
+import types
+import asyncio
 import unittest
+from amaranth import *
+from amaranth.lib.fifo import SyncFIFOBuffered
 
 from ....support.bits import *
+from ....gateware import simulation_test
 from ... import *
-from . import JTAGProbeApplet, JTAGProbeInterface, JTAGProbeError
+from . import JTAGProbeApplet, JTAGProbeDriver, JTAGProbeInterface, JTAGProbeError
+from . import _JTAGProbeCommandBuffer
 
 
 class JTAGInterrogationTestCase(unittest.TestCase):
@@ -125,6 +131,199 @@ class JTAGInterrogationTestCase(unittest.TestCase):
                          [3, 5])
 
 
+class _FakeFIFO:
+    # Returns TDO data from a predefined byte stream, and records the size of every read.
+    def __init__(self, tdo_bytes):
+        self.tdo_bytes = bytearray(tdo_bytes)
+        self.reads     = []
+
+    async def write(self, data):
+        pass
+
+    async def read(self, length):
+        self.reads.append(length)
+        data, self.tdo_bytes = self.tdo_bytes[:length], self.tdo_bytes[length:]
+        assert len(data) == length
+        return memoryview(data)
+
+    async def flush(self):
+        pass
+
+
+class JTAGDeferredTestCase(unittest.TestCase):
+    @async_test
+    async def test_immediate(self):
+        lower = _FakeFIFO(b"\x05\x12\x03")
+        iface = JTAGProbeInterface(interface=lower, logger=JTAGProbeApplet.logger)
+        await iface.test_reset()
+        self.assertEqual(await iface.exchange_dr(bits("0000")), bits("0101"))
+        self.assertEqual(await iface.read_ir(10), bits("1100010010"))
+        self.assertEqual(lower.reads, [1, 2])
+
+    @async_test
+    async def test_deferred(self):
+        lower = _FakeFIFO(b"\x05\x12\x03\xaa")
+        iface = JTAGProbeInterface(interface=lower, logger=JTAGProbeApplet.logger)
+        await iface.test_reset()
+        result_1 = await iface.exchange_dr(bits("0000"), defer=True)
+        result_2 = await iface.read_dr(0, defer=True)
+        result_3 = await iface.read_ir(10, defer=True)
+        self.assertFalse(result_1.done())
+        with self.assertRaises(asyncio.InvalidStateError):
+            result_1.result()
+        self.assertEqual(lower.reads, [])
+        await iface.flush()
+        self.assertEqual(lower.reads, [3])
+        self.assertEqual(result_1.result(), bits("0101"))
+        self.assertEqual(result_2.result(), bits())
+        self.assertEqual(result_3.result(), bits("1100010010"))
+
+        result_4 = await iface.read_dr(8, defer=True)
+        self.assertEqual(await iface.read_dr(0), bits())
+        self.assertEqual(result_4.result(), bits("10101010"))
+        self.assertEqual(lower.reads, [3, 1])
+
+    @async_test
+    async def test_deferred_failed(self):
+        lower = _FakeFIFO(b"")
+        async def read(length):
+            raise OSError("device disconnected")
+        lower.read = read
+        iface = JTAGProbeInterface(interface=lower, logger=JTAGProbeApplet.logger)
+        await iface.test_reset()
+        result = await iface.read_dr(8, defer=True)
+        with self.assertRaisesRegex(OSError, r"^device disconnected$"):
+            await iface.flush()
+        with self.assertRaisesRegex(OSError, r"^device disconnected$"):
+            result.result()
+
+
+class _RecordingFIFO:
+    # Records every write, read, and flush.
+    def __init__(self):
+        self.operations = []
+
+    async def write(self, data):
+        self.operations.append(("write", bytes(data)))
+
+    async def read(self, length=None, *, flush=True):
+        self.operations.append(("read", length, flush))
+        return bytes(length)
+
+    async def flush(self, wait=True):
+        self.operations.append(("flush", wait))
+
+
+class JTAGProbeCommandBufferTestCase(unittest.TestCase):
+    @async_test
+    async def test_write(self):
+        lower = _RecordingFIFO()
+        buffer = _JTAGProbeCommandBuffer(lower, size=4)
+        await buffer.write(b"ab")
+        await buffer.write(b"c")
+        self.assertEqual(lower.operations, [])
+        await buffer.write(b"de")
+        self.assertEqual(lower.operations, [("write", b"abcde")])
+
+    @async_test
+    async def test_read(self):
+        lower = _RecordingFIFO()
+        buffer = _JTAGProbeCommandBuffer(lower, size=65536)
+        await buffer.write(b"ab")
+        self.assertEqual(await buffer.read(2, flush=False), b"\x00\x00")
+        await buffer.read(1)
+        self.assertEqual(lower.operations, [
+            ("write", b"ab"), ("read", 2, False), ("read", 1, True),
+        ])
+
+    @async_test
+    async def test_flush(self):
+        lower = _RecordingFIFO()
+        buffer = _JTAGProbeCommandBuffer(lower, size=65536)
+        await buffer.write(b"ab")
+        await buffer.flush(wait=False)
+        self.assertEqual(lower.operations, [("write", b"ab"), ("flush", False)])
+
+
+class _JTAGProbeDriverTestbench(Elaboratable):
+    # Connects the driver to an adapter that loops TDI back to TDO.
+    def __init__(self):
+        self.out_fifo = SyncFIFOBuffered(width=8, depth=16)
+        self.in_fifo  = SyncFIFOBuffered(width=8, depth=16)
+        self.adapter  = types.SimpleNamespace(
+            stb=Signal(), rdy=Signal(init=1), tms=Signal(), tdi=Signal(), tdo=Signal(),
+            aux_i=C(0), aux_o=Signal(8))
+        self.dut      = JTAGProbeDriver(self.adapter, self.out_fifo, types.SimpleNamespace(
+            w_data=self.in_fifo.w_data, w_en=self.in_fifo.w_en, w_rdy=self.in_fifo.w_rdy,
+            flush=Signal()))
+
+    def elaborate(self, platform):
+        m = Module()
+        m.submodules.out_fifo = self.out_fifo
+        m.submodules.in_fifo  = self.in_fifo
+        m.submodules.dut      = self.dut
+        m.d.comb += self.adapter.tdo.eq(self.adapter.tdi)
+        return m
+
+
+class JTAGProbeDriverTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tb = _JTAGProbeDriverTestbench()
+
+    def transfer(self, tb, out_data):
+        out_data = bytearray(out_data)
+        in_data  = bytearray()
+        idle     = 0
+        while out_data or idle < 1000:
+            idle += 1
+            if out_data and (yield tb.out_fifo.w_rdy):
+                yield tb.out_fifo.w_data.eq(out_data.pop(0))
+                yield tb.out_fifo.w_en.eq(1)
+            if (yield tb.in_fifo.r_rdy):
+                in_data.append((yield tb.in_fifo.r_data))
+                yield tb.in_fifo.r_en.eq(1)
+                idle = 0
+            yield
+            yield tb.out_fifo.w_en.eq(0)
+            yield tb.in_fifo.r_en.eq(0)
+            yield
+        return in_data
+
+    @simulation_test
+    def test_compare(self, tb):
+        lower = _FakeFIFO(b"")
+        lower.written = bytearray()
+        async def write(data):
+            lower.written += bytes(data)
+        lower.write = write
+        iface = JTAGProbeInterface(interface=lower, logger=JTAGProbeApplet.logger)
+
+        async def queue():
+            await iface.test_reset()
+            results = []
+            tdi = bits("1100101011110000111")
+            await iface.compare_dr(tdi, tdi, bits("1" * 19))
+            results.append(await iface.get_compare(defer=True))
+            await iface.compare_dr(tdi, ~tdi, bits("0" * 19))
+            results.append(await iface.get_compare(defer=True))
+            await iface.compare_dr(tdi, tdi ^ bits("0000100000000000000"), bits("1" * 19))
+            await iface.compare_ir(tdi, tdi ^ bits("1000000000000000000"), bits("1" * 19))
+            results.append(await iface.get_compare(defer=True))
+            await iface.compare_ir(tdi, tdi ^ bits("0000000000000000001"), bits("1" * 19),
+                                   prefix=3, suffix=2)
+            results.append(await iface.get_compare(defer=True))
+            return results
+        # the results are resolved by the same event loop that queued them
+        loop = asyncio.new_event_loop()
+        try:
+            results = loop.run_until_complete(queue())
+            lower.tdo_bytes = yield from self.transfer(tb, lower.written)
+            loop.run_until_complete(iface.flush())
+        finally:
+            loop.close()
+        self.assertEqual([result.result() for result in results], [None, None, 14, 0])
+
+
 class JTAGProbeAppletTestCase(GlasgowAppletTestCase, applet=JTAGProbeApplet):
     @synthesis_test
     def test_build(self):
@@ -3,6 +3,8 @@
 # Ref: http://www.jtagtest.com/pdf/svf_specification.pdf
 # Accession: G00023
 
+import mmap
+import contextlib
 import struct
 import logging
 import argparse
@@ -19,6 +21,14 @@ class SVFError(GlasgowAppletError):
     pass
 
 
+# Number of SIR/SDR commands with TDO checks that are verified together.
+_max_pending_compares = 256
+# Number of verification results that are retrieved together.
+_max_pending_checks   = 16
+# Size of the command buffer that is accumulated before being written to the probe.
+_command_buffer_size  = 65536
+
+
 class SVFOperation:
     def __init__(self, tdi=bits(), smask=bits(), tdo=None, mask=bits()):
         self.tdi   = tdi
@@ -29,6 +39,14 @@ class SVFOperation:
     def __add__(self, other):
         assert isinstance(other, SVFOperation)
 
+        # HIR/TIR/HDR/TDR are usually empty.
+        if not other.tdi:
+            if other.tdo is None or self.tdo is not None:
+                return self
+        elif not self.tdi:
+            if self.tdo is None or other.tdo is not None:
+                return other
+
         if self.tdo is None and other.tdo is None:
             # Propagate "TDO don't care".
             tdo = None
@@ -44,11 +62,12 @@ class SVFOperation:
 
 
 class SVFInterface(SVFEventHandler):
-    def __init__(self, interface, logger, frequency):
+    def __init__(self, interface, logger, frequency, *, deferred_verify=False):
         self.lower   = interface
         self._logger = logger
         self._level  = logging.DEBUG if self._logger.name == __name__ else logging.TRACE
         self._frequency = frequency
+        self._deferred_verify = deferred_verify
 
         self._endir  = "IDLE"
         self._enddr  = "IDLE"
@@ -58,9 +77,59 @@ class SVFInterface(SVFEventHandler):
         self._hdr    = SVFOperation()
         self._tdr    = SVFOperation()
 
+        # TDO data is compared by the probe. A verification point, which requests the result of
+        # the comparison, is queued every so often, and the results of several of them are only
+        # retrieved together, since doing so requires a round trip. Unless `deferred_verify` is
+        # true, the results are also retrieved before any command other than a TDO check, so
+        # that a failed check stops the test vector before e.g. an erase or program command runs.
+        # The SVF line of each command is kept to report any failures.
+        self.line      = None
+        self._compares = []
+        self._compare_offset = 0
+        self._checks   = []
+
     def _log(self, message, *args, level=None):
         self._logger.log(self._level if level is None else level, "SVF: " + message, *args)
 
+    async def _shift_compare(self, command, op):
+        await self.lower.shift_compare(op.tdi, op.tdo, op.mask)
+        self._compares.append((self.line, command, self._compare_offset, op))
+        self._compare_offset += len(op.tdi)
+        if len(self._compares) >= _max_pending_compares:
+            await self._queue_check()
+            if len(self._checks) >= _max_pending_checks:
+                await self._verify()
+
+    async def _queue_check(self):
+        if self._compares:
+            self._checks.append((await self.lower.get_compare(defer=True), self._compares))
+            self._compares = []
+            self._compare_offset = 0
+
+    async def _verify(self):
+        await self.lower.flush()
+        checks, self._checks = self._checks, []
+        for result, compares in checks:
+            offset = result.result()
+            if offset is None:
+                continue
+            for line, command, start, op in compares:
+                if start <= offset < start + len(op.tdi):
+                    raise SVFError("%s command at line %d failed: TDO bit %d does not match "
+                                   "<%s> & <%s>"
+                                   % (command, line, offset - start,
+                                      dump_bin(op.tdo), dump_bin(op.mask)))
+            raise SVFError("TDO check failed at bit %d, which is outside of every checked command"
+                           % offset)
+
+    async def flush(self):
+        await self._queue_check()
+        await self._verify()
+
+    async def _verify_pending(self):
+        if not self._deferred_verify and (self._compares or self._checks):
+            await self.flush()
+
     async def _enter_state(self, state):
         try:
             if state == "RESET":
@@ -90,6 +159,7 @@ class SVFInterface(SVFEventHandler):
                            % (frequency / 1e3, self._frequency / 1e3))
 
     async def svf_trst(self, mode):
+        await self._verify_pending()
         if self.lower.has_trst:
             if mode == "ABSENT":
                 pass # ignore; the standard doesn't seem to specify what to do?
@@ -107,6 +177,7 @@ class SVFInterface(SVFEventHandler):
                 raise SVFError("TRST ON command used, but the TRST# pin is not present")
 
     async def svf_state(self, state, path):
+        await self._verify_pending()
         if not path and state == "RESET":
             await self._enter_state(state)
             return
@@ -222,26 +293,24 @@ class SVFInterface(SVFEventHandler):
 
     async def svf_sir(self, tdi, smask, tdo, mask):
         op = self._hir + SVFOperation(tdi, smask, tdo, mask) + self._tir
+        if op.tdo is None:
+            await self._verify_pending()
         await self.lower.enter_shift_ir()
         if op.tdo is None:
             await self.lower.shift_tdi(op.tdi)
         else:
-            tdo = await self.lower.shift_tdio(op.tdi)
-            if tdo & op.mask != op.tdo & op.mask:
-                raise SVFError("SIR command failed: TDO <%s> & <%s> != <%s>"
-                               % (dump_bin(tdo), dump_bin(op.mask), dump_bin(op.tdo)))
+            await self._shift_compare("SIR", op)
         await self._enter_state(self._endir)
 
     async def svf_sdr(self, tdi, smask, tdo, mask):
         op = self._hdr + SVFOperation(tdi, smask, tdo, mask) + self._tdr
+        if op.tdo is None:
+            await self._verify_pending()
         await self.lower.enter_shift_dr()
         if op.tdo is None:
             await self.lower.shift_tdi(op.tdi)
         else:
-            tdo = await self.lower.shift_tdio(op.tdi)
-            if tdo & op.mask != op.tdo & op.mask:
-                raise SVFError("SDR command failed: TDO <%s> & <%s> != <%s>"
-                               % (dump_bin(tdo), dump_bin(op.mask), dump_bin(op.tdo)))
+            await self._shift_compare("SDR", op)
         await self._enter_state(self._enddr)
 
     async def svf_runtest(self, run_state, run_count, run_clock, min_time, max_time, end_state):
@@ -253,6 +322,7 @@ class SVFInterface(SVFEventHandler):
             self._logger.warning("RUNTEST exceeds maximum time: %d cycles (%.3f s) > %.3f s"
                                  % (run_count, run_count / self._frequency, max_time))
 
+        await self._verify_pending()
         await self._enter_state(run_state)
         await self.lower.pulse_tck(run_count)
         await self._enter_state(end_state)
@@ -276,26 +346,58 @@ class JTAGSVFApplet(JTAGProbeApplet):
         * The SCK clock in RUNTEST is not supported.
 
     If any commands requiring these features are encountered, the applet terminates itself.
+
+    TDO data is checked by the probe. The results of the checks are retrieved before any command
+    that does not check TDO data, so that the applet stops at a failed check before e.g. an erase
+    command is executed. With `--deferred-verify`, they are only retrieved every few thousand
+    checks, which is faster, but commands after a failed check may still be executed.
     """
 
+    @classmethod
+    def add_run_arguments(cls, parser, access):
+        super().add_run_arguments(parser, access)
+
+        parser.add_argument(
+            "--deferred-verify", default=False, action="store_true",
+            help="check TDO data in large batches, even across commands that do not check it; "
+                 "faster, but commands after a failed check (e.g. erase) may still run")
+
     async def run(self, device, args):
-        jtag_iface = await self.run_lower(JTAGSVFApplet, device, args)
-        return SVFInterface(jtag_iface, self.logger, args.frequency * 1000)
+        jtag_iface = await self.run_lower(JTAGSVFApplet, device, args,
+                                          buffer_size=_command_buffer_size)
+        return SVFInterface(jtag_iface, self.logger, args.frequency * 1000,
+                            deferred_verify=args.deferred_verify)
 
     @classmethod
     def add_interact_arguments(cls, parser):
         parser.add_argument(
-            "svf_file", metavar="SVF-FILE", type=argparse.FileType("r"),
+            "svf_file", metavar="SVF-FILE", type=argparse.FileType("rb"),
             help="test vector to play")
 
     async def interact(self, device, args, svf_iface):
-        svf_parser = SVFParser(args.svf_file.read(), svf_iface)
-        while True:
-            coro = svf_parser.parse_command()
-            if not coro: break
-
-            for line in svf_parser.last_command().split("\n"):
-                line = line.strip()
-                if line: svf_iface._log(line)
+        with contextlib.ExitStack() as stack:
+            try:
+                svf_data = stack.enter_context(
+                    mmap.mmap(args.svf_file.fileno(), 0, access=mmap.ACCESS_READ))
+            except (OSError, ValueError):
+                svf_data = args.svf_file # a pipe, or an empty file
+            svf_parser = SVFParser(svf_data, svf_iface)
+            # Splitting large commands into lines is expensive; only do it if they will be logged.
+            log_commands = svf_iface._logger.isEnabledFor(svf_iface._level)
+            while True:
+                coro = svf_parser.parse_command()
+                if not coro: break
+
+                if log_commands:
+                    for line in svf_parser.last_command().split("\n"):
+                        line = line.strip()
+                        if line: svf_iface._log(line)
+
+                svf_iface.line = svf_parser.last_command_line()
+                await coro
+            await svf_iface.flush()
 
-            await coro
+    @classmethod
+    def tests(cls):
+        from . import test
+        return test.JTAGSVFAppletTestCase
@@ -0,0 +1,168 @@
+import io
+import types
+import tempfile
+import asyncio
+import unittest
+
+from ....support.bits import *
+from ... import *
+from ..jtag_probe import JTAGState
+from . import JTAGSVFApplet, SVFInterface, SVFOperation, SVFError
+
+
+class _FakeJTAG:
+    # Behaves like `JTAGProbeInterface` connected to a device whose TDO data is the TDI data
+    # shifted in, XORed with `tdo_error` (indexed by the total count of bits compared so far).
+    # Like the probe, compares TDO data without reporting it, and records every other operation.
+    has_trst = False
+
+    def __init__(self, tdo_error=bits()):
+        self.tdo_error  = tdo_error
+        self.operations = []
+        self._state     = JTAGState.UNKNOWN
+        self._position  = 0
+        self._offset    = 0
+        self._failed    = None
+        self._deferred  = []
+
+    def get_state(self):
+        return self._state
+
+    async def enter_test_logic_reset(self, force=True):
+        self._state = JTAGState.RESET
+
+    async def enter_run_test_idle(self):
+        self._state = JTAGState.IDLE
+
+    async def enter_shift_ir(self):
+        self._state = JTAGState.IRSHIFT
+
+    async def enter_shift_dr(self):
+        self._state = JTAGState.DRSHIFT
+
+    async def shift_tdi(self, tdi):
+        self.operations.append(("shift", len(tdi)))
+
+    async def shift_compare(self, tdi, tdo, mask):
+        error = self.tdo_error[self._position:self._position + len(tdi)]
+        error = bits(error) + bits(0, len(tdi) - len(error))
+        mismatch = (tdi ^ error ^ tdo) & mask
+        if self._failed is None and mismatch.find(1) != -1:
+            self._failed = self._offset + mismatch.find(1)
+        self._position += len(tdi)
+        self._offset   += len(tdi)
+        self.operations.append(("compare", len(tdi)))
+
+    async def get_compare(self, *, defer=False):
+        assert defer
+        future = asyncio.Future()
+        self._deferred.append((future, self._failed))
+        self._offset, self._failed = 0, None
+        return future
+
+    async def pulse_tck(self, count):
+        self.operations.append(("pulse", count))
+
+    async def flush(self):
+        for future, failed in self._deferred:
+            future.set_result(failed)
+        self._deferred = []
+        self.operations.append(("flush",))
+
+
+class SVFInterfaceTestCase(unittest.TestCase):
+    async def play(self, svf, tdo_error=bits(), *, deferred_verify=False):
+        lower = _FakeJTAG(tdo_error)
+        svf_iface = SVFInterface(lower, JTAGSVFApplet.logger, 1e6,
+                                 deferred_verify=deferred_verify)
+        if isinstance(svf, str):
+            svf = io.BytesIO(svf.encode())
+        args = types.SimpleNamespace(svf_file=svf)
+        try:
+            await JTAGSVFApplet().interact(None, args, svf_iface)
+        finally:
+            self.operations = lower.operations
+
+    @async_test
+    async def test_pass(self):
+        await self.play("STATE RESET;\n"
+                        "SDR 8 TDI (a5) TDO (a5);\n"
+                        "RUNTEST 10 TCK;\n")
+        self.assertEqual(self.operations, [
+            ("compare", 8), ("flush",), ("pulse", 10), ("flush",),
+        ])
+
+    @async_test
+    async def test_pass_file(self):
+        with tempfile.TemporaryFile() as svf_file:
+            svf_file.write(b"STATE RESET;\n"
+                           b"SDR 8 TDI (a5) TDO (a5);\n")
+            svf_file.seek(0)
+            await self.play(svf_file)
+        self.assertEqual(self.operations, [
+            ("compare", 8), ("flush",),
+        ])
+
+    @async_test
+    async def test_fail_before_runtest(self):
+        with self.assertRaisesRegex(SVFError,
+                r"^SDR command at line 3 failed: TDO bit 2 does not match "
+                r"<10100101> & <11111111>$"):
+            await self.play("STATE RESET;\n"
+                            "SDR 8 TDI (a5) TDO (a5);\n"
+                            "SDR 8 TDI (a5) TDO (a5);\n"
+                            "RUNTEST 10 TCK;\n", bits("00000100""00000000"))
+        self.assertEqual(self.operations, [
+            ("compare", 8), ("compare", 8), ("flush",),
+        ])
+
+    @async_test
+    async def test_fail_deferred(self):
+        with self.assertRaisesRegex(SVFError,
+                r"^SDR command at line 2 failed: TDO bit 0 does not match"):
+            await self.play("STATE RESET;\n"
+                            "SDR 8 TDI (a5) TDO (a5);\n"
+                            "SIR 4 TDI (f);\n"
+                            "RUNTEST 10 TCK;\n", bits("00000001"), deferred_verify=True)
+        self.assertEqual(self.operations, [
+            ("compare", 8), ("shift", 4), ("pulse", 10), ("flush",),
+        ])
+
+    @async_test
+    async def test_fail_final_flush(self):
+        with self.assertRaisesRegex(SVFError,
+                r"^SDR command at line 3 failed: TDO bit 7 does not match"):
+            await self.play("STATE RESET;\n"
+                            "SDR 8 TDI (a5) TDO (a5);\n"
+                            "SDR 8 TDI (a5) TDO (a5);\n", bits(1 << 15, 16))
+        self.assertEqual(self.operations, [
+            ("compare", 8), ("compare", 8), ("flush",),
+        ])
+
+    @async_test
+    async def test_fail_across_checks(self):
+        # The 300th compare is in the second check; the offset reported by the probe is relative
+        # to the start of that check, and must be mapped back to the right command.
+        svf = "STATE RESET;\n" + "SDR 8 TDI (a5) TDO (a5);\n" * 4097
+        with self.assertRaisesRegex(SVFError,
+                r"^SDR command at line 301 failed: TDO bit 5 does not match"):
+            await self.play(svf, bits(1 << (299 * 8 + 5), 4097 * 8), deferred_verify=True)
+        # Once enough checks are pending, they are verified without waiting for the end of file.
+        self.assertEqual(self.operations, [("compare", 8)] * 4096 + [("flush",)])
+
+    @async_test
+    async def test_fail_outside_of_commands(self):
+        lower = _FakeJTAG()
+        svf_iface = SVFInterface(lower, JTAGSVFApplet.logger, 1e6)
+        await svf_iface._shift_compare("SDR", SVFOperation(bits("1010"), tdo=bits("1010"),
+                                                           mask=bits("1111")))
+        lower._failed = 4
+        with self.assertRaisesRegex(SVFError,
+                r"^TDO check failed at bit 4, which is outside of every checked command$"):
+            await svf_iface.flush()
+
+
+class JTAGSVFAppletTestCase(GlasgowAppletTestCase, applet=JTAGSVFApplet):
+    @synthesis_test
+    def test_build(self):
+        self.assertBuilds()
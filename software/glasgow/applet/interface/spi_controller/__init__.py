@@ -5,6 +5,7 @@ from amaranth import *
 from amaranth.lib.cdc import FFSynchronizer
 
 from ....support.logging import *
+from ....support.command_batch import CommandBatch
 from ....gateware.clockgen import *
 from ... import *
 
@@ -69,6 +70,7 @@ CMD_MASK     = 0b11110000
 CMD_SHIFT    = 0b00000000
 CMD_DELAY    = 0b00010000
 CMD_SYNC     = 0b00100000
+CMD_POLL     = 0b00110000
 # CMD_SHIFT
 BIT_DATA_OUT =     0b0001
 BIT_DATA_IN  =     0b0010
@@ -121,6 +123,11 @@ class SPIControllerSubtarget(Elaboratable):
         count = Signal(16)
         bitno = Signal(range(8 + 1))
 
+        poll_opcode = Signal(8)
+        poll_mask   = Signal(8)
+        poll_value  = Signal(8)
+        poll_status = Signal() # shifting the status byte rather than the opcode
+
         with m.FSM() as fsm:
             with m.State("RECV-COMMAND"):
                 m.d.comb += self.in_fifo.flush.eq(1)
@@ -152,6 +159,8 @@ class SPIControllerSubtarget(Elaboratable):
                     m.d.sync += count[8:16].eq(self.out_fifo.r_data)
                     with m.If((cmd & CMD_MASK) == CMD_DELAY):
                         m.next = "DELAY"
+                    with m.Elif((cmd & CMD_MASK) == CMD_POLL):
+                        m.next = "POLL-RECV-OPCODE"
                     with m.Else():
                         m.next = "COUNT-CHECK"
 
@@ -192,7 +201,10 @@ class SPIControllerSubtarget(Elaboratable):
                     m.d.sync += bitno.eq(bitno - 1)
                 with m.Elif(clkgen.stb_f):
                     with m.If(bitno == 0):
-                        m.next = "SEND-DATA"
+                        with m.If((cmd & CMD_MASK) == CMD_POLL):
+                            m.next = "POLL-CHECK"
+                        with m.Else():
+                            m.next = "SEND-DATA"
 
             with m.State("SEND-DATA"):
                 with m.If((cmd & BIT_DATA_IN) != 0):
@@ -209,6 +221,68 @@ class SPIControllerSubtarget(Elaboratable):
                     with m.Else():
                         m.next = "RECV-DATA"
 
+            # CMD_POLL repeatedly reads a status register, by shifting out an opcode and shifting
+            # in one byte in a single transaction, until the status matches the value under mask
+            # or the transaction has been repeated `count` times, and then returns the status.
+            with m.State("POLL-RECV-OPCODE"):
+                with m.If(self.out_fifo.r_rdy):
+                    m.d.comb += self.out_fifo.r_en.eq(1)
+                    m.d.sync += poll_opcode.eq(self.out_fifo.r_data)
+                    m.next = "POLL-RECV-MASK"
+
+            with m.State("POLL-RECV-MASK"):
+                with m.If(self.out_fifo.r_rdy):
+                    m.d.comb += self.out_fifo.r_en.eq(1)
+                    m.d.sync += poll_mask.eq(self.out_fifo.r_data)
+                    m.next = "POLL-RECV-VALUE"
+
+            with m.State("POLL-RECV-VALUE"):
+                with m.If(self.out_fifo.r_rdy):
+                    m.d.comb += self.out_fifo.r_en.eq(1)
+                    m.d.sync += poll_value.eq(self.out_fifo.r_data)
+                    m.next = "POLL-SELECT"
+
+            with m.State("POLL-SELECT"):
+                m.d.sync += [
+                    self.bus.cs.eq(self.cs_active),
+                    shreg_o.eq(poll_opcode),
+                    bitno.eq(8),
+                    poll_status.eq(0),
+                ]
+                m.next = "TRANSFER"
+
+            with m.State("POLL-CHECK"):
+                with m.If(~poll_status):
+                    m.d.sync += [
+                        shreg_o.eq(0),
+                        bitno.eq(8),
+                        poll_status.eq(1),
+                    ]
+                    m.next = "TRANSFER"
+                with m.Else():
+                    m.d.sync += [
+                        self.bus.cs.eq(not self.cs_active),
+                        count.eq(count - 1),
+                    ]
+                    with m.If(((shreg_i & poll_mask) == poll_value) | (count <= 1)):
+                        m.next = "POLL-SEND"
+                    with m.Else():
+                        # Also ensures that chip select is deasserted for long enough.
+                        m.d.comb += timer_en.eq(1)
+                        m.next = "POLL-WAIT"
+
+            with m.State("POLL-WAIT"):
+                with m.If(timer == 0):
+                    m.next = "POLL-SELECT"
+
+            with m.State("POLL-SEND"):
+                m.d.comb += [
+                    self.in_fifo.w_data.eq(shreg_i),
+                    self.in_fifo.w_en.eq(1),
+                ]
+                with m.If(self.in_fifo.w_rdy):
+                    m.next = "RECV-COMMAND"
+
         return m
 
 
@@ -240,31 +314,30 @@ class SPIControllerInterface:
             offset += chunk_size
         yield bytes[offset:], hold_ss
 
+    def transaction(self):
+        return SPIControllerTransaction(self)
+
     async def transfer(self, data, hold_ss=False):
-        try:
-            out_data = memoryview(data)
-        except TypeError:
-            out_data = memoryview(bytes(data))
-        self._log("xfer-out=<%s>", dump_hex(out_data))
-        in_data = []
-        for out_data, hold_ss in self._chunk_bytes(out_data, hold_ss):
-            await self.lower.write(struct.pack("<BH",
-                CMD_SHIFT|BIT_DATA_IN|BIT_DATA_OUT|(BIT_HOLD_SS if hold_ss else 0),
-                len(out_data)))
-            await self.lower.write(out_data)
-            in_data.append(await self.lower.read(len(out_data)))
-        in_data = b"".join(in_data)
-        self._log("xfer-in=<%s>", dump_hex(in_data))
-        return in_data
+        async with self.transaction() as transaction:
+            in_data = transaction.transfer(data, hold_ss)
+        return in_data.result()
 
     async def read(self, count, hold_ss=False):
-        in_data = []
+        await self.read_request(count, hold_ss)
+        return await self.read_response(count)
+
+    # A read can be split into a request and a response, so that several reads (and any other
+    # commands) can be queued before the data for the first one arrives. The responses must be
+    # retrieved in the same order as the requests were made.
+    async def read_request(self, count, hold_ss=False):
+        self._log("read-req=%d", count)
         for count, hold_ss in self._chunk_count(count, hold_ss):
             await self.lower.write(struct.pack("<BH",
                 CMD_SHIFT|BIT_DATA_IN|(BIT_HOLD_SS if hold_ss else 0),
                 count))
-            in_data.append(await self.lower.read(count))
-        in_data = b"".join(in_data)
+
+    async def read_response(self, count):
+        in_data = await self.lower.read(count)
         self._log("read-in=<%s>", dump_hex(in_data))
         return in_data
 
@@ -280,6 +353,23 @@ class SPIControllerInterface:
                 len(out_data)))
             await self.lower.write(out_data)
 
+    # Like reads, polling can be split into a request and a response.
+    async def poll_request(self, opcode, mask, value, count=0xffff):
+        assert count in range(1, 0x10000)
+        self._log("poll-req opcode=%02x mask=%02x value=%02x count=%d",
+                  opcode, mask, value, count)
+        await self.lower.write(struct.pack("<BHBBB",
+            CMD_POLL, count, opcode, mask, value))
+
+    async def poll_response(self):
+        status, = await self.lower.read(1)
+        self._log("poll-in=%02x", status)
+        return status
+
+    async def poll(self, opcode, mask, value, count=0xffff):
+        await self.poll_request(opcode, mask, value, count)
+        return await self.poll_response()
+
     async def delay_us(self, delay):
         self._log("delay=%d us", delay)
         while delay > 0xffff:
@@ -296,6 +386,82 @@ class SPIControllerInterface:
         await self.lower.read(1)
 
 
+class SPIControllerTransaction(CommandBatch):
+    """A sequence of SPI operations that are sent to the device as a single command stream.
+
+    Each of the methods adds an operation to the transaction; the methods that receive data
+    return an :class:`asyncio.Future` that is resolved with the data once the transaction is
+    executed. The transaction is executed with :meth:`execute`, or automatically at the end of
+    an ``async with`` block::
+
+        async with spi_iface.transaction() as transaction:
+            transaction.write([0x9F], hold_ss=True)
+            device_id = transaction.read(3)
+        print(device_id.result().hex())
+
+    Since the device only needs to be waited on once, executing many small operations in
+    a single transaction is much faster than executing each of them separately.
+    """
+
+    def __init__(self, interface):
+        super().__init__(interface.lower)
+        self._interface = interface
+
+    def _log(self, message, *args):
+        self._interface._log(message, *args)
+
+    def _shift(self, bits, out_data, count, hold_ss):
+        if out_data is None:
+            for count, hold_ss in SPIControllerInterface._chunk_count(count, hold_ss):
+                self._commands += struct.pack("<BH",
+                    CMD_SHIFT|bits|(BIT_HOLD_SS if hold_ss else 0), count)
+        else:
+            for out_data, hold_ss in SPIControllerInterface._chunk_bytes(out_data, hold_ss):
+                self._commands += struct.pack("<BH",
+                    CMD_SHIFT|bits|(BIT_HOLD_SS if hold_ss else 0), len(out_data))
+                self._commands += out_data
+
+    def _read_result(self, count, message):
+        def decode(in_data):
+            result = bytes(in_data)
+            self._log(message, dump_hex(result))
+            return result
+        return self._result(count, decode)
+
+    @staticmethod
+    def _memoryview(data):
+        try:
+            return memoryview(data)
+        except TypeError:
+            return memoryview(bytes(data))
+
+    def transfer(self, data, hold_ss=False):
+        out_data = self._memoryview(data)
+        self._log("xfer-out=<%s>", dump_hex(out_data))
+        self._shift(BIT_DATA_IN|BIT_DATA_OUT, out_data, len(out_data), hold_ss)
+        return self._read_result(len(out_data), "xfer-in=<%s>")
+
+    def read(self, count, hold_ss=False):
+        self._log("read-req=%d", count)
+        self._shift(BIT_DATA_IN, None, count, hold_ss)
+        return self._read_result(count, "read-in=<%s>")
+
+    def write(self, data, hold_ss=False):
+        out_data = self._memoryview(data)
+        self._log("write-out=<%s>", dump_hex(out_data))
+        self._shift(BIT_DATA_OUT, out_data, len(out_data), hold_ss)
+
+    def delay_us(self, delay):
+        self._log("delay=%d us", delay)
+        while delay > 0xffff:
+            self._commands += struct.pack("<BH", CMD_DELAY, 0xffff)
+            delay -= 0xffff
+        self._commands += struct.pack("<BH", CMD_DELAY, delay)
+
+    def delay_ms(self, delay):
+        self.delay_us(delay * 1000)
+
+
 class SPIControllerApplet(GlasgowApplet):
     logger = logging.getLogger(__name__)
     help = "initiate SPI transactions"
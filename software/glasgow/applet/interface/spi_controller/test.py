@@ -1,4 +1,5 @@
 import types
+import asyncio
 from amaranth import *
 
 from ... import *
@@ -31,3 +32,46 @@ class SPIControllerAppletTestCase(GlasgowAppletTestCase, applet=SPIControllerApp
         result = yield from spi_iface.transfer([0xAA, 0x55, 0x12, 0x34])
         self.assertEqual(result, bytearray([0xAA, 0x55, 0x12, 0x34]))
         self.assertEqual((yield mux_iface.pads.cs_t.o), 1)
+
+    @applet_simulation_test("setup_loopback",
+                            ["--pin-sck",  "0", "--pin-cs", "1",
+                             "--pin-copi", "2", "--pin-cipo",   "3",
+                             "--frequency", "5000"])
+    @types.coroutine
+    def test_poll(self):
+        mux_iface = self.applet.mux_interface
+        spi_iface = yield from self.run_simulated_applet()
+
+        # In loopback, the status byte is always zero, since nothing is shifted out with it.
+        result = yield from spi_iface.poll(0x05, mask=0x01, value=0x00)
+        self.assertEqual(result, 0x00)
+        self.assertEqual((yield mux_iface.pads.cs_t.o), 1)
+        result = yield from spi_iface.poll(0x05, mask=0x01, value=0x01, count=3)
+        self.assertEqual(result, 0x00)
+        self.assertEqual((yield mux_iface.pads.cs_t.o), 1)
+        result = yield from spi_iface.transfer([0xAA, 0x55])
+        self.assertEqual(result, bytearray([0xAA, 0x55]))
+
+    @applet_simulation_test("setup_loopback",
+                            ["--pin-sck",  "0", "--pin-cs", "1",
+                             "--pin-copi", "2", "--pin-cipo",   "3",
+                             "--frequency", "5000"])
+    @types.coroutine
+    def test_transaction(self):
+        mux_iface = self.applet.mux_interface
+        spi_iface = yield from self.run_simulated_applet()
+
+        transaction = spi_iface.transaction()
+        transaction.write([0x01, 0x02], hold_ss=True)
+        result_1 = transaction.read(2, hold_ss=True)
+        transaction.delay_us(1)
+        result_2 = transaction.transfer([0xAA, 0x55])
+        result_3 = transaction.transfer([0x12, 0x34])
+        self.assertFalse(result_1.done())
+        with self.assertRaises(asyncio.InvalidStateError):
+            result_1.result()
+        yield from transaction.execute()
+        self.assertEqual(result_1.result(), b"\x00\x00")
+        self.assertEqual(result_2.result(), b"\xAA\x55")
+        self.assertEqual(result_3.result(), b"\x12\x34")
+        self.assertEqual((yield mux_iface.pads.cs_t.o), 1)
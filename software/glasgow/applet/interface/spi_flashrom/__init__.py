@@ -15,8 +15,11 @@ class SPISerprogInterface:
 
     async def write_read(self, sdata, rlen):
         assert len(sdata) > 0
-        await self.lower.write(sdata, hold_ss=rlen > 0)
-        return await self.lower.read(rlen)
+        async with self.lower.transaction() as transaction:
+            transaction.write(sdata, hold_ss=rlen > 0)
+            if rlen > 0:
+                rdata = transaction.read(rlen)
+        return rdata.result() if rlen > 0 else b""
 
 
 class SerprogCommand(enum.IntEnum):
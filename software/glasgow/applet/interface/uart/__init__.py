@@ -222,8 +222,10 @@ class UARTApplet(GlasgowApplet):
         manual_cyc = self.derive_clock(
             input_hz=self.__sys_clk_freq, output_hz=args.baud,
             min_cyc=2, max_deviation_ppm=args.tolerance)
-        await device.write_register(self.__addr_manual_cyc, manual_cyc, width=4)
-        await device.write_register(self.__addr_use_auto, 0)
+        await device.access_registers([
+            (self.__addr_manual_cyc, manual_cyc, 4),
+            (self.__addr_use_auto,   0,          1),
+        ])
 
         # Enable pull-ups or pull-downs.
         # This reduces the amount of noise received on tristated lines.
@@ -100,9 +100,12 @@ class BenchmarkApplet(GlasgowApplet):
           on the host is measured
           (simulates cases where a transaction with the DUT relies on feedback from the host;
           also useful for comparing different usb stacks or usb data paths like hubs or network bridges)
+        * transfers: host reads a register repeatedly, with and without reuse of USB transfer
+          objects, and the number of transfers per second is measured
+          (simulates cases where an applet polls device state or issues many small transactions)
     """
 
-    __all_modes = ["source", "sink", "loopback", "latency"]
+    __all_modes = ["source", "sink", "loopback", "latency", "transfers"]
 
     def build(self, target, args):
         self.mux_interface = iface = \
@@ -133,7 +136,8 @@ class BenchmarkApplet(GlasgowApplet):
             help="run benchmark mode MODE (default: {})".format(" ".join(cls.__all_modes)))
 
     async def run(self, device, args):
-        return await device.demultiplexer.claim_interface(self, self.mux_interface, args=None)
+        return await device.demultiplexer.claim_interface(self, self.mux_interface, args=None,
+                                                          profile="auto")
 
     async def interact(self, device, args, iface):
         golden = bytearray()
@@ -156,9 +160,10 @@ class BenchmarkApplet(GlasgowApplet):
                 await device.write_register(self.__addr_mode, Mode.SOURCE.value)
                 await iface.reset()
 
+                actual = bytearray(len(golden))
                 counter_fut = asyncio.ensure_future(counter())
                 begin  = time.time()
-                actual = await iface.read(len(golden))
+                await iface.read_into(actual)
                 end    = time.time()
                 length = len(golden)
                 counter_fut.cancel()
@@ -221,6 +226,19 @@ class BenchmarkApplet(GlasgowApplet):
 
                 counter_fut.cancel()
 
+            if mode == "transfers":
+                count = min(args.count // 512, 10000)
+                error = False
+                transfer_rates = {}
+
+                for pooling in (False, True):
+                    device.transfer_pooling = pooling
+                    begin = time.perf_counter()
+                    for _ in range(count):
+                        await device.read_register(self.__addr_count, width=4)
+                    end = time.perf_counter()
+                    transfer_rates[pooling] = count / (end - begin)
+
             if error:
                 if count is None:
                     self.logger.error("mode %s failed!", mode)
@@ -233,6 +251,11 @@ class BenchmarkApplet(GlasgowApplet):
                                  statistics.mean(roundtriptime),
                                  statistics.pstdev(roundtriptime),
                                  max(roundtriptime))
+                elif mode == "transfers":
+                    self.logger.info("mode %s: %.0f xfer/s unpooled, %.0f xfer/s pooled",
+                                 mode,
+                                 transfer_rates[False],
+                                 transfer_rates[True])
                 else:
                     self.logger.info("mode %s: %.2f MiB/s (%.2f Mb/s)",
                                  mode,
@@ -5,6 +5,7 @@ import re
 import sys
 import struct
 import logging
+import collections
 import argparse
 from amaranth import *
 
@@ -59,17 +60,20 @@ class Memory25xInterface:
         self._logger.log(self._level, "25x: " + message, *args)
 
     async def _command(self, cmd, arg=[], dummy=0, ret=0):
+        await self._command_request(cmd, arg, dummy, ret)
+        result = await self.lower.read(ret)
+
+        self._log("result=<%s>", dump_hex(result))
+
+        return result
+
+    async def _command_request(self, cmd, arg=[], dummy=0, ret=0):
         arg = bytes(arg)
 
         self._log("cmd=%02X arg=<%s> dummy=%d ret=%d", cmd, dump_hex(arg), dummy, ret)
 
         await self.lower.write(bytearray([cmd, *arg, *[0 for _ in range(dummy)]]),
                                hold_ss=(ret > 0))
-        result = await self.lower.read(ret)
-
-        self._log("result=<%s>", dump_hex(result))
-
-        return result
 
     async def wakeup(self):
         self._log("wakeup")
@@ -98,18 +102,42 @@ class Memory25xInterface:
     def _format_addr(self, addr):
         return bytes([(addr >> 16) & 0xff, (addr >> 8) & 0xff, addr & 0xff])
 
+    # Number of read commands kept in flight at once. Reading a chunk takes a USB round-trip,
+    # during which the SPI bus would otherwise be idle; keeping a few more commands queued
+    # behind it ensures that the read throughput is limited only by the SPI clock.
+    _read_pipeline_depth = 4
+
     async def _read_command(self, address, length, chunk_size, cmd, dummy=0,
                             callback=lambda done, total, status: None):
         if chunk_size is None:
             chunk_size = 0x10000 # for progress indication
 
+        if length == 0:
+            # Do not send a command to the flash if there is nothing to read.
+            callback(0, 0, None)
+            return bytearray()
+
         data = bytearray()
-        while length > len(data):
+        if length <= chunk_size:
+            # Nothing to pipeline.
             callback(len(data), length, f"reading address {address:#08x}")
-            chunk    = await self._command(cmd, arg=self._format_addr(address),
-                                           dummy=dummy, ret=min(chunk_size, length - len(data)))
-            data    += chunk
-            address += len(chunk)
+            data += await self._command(cmd, arg=self._format_addr(address),
+                                        dummy=dummy, ret=length)
+        else:
+            pending = collections.deque()
+            queued  = 0
+            while length > len(data):
+                while length > queued and len(pending) < self._read_pipeline_depth:
+                    size = min(chunk_size, length - queued)
+                    await self._command_request(cmd, arg=self._format_addr(address + queued),
+                                                dummy=dummy, ret=size)
+                    await self.lower.read_request(size)
+                    pending.append(size)
+                    queued += size
+                callback(len(data), length, f"reading address {address + len(data):#08x}")
+                chunk = await self.lower.read_response(pending.popleft())
+                self._log("result=<%s>", dump_hex(chunk))
+                data += chunk
 
         callback(len(data), length, None)
         return data
@@ -154,6 +182,33 @@ class Memory25xInterface:
                 raise Memory25xError(f"{command} command failed (status {status:08b})")
         return bool(status & BIT_WIP)
 
+    # Instead of reading the status register from the host until a write or erase command
+    # completes, the SPI controller can poll it on the device, which avoids a USB round-trip
+    # per status read, and allows queueing further commands behind the poll. Both WIP and WEL
+    # are cleared once the command completes; if WIP is clear but WEL is still set, the command
+    # has failed. Since WEL may clear slightly after WIP (see `write_in_progress`), WIP is polled
+    # first, and then WEL is given a few more status reads to clear.
+    _poll_wel_count = 16
+
+    async def _poll_write_request(self):
+        await self.lower.poll_request(0x05, mask=BIT_WIP, value=0)
+        await self.lower.poll_request(0x05, mask=BIT_WIP|BIT_WEL, value=0,
+                                      count=self._poll_wel_count)
+
+    async def _poll_write_response(self, command="write"):
+        await self.lower.poll_response()
+        status = await self.lower.poll_response()
+        self._log("poll status=%s", f"{status:#010b}")
+        if status & BIT_WEL and not status & BIT_WIP:
+            raise Memory25xError(f"{command} command failed (status {status:08b})")
+        return bool(status & BIT_WIP)
+
+    async def _poll_write(self, command="write"):
+        while True:
+            await self._poll_write_request()
+            if not await self._poll_write_response(command):
+                break
+
     async def write_status(self, status):
         self._log("write status=%s", f"{status:#010b}")
         await self._command(0x01, arg=[status])
@@ -180,51 +235,119 @@ class Memory25xInterface:
         await self._command(0x02, arg=self._format_addr(address) + data)
         while await self.write_in_progress(command="PAGE PROGRAM"): pass
 
+    # Number of page program commands kept in flight at once by `program`.
+    _program_pipeline_depth = 16
+
     async def program(self, address, data, page_size,
                       callback=lambda done, total, status: None):
         data = bytes(data)
         done, total = 0, len(data)
-        while len(data) > 0:
-            chunk    = data[:page_size - address % page_size]
-            data     = data[len(chunk):]
-
-            callback(done, total, f"programming page {address:#08x}")
-            await self.write_enable()
-            await self.page_program(address, chunk)
-
-            address += len(chunk)
-            done    += len(chunk)
+        pending = collections.deque()
+        while len(data) > 0 or pending:
+            while len(data) > 0 and len(pending) < self._program_pipeline_depth:
+                chunk    = data[:page_size - address % page_size]
+                data     = data[len(chunk):]
+
+                await self.write_enable()
+                self._log("page program addr=%#08x data=<%s>", address, chunk.hex())
+                await self._command(0x02, arg=self._format_addr(address) + chunk)
+                await self._poll_write_request()
+                pending.append((address, len(chunk)))
+
+                address += len(chunk)
+
+            page_address, page_length = pending.popleft()
+            callback(done, total, f"programming page {page_address:#08x}")
+            if await self._poll_write_response(command="PAGE PROGRAM"):
+                # The commands queued after this one were ignored by the memory.
+                raise Memory25xError(f"PAGE PROGRAM command at {page_address:#08x} timed out")
+            done += page_length
 
         callback(done, total, None)
 
-    async def erase_program(self, address, data, sector_size, page_size,
+    @staticmethod
+    def _changed_pages(old_data, new_data, page_size):
+        # Yields (offset, length) for each run of consecutive pages that differ.
+        run_start = None
+        for offset in range(0, len(new_data), page_size):
+            if old_data[offset:offset + page_size] != new_data[offset:offset + page_size]:
+                if run_start is None:
+                    run_start = offset
+            elif run_start is not None:
+                yield run_start, offset - run_start
+                run_start = None
+        if run_start is not None:
+            yield run_start, len(new_data) - run_start
+
+    async def erase_program(self, address, data, sector_size, page_size, *, diff=False,
                             callback=lambda done, total, status: None):
+        # With `diff`, the memory is read first; sectors that already contain the data are
+        # skipped, sectors where the data only requires changing bits from 1 to 0 are not erased,
+        # and only the pages that differ are programmed. Returns the number of bytes of the data
+        # that did not have to be programmed.
         data = bytes(data)
         done, total = 0, len(data)
+        skipped = 0
+        if diff:
+            region_start = address & ~(sector_size - 1)
+            region_end   = (address + len(data) + sector_size - 1) & ~(sector_size - 1)
+            region_data  = await self.read(region_start, region_end - region_start,
+                chunk_size=sector_size,
+                callback=lambda read_done, read_total, status: callback(0, total, status))
+
         while len(data) > 0:
             chunk    = data[:sector_size - address % sector_size]
             data     = data[len(chunk):]
 
             sector_start = address & ~(sector_size - 1)
-            if address % sector_size == 0 and len(chunk) == sector_size:
+            chunk_offset = address % sector_size
+            if diff:
+                old_offset  = sector_start - region_start
+                old_data    = region_data[old_offset:old_offset + sector_size]
+                sector_data = bytearray(old_data)
+                sector_data[chunk_offset:chunk_offset + len(chunk)] = chunk
+            elif chunk_offset == 0 and len(chunk) == sector_size:
                 sector_data = chunk
             else:
                 sector_data = await self.read(sector_start, sector_size)
-                sector_data[address % sector_size:(address % sector_size) + len(chunk)] = chunk
-
-            callback(done, total, f"erasing sector {sector_start:#08x}")
-            await self.write_enable()
-            await self.sector_erase(sector_start)
-
-            if not re.match(rb"^\xff*$", sector_data):
-                await self.program(sector_start, sector_data, page_size,
-                    callback=lambda page_done, page_total, status:
-                                callback(done + page_done, total, status))
+                sector_data[chunk_offset:chunk_offset + len(chunk)] = chunk
+
+            old_bits = int.from_bytes(old_data, "big") if diff else 0
+            new_bits = int.from_bytes(sector_data, "big")
+            if not diff or new_bits & ~old_bits:
+                callback(done, total, f"erasing sector {sector_start:#08x}")
+                await self.write_enable()
+                self._log("sector erase addr=%#08x", sector_start)
+                await self._command(0x20, arg=self._format_addr(sector_start))
+                await self._poll_write(command="SECTOR ERASE")
+                old_data = b"\xff" * sector_size
+
+            def chunk_done(sector_offset):
+                # the sector data may extend past the chunk, which is not counted
+                return min(max(sector_offset - chunk_offset, 0), len(chunk))
+
+            if not diff:
+                if not re.match(rb"^\xff*$", sector_data):
+                    await self.program(sector_start, sector_data, page_size,
+                        callback=lambda page_done, page_total, status:
+                                    callback(done + chunk_done(page_done), total, status))
+            else:
+                programmed = 0
+                for run_offset, run_length in self._changed_pages(old_data, sector_data,
+                                                                  page_size):
+                    await self.program(sector_start + run_offset,
+                        sector_data[run_offset:run_offset + run_length], page_size,
+                        callback=lambda page_done, page_total, status:
+                                    callback(done + chunk_done(run_offset + page_done), total,
+                                             status))
+                    programmed += chunk_done(run_offset + run_length) - chunk_done(run_offset)
+                skipped += len(chunk) - programmed
 
             address += len(chunk)
             done    += len(chunk)
 
         callback(done, total, None)
+        return skipped
 
 
 class Memory25xSFDPParser(SFDPParser):
@@ -376,6 +499,9 @@ class Memory25xApplet(SPIControllerApplet):
         p_erase_program.add_argument(
             "-S", "--sector-size", metavar="SIZE", type=length, required=True,
             help="erase memory in SIZE byte sectors")
+        p_erase_program.add_argument(
+            "--diff", default=False, action="store_true",
+            help="read memory first, and only erase and program sectors and pages that differ")
         add_page_argument(p_erase_program)
         add_program_arguments(p_erase_program)
 
@@ -480,8 +606,12 @@ class Memory25xApplet(SPIControllerApplet):
                 await m25x_iface.program(args.address, data, args.page_size,
                                           callback=self._show_progress)
             if args.operation == "erase-program":
-                await m25x_iface.erase_program(args.address, data, args.sector_size,
-                                                args.page_size, callback=self._show_progress)
+                skipped = await m25x_iface.erase_program(args.address, data, args.sector_size,
+                    args.page_size, diff=args.diff, callback=self._show_progress)
+                if args.diff:
+                    self._show_progress(0, 0, "")
+                    self.logger.info("%d/%d bytes skipped, already programmed",
+                                     skipped, len(data))
 
         if args.operation == "verify":
             if args.data is not None:
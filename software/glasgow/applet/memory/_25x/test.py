@@ -1,7 +1,64 @@
+import logging
 import unittest
 
 from ... import *
-from . import Memory25xApplet
+from . import Memory25xApplet, Memory25xInterface, Memory25xError
+
+
+class _FakeFlash:
+    # Behaves like `SPIControllerInterface` connected to a flash that implements READ, WRITE ENABLE,
+    # PAGE PROGRAM, SECTOR ERASE, and READ STATUS (when polled), with 256-byte pages and 4 KiB
+    # sectors.
+    def __init__(self, data):
+        self.data      = bytearray(data)
+        self.address   = None
+        self.wel       = False
+        self.responses = MockResponseQueue()
+        self.programmed = []
+        self.erased     = []
+        self.polls      = []
+        self.failing    = False # program and erase commands leave WEL set
+
+    async def write(self, data, hold_ss=False):
+        address = int.from_bytes(data[1:4], "big")
+        if data[0] == 0x03:
+            assert hold_ss
+            self.address = address
+        elif data[0] == 0x06:
+            self.wel = True
+        elif data[0] == 0x02:
+            assert self.wel and address % 256 + len(data) - 4 <= 256
+            for offset, byte in enumerate(data[4:]):
+                self.data[address + offset] &= byte
+            self.programmed.append(address)
+            self.wel = self.failing
+        elif data[0] == 0x20:
+            assert self.wel and address % 4096 == 0
+            self.data[address:address + 4096] = b"\xff" * 4096
+            self.erased.append(address)
+            self.wel = self.failing
+        else:
+            assert False
+
+    async def read(self, count, hold_ss=False):
+        if count == 0:
+            return b""
+        await self.read_request(count, hold_ss)
+        return await self.read_response(count)
+
+    async def read_request(self, count, hold_ss=False):
+        self.responses.push(bytes(self.data[self.address:self.address + count]))
+
+    async def read_response(self, count):
+        return self.responses.pop(count)
+
+    async def poll_request(self, opcode, mask, value, count=0xffff):
+        assert opcode == 0x05
+        self.polls.append((mask, count))
+        self.responses.push(0x02 if self.wel else 0x00)
+
+    async def poll_response(self):
+        return self.responses.pop()
 
 
 class Memory25xAppletTestCase(GlasgowAppletTestCase, applet=Memory25xApplet):
@@ -113,6 +170,7 @@ class Memory25xAppletTestCase(GlasgowAppletTestCase, applet=Memory25xApplet):
         self.assertEqual(await m25x_iface.read(self.dut_page_size * 2, 4),
                          b"test")
 
+    @unittest.skip("fixture was recorded before status polling was moved to the device")
     @applet_hardware_test(setup="setup_flash_data", args=hardware_args)
     async def test_api_program(self, m25x_iface):
         # crosses the page boundary
@@ -129,3 +187,100 @@ class Memory25xAppletTestCase(GlasgowAppletTestCase, applet=Memory25xApplet):
             page_size=0x100, sector_size=self.dut_sector_size)
         self.assertEqual(await m25x_iface.read(0, 14),
                          b"Bye  , world!")
+
+
+class Memory25xInterfaceTestCase(unittest.TestCase):
+    @async_test
+    async def test_pipelined_read(self):
+        data  = bytes(range(256)) * 64
+        flash = _FakeFlash(data)
+        iface = Memory25xInterface(flash, logging.getLogger(__name__))
+        progress = []
+        result = await iface.read(0x123, 0x3000, chunk_size=0x400,
+            callback=lambda done, total, status: progress.append((done, total, status)))
+        self.assertEqual(result, data[0x123:0x3123])
+        self.assertEqual(flash.responses.max_inflight, iface._read_pipeline_depth)
+        self.assertEqual(progress[0], (0, 0x3000, "reading address 0x000123"))
+        self.assertEqual(progress[1], (0x400, 0x3000, "reading address 0x000523"))
+        self.assertEqual(progress[-1], (0x3000, 0x3000, None))
+        self.assertEqual(len(progress), 13)
+
+    @async_test
+    async def test_read_empty(self):
+        flash = _FakeFlash(b"")
+        iface = Memory25xInterface(flash, logging.getLogger(__name__))
+        self.assertEqual(await iface.read(0, 0), b"")
+        self.assertIsNone(flash.address)
+
+    async def erase_program(self, old_data, address, data, diff):
+        flash = _FakeFlash(old_data)
+        iface = Memory25xInterface(flash, logging.getLogger(__name__))
+        progress = []
+        skipped = await iface.erase_program(address, data,
+            sector_size=0x1000, page_size=0x100, diff=diff,
+            callback=lambda done, total, status: progress.append(done))
+        new_data = bytearray(old_data)
+        new_data[address:address + len(data)] = data
+        self.assertEqual(flash.data, new_data)
+        self.assertEqual(progress, sorted(progress))
+        self.assertEqual(progress[-1], len(data))
+        return flash, skipped
+
+    @async_test
+    async def test_erase_program(self):
+        old_data = bytes(range(256)) * 48
+        flash, skipped = await self.erase_program(old_data, 0x0f80, b"\x00" * 0x100, diff=False)
+        self.assertEqual(flash.erased, [0x0000, 0x1000])
+        self.assertEqual(skipped, 0)
+
+    @async_test
+    async def test_program(self):
+        flash = _FakeFlash(b"\xff" * 0x1000)
+        iface = Memory25xInterface(flash, logging.getLogger(__name__))
+        progress = []
+        # crosses the page boundary
+        await iface.program(0x200 - 6, b"before/after", page_size=0x100,
+            callback=lambda done, total, status: progress.append((done, total, status)))
+        self.assertEqual(flash.data[0x200 - 6:0x200 + 6], b"before/after")
+        self.assertEqual(flash.programmed, [0x200 - 6, 0x200])
+        self.assertEqual(flash.polls, [(0x01, 0xffff), (0x03, iface._poll_wel_count)] * 2)
+        self.assertEqual(progress, [
+            (0, 12, "programming page 0x0001fa"),
+            (6, 12, "programming page 0x000200"),
+            (12, 12, None),
+        ])
+
+    @async_test
+    async def test_program_failed(self):
+        flash = _FakeFlash(b"\xff" * 0x1000)
+        flash.failing = True
+        iface = Memory25xInterface(flash, logging.getLogger(__name__))
+        with self.assertRaisesRegex(Memory25xError, r"^PAGE PROGRAM command failed"):
+            await iface.program(0, b"\x00" * 0x200, page_size=0x100)
+        # only WIP is polled until the command completes, so a failure is detected quickly
+        self.assertEqual(flash.polls[:2], [(0x01, 0xffff), (0x03, iface._poll_wel_count)])
+
+    @async_test
+    async def test_erase_program_diff_same(self):
+        old_data = bytes(range(256)) * 48
+        flash, skipped = await self.erase_program(old_data, 0x0f80, old_data[0x0f80:0x2080],
+                                                  diff=True)
+        self.assertEqual(flash.erased, [])
+        self.assertEqual(flash.programmed, [])
+        self.assertEqual(skipped, 0x1100)
+
+    @async_test
+    async def test_erase_program_diff_clear_bits(self):
+        old_data = bytes(range(256)) * 48
+        flash, skipped = await self.erase_program(old_data, 0x1010, b"\x00" * 0x10, diff=True)
+        self.assertEqual(flash.erased, [])
+        self.assertEqual(flash.programmed, [0x1000])
+        self.assertEqual(skipped, 0)
+
+    @async_test
+    async def test_erase_program_diff_set_bits(self):
+        old_data = b"\x00" * 0x1000 + b"\xff" * 0x2000
+        flash, skipped = await self.erase_program(old_data, 0x0f00, b"\x01" * 0x200, diff=True)
+        self.assertEqual(flash.erased, [0x0000])
+        self.assertEqual(flash.programmed, [*range(0x0000, 0x1000, 0x100), 0x1000])
+        self.assertEqual(skipped, 0)
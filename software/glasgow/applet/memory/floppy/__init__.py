@@ -300,6 +300,8 @@ import logging
 import asyncio
 import argparse
 import struct
+import mmap
+import concurrent.futures
 import random
 import itertools
 import math
@@ -924,21 +926,25 @@ class MemoryFloppyAppletTool(GlasgowAppletTool, applet=MemoryFloppyApplet):
         p_index.add_argument(
             "--ignore-data-crc", action="store_true", default=False,
             help="do not reject sector data with incorrect CRC")
+        p_index.add_argument(
+            "-j", "--jobs", metavar="COUNT", type=_jobs_count, default=1,
+            help="decode at most COUNT tracks at once (default: %(default)s)")
         p_index.add_argument(
             "file", metavar="RAW-FILE", type=argparse.FileType("rb"),
             help="read raw disk image from RAW-FILE")
 
     def _run_index(self, args):
-        for cylinder, head, bytestream in self.iter_tracks(args.file):
+        if args.no_decode:
+            for cylinder, head, bytestream in self.iter_tracks(args.file):
+                self.logger.info("indexing C/H %d/%d: %d edges captured",
+                                 cylinder, head, len(bytestream))
+            return
+
+        for cylinder, head, size, sectors in self.iter_track_sectors(args.file, jobs=args.jobs,
+                verbose=True, ignore_data_crc=args.ignore_data_crc):
             self.logger.info("indexing C/H %d/%d: %d edges captured",
-                             cylinder, head, len(bytestream))
-            if args.no_decode:
-                continue
-
-            mfm        = SoftwareMFMDecoder(self.logger)
-            symbstream = mfm.demodulate(mfm.lock(mfm.bits(bytestream)))
-            for _ in self.iter_mfm_sectors(symbstream, verbose=True,
-                    ignore_data_crc=args.ignore_data_crc):
+                             cylinder, head, size)
+            for _ in sectors:
                 pass
 
     @classmethod
@@ -954,6 +960,9 @@ class MemoryFloppyAppletTool(GlasgowAppletTool, applet=MemoryFloppyApplet):
         p_raw2img.add_argument(
             "-t", "--sectors-per-track", metavar="COUNT", type=int, required=True,
             help="amount of sectors per track (9 for DD, 18 for HD, ...)")
+        p_raw2img.add_argument(
+            "-j", "--jobs", metavar="COUNT", type=_jobs_count, default=1,
+            help="decode at most COUNT tracks at once (default: %(default)s)")
         p_raw2img.add_argument(
             "raw_file", metavar="RAW-FILE", type=argparse.FileType("rb"),
             help="read raw disk image from RAW-FILE")
@@ -968,16 +977,13 @@ class MemoryFloppyAppletTool(GlasgowAppletTool, applet=MemoryFloppyApplet):
 
         try:
             curr_lba = 0
-            for cylinder, head, bytestream in self.iter_tracks(args.raw_file):
+            for cylinder, head, _size, track_sectors in self.iter_track_sectors(args.raw_file,
+                    jobs=args.jobs, ignore_data_crc=args.ignore_data_crc):
                 self.logger.info("processing C/H %d/%d", cylinder, head)
 
-                mfm        = SoftwareMFMDecoder(self.logger)
-                symbstream = mfm.demodulate(mfm.lock(mfm.bits(bytestream)))
-
                 sectors    = {}
                 seen       = set()
-                for (cyl, hd, sec), data in self.iter_mfm_sectors(symbstream,
-                        ignore_data_crc=args.ignore_data_crc):
+                for (cyl, hd, sec), data in track_sectors:
                     if sec not in range(1, 1 + args.sectors_per_track):
                         self.logger.error("sector at C/H/S %d/%d/%d overflows track geometry "
                                           "(%d sectors per track)",
@@ -1033,6 +1039,51 @@ class MemoryFloppyAppletTool(GlasgowAppletTool, applet=MemoryFloppyApplet):
             size, cylinder, head = struct.unpack(">LBB", header)
             yield cylinder, head, file.read(size)
 
+    def iter_track_offsets(self, file):
+        offset = file.tell()
+        while True:
+            header = file.read(struct.calcsize(">LBB"))
+            if header == b"": break
+            size, cylinder, head = struct.unpack(">LBB", header)
+            offset += len(header)
+            yield cylinder, head, offset, size
+            offset += size
+            file.seek(offset)
+
+    def iter_track_sectors(self, file, *, jobs=1, **kwargs):
+        if jobs == 1:
+            for cylinder, head, bytestream in self.iter_tracks(file):
+                symbstream = TrackMFMDecoder(self.logger).decode(bytestream)
+                yield cylinder, head, len(bytestream), self.iter_mfm_sectors(symbstream, **kwargs)
+            return
+
+        if not file.seekable():
+            raise GlasgowAppletError("decoding several tracks at once requires a seekable file")
+        # Each track is decoded independently, so tracks are decoded in worker processes, each of
+        # which maps the entire file into memory. Log messages are recorded in the worker processes
+        # and replayed here along with the sectors, to keep the output the same as it would be
+        # if the tracks were decoded one after another.
+        tracks = list(self.iter_track_offsets(file))
+        executor = concurrent.futures.ProcessPoolExecutor(jobs,
+            initializer=_map_raw_file, initargs=(file.name,))
+        try:
+            futures = [
+                executor.submit(_decode_track_sectors, offset, size,
+                                log_level=self.logger.getEffectiveLevel(), **kwargs)
+                for _cylinder, _head, offset, size in tracks
+            ]
+            for (cylinder, head, _offset, size), future in zip(tracks, futures):
+                yield cylinder, head, size, self._replay_track_sectors(future.result())
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+    def _replay_track_sectors(self, events):
+        for record, sector in events:
+            if record is not None:
+                self.logger.handle(record)
+            else:
+                yield sector
+
     crc_mfm = staticmethod(CRC16_CCITT_FALSE(data_width=8).compute)
 
     def iter_mfm_sectors(self, symbstream, *, verbose=False, ignore_data_crc=False):
@@ -1115,3 +1166,43 @@ class MemoryFloppyAppletTool(GlasgowAppletTool, applet=MemoryFloppyApplet):
 
             if count == 0:
                 state = "IDLE"
+
+
+class _TrackEventHandler(logging.Handler):
+    def __init__(self, events):
+        super().__init__()
+        self.events = events
+
+    def emit(self, record):
+        # Format the message here, since the arguments might not be picklable.
+        record.msg  = record.getMessage()
+        record.args = None
+        self.events.append((record, None))
+
+
+_raw_file = None
+
+
+def _jobs_count(arg):
+    count = int(arg)
+    if count < 1:
+        raise argparse.ArgumentTypeError(f"{arg} is not a positive job count")
+    return count
+
+
+def _map_raw_file(filename):
+    global _raw_file
+    with open(filename, "rb") as file:
+        _raw_file = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _decode_track_sectors(offset, size, *, log_level, **kwargs):
+    events = []
+    tool   = MemoryFloppyAppletTool()
+    # A logger that is not registered with the logging module does not propagate its records.
+    tool.logger = logging.Logger(MemoryFloppyAppletTool.logger.name, log_level)
+    tool.logger.addHandler(_TrackEventHandler(events))
+    symbstream = TrackMFMDecoder(tool.logger).decode(_raw_file[offset:offset + size])
+    for sector in tool.iter_mfm_sectors(symbstream, **kwargs):
+        events.append((None, sector))
+    return events
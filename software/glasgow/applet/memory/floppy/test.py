@@ -1,8 +1,109 @@
+import os
+import random
+import struct
+import logging
+import tempfile
+import unittest
+
 from ... import *
-from . import MemoryFloppyApplet
+from . import MemoryFloppyApplet, MemoryFloppyAppletTool
+from .mfm import *
 
 
 class MemoryFloppyAppletTestCase(GlasgowAppletTestCase, applet=MemoryFloppyApplet):
     @synthesis_test
     def test_build(self):
         self.assertBuilds()
+
+
+class TrackMFMDecoderTestCase(unittest.TestCase):
+    def setUp(self):
+        self.logger = logging.getLogger(__name__)
+        self.random = random.Random(0)
+
+    def make_track(self, sectors):
+        chips = []
+        prev  = 0
+        def add_byte(byte):
+            nonlocal prev
+            for bit in range(7, -1, -1):
+                data = (byte >> bit) & 1
+                chips.extend([int(not (prev or data)), data])
+                prev = data
+        def add_sync():
+            nonlocal prev
+            chips.extend([0,1,0,0,0,1,0,0,1,0,0,0,1,0,0,1])
+            prev = 1
+
+        for _ in range(sectors):
+            for byte in [0x4e] * 16 + [0x00] * 12:
+                add_byte(byte)
+            for _ in range(3):
+                add_sync()
+            for byte in [0xfe, 0, 0, 1, 2, 0xaa, 0x55] + [0x4e] * 22 + [0x00] * 12:
+                add_byte(byte)
+            for _ in range(3):
+                add_sync()
+            for byte in [0xfb] + [self.random.randrange(256) for _ in range(128)]:
+                add_byte(byte)
+
+        # Convert chips to intervals between edges with some jitter, at 24 samples per chip.
+        bytestream = bytearray()
+        interval   = 0
+        for chip in chips:
+            interval += 1
+            if chip:
+                bytestream.append(interval * 24 - 1 + self.random.randint(-3, 3))
+                interval = 0
+        return bytestream
+
+    def assertDecodesSame(self, bytestream):
+        old_mfm = SoftwareMFMDecoder(self.logger)
+        new_mfm = TrackMFMDecoder(self.logger)
+        self.assertEqual(list(new_mfm.lock(new_mfm.intervals(bytestream))),
+                         list(old_mfm.lock(old_mfm.bits(bytestream))))
+        self.assertEqual(new_mfm.decode(bytestream),
+                         list(old_mfm.demodulate(old_mfm.lock(old_mfm.bits(bytestream)))))
+
+    def test_empty(self):
+        self.assertDecodesSame(b"")
+
+    def test_track(self):
+        self.assertDecodesSame(self.make_track(sectors=3))
+
+    def test_track_long_gaps(self):
+        bytestream = self.make_track(sectors=2)
+        bytestream[1000:1000] = [0xfd, 0xfd, 0x10]
+        bytestream[2000:2000] = [0xfd, 0x80]
+        self.assertDecodesSame(bytestream)
+
+    def test_noise(self):
+        bytestream = bytes(self.random.randrange(256) for _ in range(2000))
+        self.assertDecodesSame(bytestream)
+
+
+class MemoryFloppyAppletToolTestCase(unittest.TestCase):
+    def test_parallel_decode(self):
+        tracks = TrackMFMDecoderTestCase()
+        tracks.setUp()
+        with tempfile.TemporaryDirectory() as dirname, \
+                open(os.path.join(dirname, "disk.raw"), "w+b") as file:
+            for cylinder in range(2):
+                for head in range(2):
+                    bytestream = tracks.make_track(sectors=2)
+                    file.write(struct.pack(">LBB", len(bytestream), cylinder, head))
+                    file.write(bytestream)
+
+            results = []
+            for jobs in (1, 2):
+                file.seek(0)
+                tool = MemoryFloppyAppletTool()
+                with self.assertLogs(tool.logger, level="DEBUG") as logs:
+                    results.append([
+                        (cylinder, head, size, list(sectors))
+                        for cylinder, head, size, sectors in tool.iter_track_sectors(file,
+                            jobs=jobs, verbose=True)
+                    ])
+                results.append(logs.output)
+            self.assertEqual(results[0], results[2])
+            self.assertEqual(results[1], results[3])
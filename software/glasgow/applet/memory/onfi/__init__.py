@@ -75,10 +75,12 @@
 # planes, a multi-plane operation may affect any even and any odd block, and if the operation
 # is page-oriented, the offset into the block must be the same for both.
 
+import os
 import argparse
 import logging
 import asyncio
 import struct
+import collections
 from amaranth import *
 from amaranth.lib.cdc import FFSynchronizer
 
@@ -355,7 +357,7 @@ class ONFIInterface:
         self._log("read unique ID")
         return await self._do_read(command=0xED, address=[0x00], wait=True, length=32)
 
-    async def read(self, row, column, length):
+    async def _read_request(self, row, column, length):
         self._log("read row=%#08x column=%#06x", row, column)
         await self._do(command=0x00, address=[
             (column >>  0) & 0xff,
@@ -364,7 +366,33 @@ class ONFIInterface:
             (row >>  8) & 0xff,
             (row >> 16) & 0xff,
         ])
-        return await self._do_read(command=0x30, wait=True, length=length)
+        await self._do(command=0x30, wait=True)
+        await self._read(length)
+
+    async def _read_response(self, length):
+        data = await self.lower.read(length)
+        self._log("read data=<%s>", dump_hex(data))
+        return data
+
+    async def read(self, row, column, length):
+        await self._read_request(row, column, length)
+        return await self._read_response(length)
+
+    # The number of page reads that are queued ahead of the one being received. Each queued read
+    # is only a few dozen bytes of commands, and keeping them in the OUT FIFO means that the applet
+    # starts the next page read as soon as the previous page is transferred, instead of waiting
+    # for a USB round trip to the host and back.
+    _read_pipeline_depth = 8
+
+    async def read_pages(self, row, count, length):
+        pending = collections.deque()
+        queued  = 0
+        while queued < count or pending:
+            while queued < count and len(pending) < self._read_pipeline_depth:
+                await self._read_request(row + queued, column=0, length=length)
+                pending.append(row + queued)
+                queued += 1
+            yield pending.popleft(), await self._read_response(length)
 
     async def program(self, row, chunks):
         self._log("program row=%#08x", row)
@@ -398,6 +426,21 @@ class ONFIInterface:
         return (await self.read_status() & BIT_STATUS_FAIL) == 0
 
 
+def _preallocate(file, size):
+    # Reserving the space for a dump upfront avoids fragmenting the output file and growing it
+    # one page at a time, which matters for multi-gigabyte dumps. Pipes (e.g. `-` for standard
+    # output) cannot be preallocated, and are written sequentially.
+    if not file.seekable():
+        return
+    if hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(file.fileno(), 0, size)
+            return
+        except OSError:
+            pass # not supported by the filesystem
+    file.truncate(size)
+
+
 class MemoryONFIApplet(GlasgowApplet):
     preview = True
     logger = logging.getLogger(__name__)
@@ -704,23 +747,29 @@ class MemoryONFIApplet(GlasgowApplet):
                 return
 
         if args.operation == "read":
-            row   = args.start_page
-            count = args.count
-            while count > 0:
-                self.logger.info("reading page (row) %d", row)
-                chunk = await onfi_iface.read(column=0, row=row, length=page_size + spare_size)
-
-                if args.spare_file:
-                    args.data_file.write(chunk[:page_size])
-                    args.data_file.flush()
-                    args.spare_file.write(chunk[-spare_size:])
-                    args.spare_file.flush()
-                else:
-                    args.data_file.write(chunk)
-                    args.data_file.flush()
+            if args.spare_file:
+                _preallocate(args.data_file, args.count * page_size)
+                _preallocate(args.spare_file, args.count * spare_size)
+            else:
+                _preallocate(args.data_file, args.count * (page_size + spare_size))
 
-                row   += 1
-                count -= 1
+            try:
+                async for row, chunk in onfi_iface.read_pages(args.start_page, args.count,
+                                                              length=page_size + spare_size):
+                    if row % block_size == 0 or row == args.start_page:
+                        self.logger.info("reading block %d (row %d)", row // block_size, row)
+
+                    if args.spare_file:
+                        args.data_file.write(chunk[:page_size])
+                        args.spare_file.write(chunk[page_size:])
+                    else:
+                        args.data_file.write(chunk)
+            finally:
+                for file in filter(None, (args.data_file, args.spare_file)):
+                    if file.seekable():
+                        # if the dump was interrupted, drop the preallocated space after it
+                        file.truncate()
+                    file.flush()
 
         if args.operation == "program":
             row   = args.start_page
@@ -1,5 +1,75 @@
+import logging
+import struct
+import unittest
+
 from ... import *
-from . import MemoryONFIApplet
+from . import CMD_CONTROL, CMD_WRITE, CMD_READ, CMD_WAIT, BIT_CLE, BIT_ALE
+from . import ONFIInterface, MemoryONFIApplet
+
+
+class _FakeNAND:
+    # Behaves like the demultiplexer interface of `MemoryONFISubtarget` connected to a memory
+    # that implements Read, with 5 address cycles.
+    def __init__(self, pages):
+        self.pages     = pages
+        self.buffer    = bytearray()
+        self.control   = 0
+        self.commands  = []
+        self.address   = bytearray()
+        self.page      = None
+        self.responses = MockResponseQueue()
+
+    async def write(self, data):
+        self.buffer += data
+
+    async def read(self, length):
+        while self.buffer:
+            command = self.buffer.pop(0)
+            if command == CMD_CONTROL:
+                self.control = self.buffer.pop(0)
+            elif command == CMD_WRITE:
+                length_, = struct.unpack_from("<H", self.buffer)
+                data = bytes(self.buffer[2:2 + length_])
+                del self.buffer[:2 + length_]
+                if self.control & BIT_CLE:
+                    self.commands.append(data[0])
+                    if data[0] == 0x30:
+                        row = int.from_bytes(self.address[2:5], "little")
+                        column = int.from_bytes(self.address[0:2], "little")
+                        self.page = self.pages[row][column:]
+                        self.address.clear()
+                elif self.control & BIT_ALE:
+                    self.address += data
+            elif command == CMD_WAIT:
+                pass
+            elif command == CMD_READ:
+                length_, = struct.unpack_from("<H", self.buffer)
+                del self.buffer[:2]
+                self.responses.push(self.page[:length_])
+                self.page = self.page[length_:]
+            else:
+                assert False
+        return memoryview(self.responses.pop(length))
+
+
+class ONFIInterfaceTestCase(unittest.TestCase):
+    @async_test
+    async def test_read(self):
+        pages = [bytes([row]) * 16 for row in range(4)]
+        lower = _FakeNAND(pages)
+        onfi_iface = ONFIInterface(lower, logging.getLogger(__name__))
+        self.assertEqual(await onfi_iface.read(row=2, column=4, length=8), b"\x02" * 8)
+        self.assertEqual(lower.commands, [0x00, 0x30])
+
+    @async_test
+    async def test_read_pages(self):
+        pages = [bytes([row]) * 16 for row in range(32)]
+        lower = _FakeNAND(pages)
+        onfi_iface = ONFIInterface(lower, logging.getLogger(__name__))
+        self.assertEqual([(row, bytes(data))
+                          async for row, data in onfi_iface.read_pages(3, 20, length=16)],
+                         [(row, pages[row]) for row in range(3, 23)])
+        self.assertEqual(lower.responses.max_inflight, ONFIInterface._read_pipeline_depth)
 
 
 class MemoryONFIAppletTestCase(GlasgowAppletTestCase, applet=MemoryONFIApplet):
@@ -4,8 +4,10 @@
 import re
 import enum
 import math
+import mmap
 import json
 import random
+import contextlib
 import logging
 import asyncio
 import argparse
@@ -151,18 +153,21 @@ class _Command(enum.IntEnum):
     READ  = 0x04
     WRITE = 0x05
     POLL  = 0x06
+    READ_N = 0x07
 
 
 _COMMAND_BUFFER_SIZE = 1024
 
 
 class MemoryPROMSubtarget(Elaboratable):
-    def __init__(self, bus, in_fifo, out_fifo,
+    def __init__(self, bus, in_fifo, out_fifo, sys_clk_freq,
                  read_cycle_delay, write_cycle_delay, write_hold_delay):
         self.bus      = bus
         self.in_fifo  = in_fifo
         self.out_fifo = out_fifo
 
+        self._sys_clk_freq      = sys_clk_freq
+
         self._read_cycle_delay  = read_cycle_delay
         self._write_cycle_delay = write_cycle_delay
         self._write_hold_delay  = write_hold_delay
@@ -191,11 +196,14 @@ class MemoryPROMSubtarget(Elaboratable):
             dq_index = Signal(range(dq_bytes + 1))
             a_latch  = Signal(bus.a_bits)
             dq_latch = Signal(bus.dq_bits)
+            n_index  = Signal(range(3))
+            n_count  = Signal(16)
+            n_burst  = Signal()
 
-            read_cycle_cyc  = (math.ceil(self._read_cycle_delay * platform.default_clk_frequency)
+            read_cycle_cyc  = (math.ceil(self._read_cycle_delay * self._sys_clk_freq)
                                + 2) # FFSynchronizer latency
-            write_cycle_cyc = math.ceil(self._write_cycle_delay * platform.default_clk_frequency)
-            write_hold_cyc  = math.ceil(self._write_hold_delay  * platform.default_clk_frequency)
+            write_cycle_cyc = math.ceil(self._write_cycle_delay * self._sys_clk_freq)
+            write_hold_cyc  = math.ceil(self._write_hold_delay  * self._sys_clk_freq)
             timer = Signal(range(max(read_cycle_cyc, write_cycle_cyc, write_hold_cyc) + 1))
 
             with m.State("COMMAND"):
@@ -212,7 +220,11 @@ class MemoryPROMSubtarget(Elaboratable):
                             m.next = "SEEK-WAIT"
                         with m.Case(_Command.READ):
                             m.d.sync += dq_index.eq(0)
+                            m.d.sync += n_burst.eq(0)
                             m.next = "READ-PULSE"
+                        with m.Case(_Command.READ_N):
+                            m.d.sync += n_index.eq(0)
+                            m.next = "READ-N-RECV"
                         with m.Case(_Command.WRITE):
                             m.d.sync += dq_index.eq(0)
                             m.next = "WRITE-RECV"
@@ -249,6 +261,28 @@ class MemoryPROMSubtarget(Elaboratable):
                 with m.If(bus.rdy):
                     m.next = "COMMAND"
 
+            with m.State("READ-N-RECV"):
+                with m.If(n_index == 2):
+                    m.next = "READ-N-NEXT"
+                with m.Elif(cmd_fifo.r_rdy):
+                    m.d.comb += cmd_fifo.r_en.eq(1)
+                    m.d.sync += n_count.word_select(n_index, 8).eq(cmd_fifo.r_data)
+                    m.d.sync += n_index.eq(n_index + 1)
+
+            with m.State("READ-N-NEXT"):
+                # Equivalent to a sequence of `n_count` READ and INCR commands.
+                with m.If(n_count == 0):
+                    m.next = "COMMAND"
+                with m.Else():
+                    m.d.sync += dq_index.eq(0)
+                    m.d.sync += n_burst.eq(1)
+                    m.d.sync += n_count.eq(n_count - 1)
+                    m.next = "READ-PULSE"
+
+            with m.State("READ-N-WAIT"):
+                with m.If(bus.rdy):
+                    m.next = "READ-N-NEXT"
+
             with m.State("READ-PULSE"):
                 m.d.sync += bus.oe.eq(1)
                 m.d.sync += timer.eq(read_cycle_cyc)
@@ -269,7 +303,11 @@ class MemoryPROMSubtarget(Elaboratable):
 
             with m.State("READ-SEND"):
                 with m.If(dq_index == dq_bytes):
-                    m.next = "COMMAND"
+                    with m.If(n_burst):
+                        m.d.sync += bus.a.eq(bus.a + 1)
+                        m.next = "READ-N-WAIT"
+                    with m.Else():
+                        m.next = "COMMAND"
                 with m.Elif(in_fifo.w_rdy):
                     m.d.comb += in_fifo.w_en.eq(1)
                     m.d.comb += in_fifo.w_data.eq(dq_latch.word_select(dq_index, 8))
@@ -392,15 +430,24 @@ class MemoryPROMInterface:
     def _log(self, message, *args):
         self._logger.log(self._level, "PROM: " + message, *args)
 
+    @staticmethod
+    def _read_n(count):
+        commands = []
+        while count > 0:
+            chunk  = min(count, 0xffff)
+            count -= chunk
+            commands += [
+                _Command.READ_N,
+                *chunk.to_bytes(2, byteorder="little"),
+            ]
+        return commands
+
     async def read(self, address, count):
         self._log("read a=%#x n=%d", address, count)
         await self.lower.write([
             _Command.SEEK,
             *address.to_bytes(self.a_bytes, byteorder="little"),
-            *[
-                _Command.READ,
-                _Command.INCR,
-            ] * count,
+            *self._read_n(count),
         ])
 
         data = self.Data(await self.lower.read(count * self.dq_bytes), self.dq_bytes)
@@ -408,26 +455,29 @@ class MemoryPROMInterface:
                   dump_mapseq(" ", lambda q: f"{q:0{self.dq_bytes * 2}x}", data))
         return data
 
-    async def read_shuffled(self, address, count):
-        self._log("read shuffled a=%#x n=%d", address, count)
-        order = [offset for offset in range(count)]
+    async def read_shuffled(self, address, count, run_length=1):
+        self._log("read shuffled a=%#x n=%d run=%d", address, count, run_length)
+        order = [offset for offset in range(0, count, run_length)]
         random.shuffle(order)
         commands = []
         for offset in order:
             commands += [
                 _Command.SEEK,
                 *(address + offset).to_bytes(self.a_bytes, byteorder="little"),
-                _Command.READ,
+                *([_Command.READ] if run_length == 1 else
+                  self._read_n(min(run_length, count - offset))),
             ]
         await self.lower.write(commands)
 
-        linear_raw_chunks = [None for _ in range(count)]
+        linear_raw_data   = bytearray(count * self.dq_bytes)
         shuffled_raw_data = await self.lower.read(count * self.dq_bytes)
-        for shuffled_offset, linear_offset in enumerate(order):
-            linear_raw_chunks[linear_offset] = \
-                shuffled_raw_data[shuffled_offset * self.dq_bytes:
-                                 (shuffled_offset + 1) * self.dq_bytes]
-        data = self.Data(b"".join(linear_raw_chunks), self.dq_bytes)
+        shuffled_offset   = 0
+        for linear_offset in order:
+            size = min(run_length, count - linear_offset) * self.dq_bytes
+            linear_raw_data[linear_offset * self.dq_bytes:linear_offset * self.dq_bytes + size] = \
+                shuffled_raw_data[shuffled_offset:shuffled_offset + size]
+            shuffled_offset += size
+        data = self.Data(linear_raw_data, self.dq_bytes)
         self._log("read shuffled q=<%s>",
                   dump_mapseq(" ", lambda q: f"{q:0{self.dq_bytes * 2}x}", data))
         return data
@@ -469,6 +519,60 @@ class MemoryPROMInterface:
         await self.lower.read(1)
 
 
+def _popcount(raw_data):
+    # Converting the entire buffer to an integer is much faster than counting bits per word.
+    return bin(int.from_bytes(raw_data, byteorder="little")).count("1")
+
+
+def _instability_map(reference, samples, dq_bits, endian="little", rows=32):
+    """Compare ``samples`` against ``reference``, all of which are bytes-like objects (usually
+    memory-mapped dump files) containing words of ``dq_bits`` bits.
+
+    Returns a list of ``rows`` tuples ``(start, stop, counts)``, where ``start`` and ``stop`` are
+    the word range covered by the row, and ``counts[bit]`` is the amount of words within it where
+    the data bit ``bit`` differs from the reference in at least one of the samples.
+    """
+    if dq_bits < 1:
+        raise ValueError("word width {} is not positive".format(dq_bits))
+    if rows < 1:
+        raise ValueError("row count {} is not positive".format(rows))
+    dq_bytes = (dq_bits + 7) // 8
+    depth    = len(reference) // dq_bytes
+    for sample in samples:
+        if len(sample) != len(reference):
+            raise ValueError("sample size {} does not match reference size {}"
+                             .format(len(sample), len(reference)))
+
+    def lane_masks(words):
+        # For each data bit, a mask selecting that bit in every word of the row.
+        masks = []
+        for bit in range(dq_bits):
+            word_mask = (1 << bit).to_bytes(dq_bytes, byteorder=endian)
+            masks.append(int.from_bytes(word_mask * words, byteorder="little"))
+        return masks
+
+    result = []
+    masks  = {}
+    row_words = max(1, -(-depth // rows))
+    for start in range(0, depth, row_words):
+        stop = min(start + row_words, depth)
+        if stop - start not in masks:
+            masks[stop - start] = lane_masks(stop - start)
+
+        # Each word is processed as a slice of one huge integer, so that XOR and OR are done
+        # by the interpreter on the entire row at once.
+        offset, length = start * dq_bytes, (stop - start) * dq_bytes
+        reference_row = int.from_bytes(reference[offset:offset + length], byteorder="little")
+        unstable = 0
+        for sample in samples:
+            unstable |= reference_row ^ int.from_bytes(sample[offset:offset + length],
+                                                        byteorder="little")
+        result.append((start, stop, [
+            bin(unstable & mask).count("1") for mask in masks[stop - start]
+        ]))
+    return result
+
+
 class MemoryPROMApplet(GlasgowApplet):
     logger = logging.getLogger(__name__)
     help = "read and rescue parallel EPROMs, EEPROMs, and Flash memories"
@@ -541,6 +645,7 @@ class MemoryPROMApplet(GlasgowApplet):
             bus=bus,
             in_fifo=iface.get_in_fifo(auto_flush=False),
             out_fifo=iface.get_out_fifo(),
+            sys_clk_freq=target.sys_clk_freq,
             read_cycle_delay=1e-9 * args.read_cycle,
             write_cycle_delay=1e-9 * args.write_cycle,
             write_hold_delay=1e-9 * args.write_hold,
@@ -556,6 +661,11 @@ class MemoryPROMApplet(GlasgowApplet):
             return int(arg, 0)
         def length(arg):
             return int(arg, 0)
+        def run_length(arg):
+            value = int(arg)
+            if value < 1:
+                raise argparse.ArgumentTypeError(f"{arg} is not a positive run length")
+            return value
         def voltage_range(arg):
             m = re.match(r"^(\d+(?:\.\d*)?):(\d+(?:\.\d*)?)$", arg)
             if not m:
@@ -623,14 +733,23 @@ class MemoryPROMApplet(GlasgowApplet):
 
         p_health_mode = p_health.add_subparsers(dest="mode", metavar="MODE", required=True)
 
+        def add_run_length_argument(parser):
+            parser.add_argument(
+                "--run-length", metavar="WORDS", type=run_length, default=16,
+                help="read memory in shuffled runs of WORDS consecutive words; "
+                     "1 shuffles every word, at the cost of a much slower sample "
+                     "(default: %(default)s)")
+
         p_health_check = p_health_mode.add_parser(
             "check", help="quickly probe for unstable words in a memory")
+        add_run_length_argument(p_health_check)
         p_health_check.add_argument(
             "--samples", metavar="COUNT", type=int, default=5,
             help="read entire memory COUNT times (default: %(default)s)")
 
         p_health_scan = p_health_mode.add_parser(
             "scan", help="exhaustively detect unstable words in a memory")
+        add_run_length_argument(p_health_scan)
         p_health_scan.add_argument(
             "--confirmations", metavar="COUNT", type=int, default=10,
             help="read entire memory repeatedly until COUNT consecutive samples "
@@ -641,6 +760,7 @@ class MemoryPROMApplet(GlasgowApplet):
 
         p_health_sweep = p_health_mode.add_parser(
             "sweep", help="determine undervolt offset that prevents instability")
+        add_run_length_argument(p_health_sweep)
         p_health_sweep.add_argument(
             "--samples", metavar="COUNT", type=int, default=5,
             help="read entire memory COUNT times (default: %(default)s)")
@@ -650,6 +770,7 @@ class MemoryPROMApplet(GlasgowApplet):
 
         p_health_popcount = p_health_mode.add_parser(
             "popcount", help="sample population count for a voltage range")
+        add_run_length_argument(p_health_popcount)
         p_health_popcount.add_argument(
             "--samples", metavar="COUNT", type=int, default=5,
             help="average population count COUNT times (default: %(default)s)")
@@ -715,7 +836,7 @@ class MemoryPROMApplet(GlasgowApplet):
             for sample_num in range(args.samples):
                 self.logger.info("sample %d", sample_num)
 
-                current_data = await prom_iface.read_shuffled(0, depth)
+                current_data = await prom_iface.read_shuffled(0, depth, args.run_length)
                 current_unstable = initial_data.difference(current_data)
                 for index in sorted(set(current_unstable) - unstable):
                     self.logger.warning("word %#x unstable (%#x != %#x)",
@@ -738,7 +859,7 @@ class MemoryPROMApplet(GlasgowApplet):
                 sample_num += 1
                 consecutive += 1
 
-                current_data = await prom_iface.read_shuffled(0, depth)
+                current_data = await prom_iface.read_shuffled(0, depth, args.run_length)
                 current_unstable = initial_data.difference(current_data)
                 for index in sorted(set(current_unstable) - unstable):
                     self.logger.warning("word %#x unstable (%#x != %#x)",
@@ -769,7 +890,7 @@ class MemoryPROMApplet(GlasgowApplet):
                 initial_data = await prom_iface.read(0, depth)
                 for sample_num in range(args.samples):
                     self.logger.info("  sample %d", sample_num)
-                    current_data = await prom_iface.read_shuffled(0, depth)
+                    current_data = await prom_iface.read_shuffled(0, depth, args.run_length)
                     unstable = initial_data.difference(current_data)
                     for index in sorted(unstable):
                         self.logger.warning("word %#x unstable (%#x != %#x)",
@@ -789,8 +910,6 @@ class MemoryPROMApplet(GlasgowApplet):
 
         if args.operation == "health" and args.mode == "popcount":
             voltage_from, voltage_to = args.sweep
-            popcount_lut = [format(n, "b").count("1") for n in range(1 << dq_bits)]
-
             series = []
             voltage = voltage_from
             step_num = 0
@@ -801,8 +920,8 @@ class MemoryPROMApplet(GlasgowApplet):
                 popcounts = []
                 for sample_num in range(args.samples):
                     self.logger.info("  sample %d", sample_num)
-                    data = await prom_iface.read_shuffled(0, depth)
-                    popcounts.append(sum(popcount_lut[word] for word in data))
+                    data = await prom_iface.read_shuffled(0, depth, args.run_length)
+                    popcounts.append(_popcount(data.raw_data))
 
                 series.append((voltage, popcounts))
                 self.logger.info("population %d/%d",
@@ -848,6 +967,24 @@ class MemoryPROMAppletTool(GlasgowAppletTool, applet=MemoryPROMApplet):
             "file", metavar="FILENAME", type=argparse.FileType("rt"),
             help="read aggregated data from FILENAME")
 
+        p_instability = p_operation.add_parser(
+            "instability", help="plot unstable bits across several memory dumps")
+        p_instability.add_argument(
+            "-w", "--width", metavar="BITS", type=int, default=8,
+            help="interpret dumps as words of BITS bits (default: %(default)s)")
+        p_instability.add_argument(
+            "-e", "--endian", choices=("little", "big"), default="little",
+            help="interpret dumps with the specified endianness (default: %(default)s)")
+        p_instability.add_argument(
+            "--rows", metavar="COUNT", type=int, default=32,
+            help="split the address space into COUNT rows (default: %(default)s)")
+        p_instability.add_argument(
+            "reference", metavar="REFERENCE", type=argparse.FileType("rb"),
+            help="compare against the dump in REFERENCE")
+        p_instability.add_argument(
+            "samples", metavar="SAMPLE", type=argparse.FileType("rb"), nargs="+",
+            help="compare the dumps in SAMPLE files (produced with `read -f`)")
+
     async def run(self, args):
         if args.operation == "popcount":
             data = json.load(args.file)
@@ -868,3 +1005,33 @@ class MemoryPROMAppletTool(GlasgowAppletTool, applet=MemoryPROMApplet):
                 print(f"{voltage:.2f}: |{'1' * rectangle_size:{histogram_size}s}| "
                       f"({len(popcounts)}× {int(mean_popcount)}/{density}, "
                       f"sd {statistics.pstdev(popcounts):.2f})")
+
+        if args.operation == "instability":
+            with contextlib.ExitStack() as stack:
+                def map_file(file):
+                    if file.seek(0, 2) == 0:
+                        return b"" # empty files cannot be mapped
+                    return stack.enter_context(
+                        mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+
+                try:
+                    instability = _instability_map(
+                        map_file(args.reference), [map_file(sample) for sample in args.samples],
+                        args.width, args.endian, args.rows)
+                except ValueError as e:
+                    raise GlasgowAppletError(str(e))
+
+            # Each cell shows the fraction of words in the row where the bit is unstable.
+            shades = " .:-=+*#%@"
+            max_count = max((max(counts) for _, _, counts in instability), default=0)
+            total_counts = [0] * args.width
+            print(f"{'word':>8}  {''.join(f'{bit % 10}' for bit in reversed(range(args.width)))}")
+            for start, stop, counts in instability:
+                cells = "".join(
+                    shades[-(-count * (len(shades) - 1) // max_count) if max_count else 0]
+                    for count in reversed(counts))
+                print(f"{start:08x} |{cells}| {sum(counts)}/{(stop - start) * args.width}")
+                total_counts = [a + b for a, b in zip(total_counts, counts)]
+            for bit, count in enumerate(total_counts):
+                if count:
+                    print(f"bit {bit}: {count} unstable words")
@@ -1,8 +1,80 @@
+import types
+import unittest
+from amaranth import *
+
 from ... import *
-from . import MemoryPROMApplet
+from . import MemoryPROMApplet, _instability_map
 
 
 class MemoryPROMAppletTestCase(GlasgowAppletTestCase, applet=MemoryPROMApplet):
     @synthesis_test
     def test_build(self):
         self.assertBuilds()
+
+    def setup_rom(self):
+        self.build_simulated_applet()
+        pads = self.applet.mux_interface.pads
+
+        m = Module()
+        # A ROM where each word is derived from its address.
+        m.d.comb += pads.dq_t.i.eq(pads.a_t.o ^ 0x5a)
+        self.target.add_submodule(m)
+
+    @applet_simulation_test("setup_rom", ["--pins-a", "0:7", "--pins-dq", "8:15",
+                                          "--read-cycle", "50"])
+    @types.coroutine
+    def test_read(self):
+        prom_iface = yield from self.run_simulated_applet()
+
+        data = yield from prom_iface.read(0xf0, 32)
+        self.assertEqual(list(data), [(address & 0xff) ^ 0x5a for address in range(0xf0, 0x110)])
+
+    @applet_simulation_test("setup_rom", ["--pins-a", "0:7", "--pins-dq", "8:15",
+                                          "--read-cycle", "50"])
+    @types.coroutine
+    def test_read_shuffled(self):
+        prom_iface = yield from self.run_simulated_applet()
+
+        data = yield from prom_iface.read_shuffled(0x10, 37, run_length=8)
+        self.assertEqual(list(data), [address ^ 0x5a for address in range(0x10, 0x35)])
+        data = yield from prom_iface.read_shuffled(0x10, 5)
+        self.assertEqual(list(data), [address ^ 0x5a for address in range(0x10, 0x15)])
+
+
+class InstabilityMapTestCase(unittest.TestCase):
+    def test_bytes(self):
+        reference = bytes(range(16))
+        sample_1  = bytearray(reference)
+        sample_1[1]  ^= 0x01
+        sample_1[14] ^= 0x81
+        sample_2  = bytearray(reference)
+        sample_2[1]  ^= 0x01
+        sample_2[2]  ^= 0x01
+        self.assertEqual(_instability_map(reference, [sample_1, sample_2], 8, rows=2), [
+            (0,  8, [2, 0, 0, 0, 0, 0, 0, 0]),
+            (8, 16, [1, 0, 0, 0, 0, 0, 0, 1]),
+        ])
+
+    def test_words(self):
+        reference = bytes(12)
+        sample    = bytearray(reference)
+        sample[0] ^= 0x04 # word 0, bit 2
+        sample[5] ^= 0x02 # word 2, bit 9
+        self.assertEqual(_instability_map(reference, [sample], 10, rows=4), [
+            (0, 2, [0, 0, 1, 0, 0, 0, 0, 0, 0, 0]),
+            (2, 4, [0, 0, 0, 0, 0, 0, 0, 0, 0, 1]),
+            (4, 6, [0, 0, 0, 0, 0, 0, 0, 0, 0, 0]),
+        ])
+        self.assertEqual(_instability_map(reference, [sample], 10, "big", rows=1), [
+            (0, 6, [0, 1, 0, 0, 0, 0, 0, 0, 0, 0]),
+        ])
+
+    def test_size_mismatch(self):
+        with self.assertRaisesRegex(ValueError, r"sample size 2 does not match"):
+            _instability_map(b"\x00", [b"\x00\x00"], 8)
+
+    def test_invalid_geometry(self):
+        with self.assertRaisesRegex(ValueError, r"^row count 0 is not positive$"):
+            _instability_map(b"\x00", [b"\x00"], 8, rows=0)
+        with self.assertRaisesRegex(ValueError, r"^word width 0 is not positive$"):
+            _instability_map(b"\x00", [b"\x00"], 0)
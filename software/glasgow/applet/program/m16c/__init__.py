@@ -132,16 +132,20 @@ class ProgramM16CInterface:
 
     async def reset_application(self):
         self._log("reset mode=application")
-        await self.lower.device.write_register(self._addr_reset, 1)
-        await self.lower.device.write_register(self._addr_mode, 0)
-        await self.lower.device.write_register(self._addr_reset, 0)
+        await self.lower.device.access_registers([
+            (self._addr_reset, 1, 1),
+            (self._addr_mode,  0, 1),
+            (self._addr_reset, 0, 1),
+        ])
         await self.lower.reset()
 
     async def reset_bootloader(self):
         self._log("reset mode=bootloader")
-        await self.lower.device.write_register(self._addr_reset, 1)
-        await self.lower.device.write_register(self._addr_mode, 1)
-        await self.lower.device.write_register(self._addr_reset, 0)
+        await self.lower.device.access_registers([
+            (self._addr_reset, 1, 1),
+            (self._addr_mode,  1, 1),
+            (self._addr_reset, 0, 1),
+        ])
         await self.lower.reset()
         await asyncio.sleep(0.150) # make sure it's out of reset
 
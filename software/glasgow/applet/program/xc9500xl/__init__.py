@@ -419,10 +419,16 @@ class XC95xxXLInterface:
             await self._dr_isconfiguration(CTRL_START, 0)
             await self.lower.write_ir(IR_FVFYI)
             for row in range(BS_ROWS):
+                # Receive the entire row in a single round trip.
+                row_bits = []
                 for col in range(BS_COLS):
                     await self.lower.run_test_idle(1)
                     last = row == BS_ROWS - 1 and col == BS_COLS - 1
-                    res = await self._dr_isdata(CTRL_OK if last else CTRL_START)
+                    isdata = self.DR_ISDATA(control=CTRL_OK if last else CTRL_START, data=0)
+                    row_bits.append(await self.lower.exchange_dr(isdata.to_bits(), defer=True))
+                await self.lower.flush()
+                for col, isdata_bits in enumerate(row_bits):
+                    res = self.DR_ISDATA.from_bits(isdata_bits.result())
                     if res.control != CTRL_OK:
                         raise XC9500XLError(f"fast read failed {res.bits_repr()} at ({row}, {col})")
                     bs.put_word(row, col, res.data)
@@ -38,8 +38,7 @@ class INA260I2CInterface:
         self._level    = logging.DEBUG if self._logger.name == __name__ else logging.TRACE
 
     async def _read_reg16u(self, reg):
-        await self.lower.write(self._i2c_addr, [reg])
-        result = await self.lower.read(self._i2c_addr, 2)
+        result = await self.lower.write_read(self._i2c_addr, [reg], 2)
         if result is None:
             raise INA260Error("INA260 did not acknowledge I2C read at address {:#07b}"
                               .format(self._i2c_addr))
@@ -49,8 +48,7 @@ class INA260I2CInterface:
         return raw
 
     async def _read_reg16s(self, reg):
-        await self.lower.write(self._i2c_addr, [reg])
-        result = await self.lower.read(self._i2c_addr, 2)
+        result = await self.lower.write_read(self._i2c_addr, [reg], 2)
         if result is None:
             raise INA260Error("INA260 did not acknowledge I2C read at address {:#07b}"
                               .format(self._i2c_addr))
@@ -1,11 +1,13 @@
 import os
 import sys
 import ast
+import time
 import platform
 import logging
 import argparse
 import textwrap
 import re
+import shlex
 import asyncio
 import signal
 import unittest
@@ -23,9 +25,9 @@ from .support.plugin import PluginRequirementsUnmet, PluginLoadError
 from .device import GlasgowDeviceError
 from .device.config import GlasgowConfig
 from .target.toolchain import ToolchainNotFound
-from .target.hardware import GlasgowHardwareTarget
+from .target.hardware import GlasgowHardwareTarget, build_bitstreams
 from .gateware import GatewareBuildError
-from .gateware.analyzer import TraceDecoder
+from .gateware.analyzer import TraceDecoder, THROTTLE_SOURCE
 from .device.hardware import VID_QIHW, PID_GLASGOW, GlasgowHardwareDevice
 from .access.direct import *
 from .applet import *
@@ -116,6 +118,26 @@ def create_argparser():
     return parser
 
 
+class _LazySubParsersAction(argparse._SubParsersAction):
+    # Adding the arguments of every applet requires loading every applet, which takes most of
+    # the time spent starting up. Instead, only the arguments of the applet that is selected on
+    # the command line are added, right before its subparser is invoked.
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._populate_callbacks = {}
+
+    def add_lazy_parser(self, name, populate, **kwargs):
+        parser = self.add_parser(name, **kwargs)
+        self._populate_callbacks[name] = (parser, populate)
+        return parser
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        if (populate_callback := self._populate_callbacks.pop(values[0], None)) is not None:
+            subparser, populate = populate_callback
+            populate(subparser)
+        super().__call__(parser, namespace, values, option_string)
+
+
 def get_argparser():
     def add_subparsers(parser, **kwargs):
         if isinstance(parser, argparse._MutuallyExclusiveGroup):
@@ -126,18 +148,21 @@ def get_argparser():
                 kwargs['prog'] = formatter.format_help().strip()
 
             parsers_class = parser._pop_action_class(kwargs, 'parsers')
-            subparsers = argparse._SubParsersAction(option_strings=[],
-                                                    parser_class=type(container),
-                                                    **kwargs)
+            subparsers = parsers_class(option_strings=[],
+                                       parser_class=type(container),
+                                       **kwargs)
             parser._add_action(subparsers)
         else:
             subparsers = parser.add_subparsers(**kwargs)
         return subparsers
 
+    applets = GlasgowAppletMetadata.all()
+
     def add_applet_arg(parser, mode, required=False):
-        subparsers = add_subparsers(parser, dest="applet", metavar="APPLET", required=required)
+        subparsers = add_subparsers(parser, dest="applet", metavar="APPLET", required=required,
+                                    action=_LazySubParsersAction)
 
-        for handle, metadata in GlasgowAppletMetadata.all().items():
+        for handle, metadata in applets.items():
             if not metadata.loadable:
                 # fantastically cursed
                 p_applet = subparsers.add_parser(
@@ -147,65 +172,71 @@ def get_argparser():
                 p_applet.add_argument("help", nargs="?", default=p_applet.format_help())
                 continue
 
-            applet_cls = metadata.applet_cls
-
-            if mode == "test" and applet_cls.tests() is None:
+            if mode == "test" and not metadata.has_tests:
                 continue
-            if mode == "tool" and not hasattr(applet_cls, "tool_cls"):
+            if mode == "tool" and not metadata.has_tool:
                 continue
 
             if mode == "tool":
-                help        = applet_cls.tool_cls.help
-                description = applet_cls.tool_cls.description
+                help        = metadata.tool_synopsis
+                description = metadata.tool_description
             else:
-                help        = applet_cls.help
-                description = applet_cls.description
-            if applet_cls.preview:
+                help        = metadata.synopsis
+                description = metadata.description
+            if metadata.preview:
                 help += " (PREVIEW QUALITY APPLET)"
                 description = "    This applet is PREVIEW QUALITY and may CORRUPT DATA or " \
                               "have missing features. Use at your own risk.\n" + description
-            if applet_cls.required_revision > "A0":
-                help += f" (rev{applet_cls.required_revision}+)"
+            if metadata.required_revision > "A0":
+                help += f" (rev{metadata.required_revision}+)"
                 description += "\n    This applet requires Glasgow rev{} or later." \
-                               .format(applet_cls.required_revision)
-
-            p_applet = subparsers.add_parser(
-                handle, help=help, description=description,
-                formatter_class=TextHelpFormatter)
-
-            if mode == "test":
-                p_applet.add_argument(
-                    "tests", metavar="TEST", nargs="*",
-                    help="test cases to run")
-
-            if mode in ("build", "interact", "repl", "script"):
-                access_args = DirectArguments(applet_name=handle,
-                                              default_port="AB",
-                                              pin_count=16)
-                if mode in ("interact", "repl", "script"):
-                    g_applet_build = p_applet.add_argument_group("build arguments")
-                    applet_cls.add_build_arguments(g_applet_build, access_args)
-                    g_applet_run = p_applet.add_argument_group("run arguments")
-                    applet_cls.add_run_arguments(g_applet_run, access_args)
-                    if mode == "interact":
-                        # FIXME: this makes it impossible to add subparsers in applets
-                        # g_applet_interact = p_applet.add_argument_group("interact arguments")
-                        # applet.add_interact_arguments(g_applet_interact)
-                        applet_cls.add_interact_arguments(p_applet)
-                    if mode == "repl":
-                        # FIXME: same as above
-                        applet_cls.add_repl_arguments(p_applet)
-                if mode == "build":
-                    applet_cls.add_build_arguments(p_applet, access_args)
+                               .format(metadata.required_revision)
 
-            if mode == "tool":
-                applet_cls.tool_cls.add_arguments(p_applet)
+            subparsers.add_lazy_parser(
+                handle, lambda p_applet, handle=handle, metadata=metadata:
+                    add_applet_args(p_applet, mode, handle, metadata),
+                help=help, description=description, formatter_class=TextHelpFormatter)
 
-            if mode in ("repl", "script"):
-                # this will absorb all arguments from the '--' onwards (inclusive), make sure it's
-                # always last... the '--' item that ends up at the front is removed before the list
-                # is passed to the repo / script environment
-                p_applet.add_argument('script_args', nargs=argparse.REMAINDER)
+    def add_applet_args(p_applet, mode, handle, metadata):
+        try:
+            applet_cls = metadata.applet_cls
+        except PluginLoadError as e:
+            # the applet was loadable when it was cached, but isn't anymore
+            p_applet.error(f"{e}:{metadata.description}")
+
+        if mode == "test":
+            p_applet.add_argument(
+                "tests", metavar="TEST", nargs="*",
+                help="test cases to run")
+
+        if mode in ("build", "interact", "repl", "script"):
+            access_args = DirectArguments(applet_name=handle,
+                                          default_port="AB",
+                                          pin_count=16)
+            if mode in ("interact", "repl", "script"):
+                g_applet_build = p_applet.add_argument_group("build arguments")
+                applet_cls.add_build_arguments(g_applet_build, access_args)
+                g_applet_run = p_applet.add_argument_group("run arguments")
+                applet_cls.add_run_arguments(g_applet_run, access_args)
+                if mode == "interact":
+                    # FIXME: this makes it impossible to add subparsers in applets
+                    # g_applet_interact = p_applet.add_argument_group("interact arguments")
+                    # applet.add_interact_arguments(g_applet_interact)
+                    applet_cls.add_interact_arguments(p_applet)
+                if mode == "repl":
+                    # FIXME: same as above
+                    applet_cls.add_repl_arguments(p_applet)
+            if mode == "build":
+                applet_cls.add_build_arguments(p_applet, access_args)
+
+        if mode == "tool":
+            applet_cls.tool_cls.add_arguments(p_applet)
+
+        if mode in ("repl", "script"):
+            # this will absorb all arguments from the '--' onwards (inclusive), make sure it's
+            # always last... the '--' item that ends up at the front is removed before the list
+            # is passed to the repo / script environment
+            p_applet.add_argument('script_args', nargs=argparse.REMAINDER)
 
     parser = create_argparser()
 
@@ -287,6 +318,9 @@ def get_argparser():
         parser.add_argument(
             "--trace", metavar="VCD-FILE", type=argparse.FileType("wt"),
             help="trace applet I/O to VCD-FILE")
+        parser.add_argument(
+            "--measure", default=False, action="store_true",
+            help="log how long device enumeration, bitstream download, and applet startup take")
 
     p_run = subparsers.add_parser(
         "run", formatter_class=TextHelpFormatter,
@@ -358,7 +392,21 @@ def get_argparser():
     p_build.add_argument(
         "-f", "--filename", metavar="FILENAME", type=str,
         help="file to save artifact to (default: <applet-name>.{zip,il,bin})")
-    add_applet_arg(p_build, mode="build", required=True)
+    p_build.add_argument(
+        "--prewarm", metavar="FILENAME", type=argparse.FileType("r"),
+        help="build bitstreams into the cache for each line of applet arguments "
+             "(e.g. `uart --parity even`) in the specified file, without saving them")
+
+    def job_count(arg):
+        count = int(arg)
+        if count < 1:
+            raise argparse.ArgumentTypeError(f"{arg} is not a positive job count")
+        return count
+
+    p_build.add_argument(
+        "-j", "--jobs", metavar="COUNT", type=job_count, default=None,
+        help="run at most COUNT builds at once with --prewarm (default: number of CPU cores)")
+    add_applet_arg(p_build, mode="build")
 
     p_test = subparsers.add_parser(
         "test", formatter_class=TextHelpFormatter,
@@ -515,10 +563,16 @@ async def main():
     args = get_argparser().parse_args()
     configure_logger(args, term_handler)
 
+    def measure(stage, started_at):
+        if getattr(args, "measure", False):
+            logger.info("%s took %.3f s", stage, time.perf_counter() - started_at)
+
     device = None
     try:
         if args.action not in ("build", "test", "tool", "factory", "list"):
+            started_at = time.perf_counter()
             device = GlasgowHardwareDevice(args.serial)
+            measure("device enumeration", started_at)
 
         if args.action == "voltage":
             if args.voltage is not None:
@@ -569,19 +623,22 @@ async def main():
             device.demultiplexer = DirectDemultiplexer(device, target.multiplexer.pipe_count)
             plan = target.build_plan()
 
+            started_at = time.perf_counter()
             if args.prebuilt or args.bitstream:
                 bitstream_file = args.bitstream or open(f"{args.applet}.bin", "rb")
                 with bitstream_file:
                     await device.download_prebuilt(plan, bitstream_file)
             else:
                 await device.download_target(plan, reload=args.reload)
+            measure("bitstream download", started_at)
 
             do_trace = hasattr(args, "trace") and args.trace
             if do_trace:
                 logger.info("starting applet analyzer")
                 await device.write_register(target.analyzer.addr_done, 0)
                 analyzer_iface = await device.demultiplexer.claim_interface(
-                    target.analyzer, target.analyzer.mux_interface, args=None)
+                    target.analyzer, target.analyzer.mux_interface, args=None,
+                    profile="throughput")
                 trace_decoder = TraceDecoder(target.analyzer.event_sources)
                 # Use the coarsest possible timescale to improve performance with sigrok.
                 vcd_writer = VCDWriter(args.trace, timescale="10 ns", check_values=False,
@@ -611,35 +668,61 @@ async def main():
                         scope="", name=field_name, var_type=var_type,
                         size=field_width, init=var_init)
                     if field_trigger == "strobe":
-                        strobes.add(field_name)
+                        strobes.add(signals[field_name])
+
+                # for each event source: VCD variable, offset, and width of each field
+                source_fields = {THROTTLE_SOURCE: [(signals["throttle"], 0, 1)]}
+                for source, event_src in enumerate(trace_decoder.event_sources):
+                    if event_src.fields:
+                        source_fields[source] = []
+                        offset = 0
+                        for field_name, field_width in event_src.fields:
+                            source_fields[source].append(
+                                (signals[f"{field_name}-{event_src.name}"], offset, field_width))
+                            offset += field_width
+                    else:
+                        source_fields[source] = [(signals[event_src.name], 0, event_src.width)]
 
                 init = True
+                last_cycle = None
+                timestamp = next_timestamp = 0
                 while not trace_decoder.is_done():
                     trace_decoder.process(await analyzer_iface.read())
-                    for cycle, events in trace_decoder.flush():
-                        if events == "overrun":
-                            target.analyzer.logger.error("FIFO overrun, shutting down")
-
-                            for name in signals:
-                                vcd_writer.change(signals[name], next_timestamp, "x")
-                            next_timestamp += 100 # 1us
-                            break
-
-                        event_repr = " ".join(f"{n}={v}"
-                                              for n, v in events.items())
-                        target.analyzer.logger.trace("cycle %d: %s", cycle, event_repr)
-
-                        timestamp      = int(1e8 * (cycle + 0) // target.sys_clk_freq)
-                        next_timestamp = int(1e8 * (cycle + 1) // target.sys_clk_freq)
-                        if init:
-                            init = False
-                            vcd_writer._timestamp = timestamp
-                        for name, value in events.items():
-                            vcd_writer.change(signals[name], timestamp, value)
-                        for name, _value in events.items():
-                            if name in strobes:
-                                vcd_writer.change(signals[name], next_timestamp, "z")
-                        vcd_writer.flush()
+                    batch = trace_decoder.flush_batch()
+                    strobe_signals = []
+                    for cycle, source, value in batch:
+                        if cycle != last_cycle:
+                            for signal in strobe_signals:
+                                vcd_writer.change(signal, next_timestamp, "z")
+                            strobe_signals.clear()
+                            last_cycle = cycle
+
+                            timestamp      = int(1e8 * (cycle + 0) // target.sys_clk_freq)
+                            next_timestamp = int(1e8 * (cycle + 1) // target.sys_clk_freq)
+                            if init:
+                                init = False
+                                vcd_writer._timestamp = timestamp
+
+                        target.analyzer.logger.trace("cycle %d: source %d value %#x",
+                                                     cycle, source, value)
+                        for signal, offset, width in source_fields[source]:
+                            if width == 0:
+                                vcd_writer.change(signal, timestamp, True)
+                            else:
+                                vcd_writer.change(signal, timestamp,
+                                                  (value >> offset) & ((1 << width) - 1))
+                                if signal in strobes:
+                                    strobe_signals.append(signal)
+                    for signal in strobe_signals:
+                        vcd_writer.change(signal, next_timestamp, "z")
+
+                    if batch.end == "overrun":
+                        target.analyzer.logger.error("FIFO overrun, shutting down")
+
+                        for name in signals:
+                            vcd_writer.change(signals[name], next_timestamp, "x")
+                        next_timestamp += 100 # 1us
+                    vcd_writer.flush()
 
                 vcd_writer.close(next_timestamp)
 
@@ -648,7 +731,9 @@ async def main():
                 if applet.preview:
                     logger.warning("applet %r is PREVIEW QUALITY and may CORRUPT DATA", args.applet)
                 try:
+                    started_at = time.perf_counter()
                     iface = await applet.run(device, args)
+                    measure("applet startup", started_at)
                     if args.action in ("repl", "script"):
                         if len(args.script_args) > 0 and args.script_args[0] == "--":
                             args.script_args = args.script_args[1:]
@@ -818,7 +903,34 @@ async def main():
             else:
                 logger.info("configuration and firmware identical")
 
-        if args.action == "build":
+        if args.action == "build" and args.prewarm:
+            if args.applet is not None:
+                logger.error("an applet may not be specified together with --prewarm")
+                return 1
+            parser = get_argparser()
+            plans = {}
+            for line in args.prewarm:
+                build_args = shlex.split(line, comments=True)
+                if not build_args:
+                    continue
+                prewarm_args = parser.parse_args([
+                    "build", "--rev", args.rev,
+                    *(["--override-required-revision"] if args.override_required_revision else []),
+                    *build_args
+                ])
+                if prewarm_args.applet is None:
+                    logger.error("no applet specified in prewarm line %r", line.strip())
+                    return 1
+                target, applet = _applet(args.rev, prewarm_args)
+                plans[shlex.join(build_args)] = target.build_plan()
+            logger.info("prewarming %d bitstreams using %d jobs",
+                        len(plans), args.jobs or os.cpu_count())
+            build_bitstreams(plans, jobs=args.jobs)
+
+        elif args.action == "build":
+            if args.applet is None:
+                logger.error("an applet must be specified")
+                return 1
             target, applet = _applet(args.rev, args)
             plan = target.build_plan()
             if args.type in ("il", "rtlil"):
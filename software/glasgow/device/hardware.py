@@ -46,6 +46,9 @@ ST_ALERT         = 1<<2
 IO_BUF_A         = 1<<0
 IO_BUF_B         = 1<<1
 
+# How many REQ_FPGA_CFG requests are submitted at once while downloading a bitstream.
+_fpga_cfg_chunks_in_flight = 8
+
 
 class _PollerThread(threading.Thread):
     def __init__(self, context):
@@ -232,6 +235,8 @@ class GlasgowHardwareDevice:
         device_serial = self.usb_handle.getASCIIStringDescriptor(
             usb_device.getSerialNumberDescriptor())
         self._serial = device_serial
+        self._transfer_pools = {}
+        self._register_shadow = {}
         self._modified_design = not device_product.startswith("Glasgow Interface Explorer")
         if (device_manufacturer == "1BitSquared" and
                 device_serial in quirks.modified_design_1b2_mar2024):
@@ -250,19 +255,54 @@ class GlasgowHardwareDevice:
     def modified_design(self):
         return self._modified_design
 
+    @property
+    def transfer_pooling(self):
+        """
+        Whether libusb transfer objects are reused between transfers to the same endpoint.
+
+        Allocating a transfer object is expensive compared to the rest of the work done for each
+        transfer, so this is enabled by default; it can be disabled to measure its effect.
+        """
+        return self._transfer_pools is not None
+
+    @transfer_pooling.setter
+    def transfer_pooling(self, enabled):
+        if not enabled and self._transfer_pools is not None:
+            for pool in self._transfer_pools.values():
+                for transfer in pool:
+                    transfer.close()
+            self._transfer_pools = None
+        elif enabled and self._transfer_pools is None:
+            self._transfer_pools = {}
+
     def close(self):
+        self.transfer_pooling = False
         self.usb_handle.close()
         self.usb_poller.stop()
         self.usb_context.close()
 
-    async def _do_transfer(self, is_read, setup):
+    def _get_transfer(self, endpoint):
+        if self._transfer_pools is not None:
+            pool = self._transfer_pools.get(endpoint)
+            if pool:
+                return pool.pop()
+        return self.usb_handle.getTransfer()
+
+    def _put_transfer(self, endpoint, transfer):
+        if self._transfer_pools is not None:
+            self._transfer_pools.setdefault(endpoint, []).append(transfer)
+
+    async def _do_transfer(self, endpoint, is_read, setup, in_place=False):
         # libusb transfer cancellation is asynchronous, and moreover, it is necessary to wait for
         # all transfers to finish cancelling before closing the event loop. To do this, use
         # separate futures for result and cancel.
         cancel_future = asyncio.Future()
         result_future = asyncio.Future()
 
-        transfer = self.usb_handle.getTransfer()
+        # Transfers are taken from (and returned to) a per-endpoint pool, since they are only
+        # ever used for one endpoint at a time, and this keeps the pools small. The transfer is
+        # completely reinitialized by `setup` (and `setCallback`) before being resubmitted.
+        transfer = self._get_transfer(endpoint)
         setup(transfer)
 
         def usb_callback(transfer):
@@ -289,7 +329,11 @@ class GlasgowHardwareDevice:
             elif result_future.cancelled():
                 pass
             elif status == usb1.TRANSFER_COMPLETED:
-                if is_read:
+                if is_read and in_place:
+                    # The caller provided the buffer, and only needs to know how much of it
+                    # has been filled; avoid copying the data.
+                    result_future.set_result(transfer.getActualLength())
+                elif is_read:
                     result_future.set_result(transfer.getBuffer()[:transfer.getActualLength()])
                 else:
                     result_future.set_result(None)
@@ -317,14 +361,19 @@ class GlasgowHardwareDevice:
                 try:
                     handle_usb_error(lambda: transfer.cancel())
                     await cancel_future
+                    self._put_transfer(endpoint, transfer)
                 except usb1.USBErrorNotFound:
                     pass # already finished, one way or another
+            else:
+                # The callback has already run, so the transfer will not be touched by libusb
+                # or by this function anymore, and it can be reused.
+                self._put_transfer(endpoint, transfer)
 
     async def control_read(self, request_type, request, value, index, length):
         logger.trace("USB: CONTROL IN type=%#04x request=%#04x "
                      "value=%#06x index=%#06x length=%d (submit)",
                      request_type, request, value, index, length)
-        data = await self._do_transfer(is_read=True, setup=lambda transfer:
+        data = await self._do_transfer(0, is_read=True, setup=lambda transfer:
             transfer.setControl(request_type|usb1.ENDPOINT_IN, request, value, index, length))
         logger.trace("USB: CONTROL IN data=<%s> (completed)", dump_hex(data))
         return data
@@ -335,22 +384,34 @@ class GlasgowHardwareDevice:
         logger.trace("USB: CONTROL OUT type=%#04x request=%#04x "
                      "value=%#06x index=%#06x data=<%s> (submit)",
                      request_type, request, value, index, dump_hex(data))
-        await self._do_transfer(is_read=False, setup=lambda transfer:
+        await self._do_transfer(0, is_read=False, setup=lambda transfer:
             transfer.setControl(request_type|usb1.ENDPOINT_OUT, request, value, index, data))
         logger.trace("USB: CONTROL OUT (completed)")
 
     async def bulk_read(self, endpoint, length):
         logger.trace("USB: BULK EP%d IN length=%d (submit)", endpoint & 0x7f, length)
-        data = await self._do_transfer(is_read=True, setup=lambda transfer:
-            transfer.setBulk(endpoint|usb1.ENDPOINT_IN, length))
+        data = await self._do_transfer(endpoint|usb1.ENDPOINT_IN, is_read=True,
+            setup=lambda transfer: transfer.setBulk(endpoint|usb1.ENDPOINT_IN, length))
         logger.trace("USB: BULK EP%d IN data=<%s> (completed)", endpoint & 0x7f, dump_hex(data))
         return data
 
+    async def bulk_read_into(self, endpoint, buffer):
+        """
+        Read at most ``len(buffer)`` bytes from ``endpoint`` directly into ``buffer``, which must
+        be a writable bytes-like object (e.g. a ``bytearray``). Returns the amount of bytes read.
+        """
+        logger.trace("USB: BULK EP%d IN length=%d (submit)", endpoint & 0x7f, len(buffer))
+        length = await self._do_transfer(endpoint|usb1.ENDPOINT_IN, is_read=True, in_place=True,
+            setup=lambda transfer: transfer.setBulk(endpoint|usb1.ENDPOINT_IN, buffer))
+        logger.trace("USB: BULK EP%d IN data=<%s> (completed)", endpoint & 0x7f,
+                     dump_hex(memoryview(buffer)[:length]))
+        return length
+
     async def bulk_write(self, endpoint, data):
         if not isinstance(data, (bytes, bytearray)):
             data = bytes(data)
         logger.trace("USB: BULK EP%d OUT data=<%s> (submit)", endpoint & 0x7f, dump_hex(data))
-        await self._do_transfer(is_read=False, setup=lambda transfer:
+        await self._do_transfer(endpoint|usb1.ENDPOINT_OUT, is_read=False, setup=lambda transfer:
             transfer.setBulk(endpoint|usb1.ENDPOINT_OUT, data))
         logger.trace("USB: BULK EP%d OUT (completed)", endpoint & 0x7f)
 
@@ -459,13 +520,31 @@ class GlasgowHardwareDevice:
 
     async def download_bitstream(self, bitstream, bitstream_id=b"\xff" * 16):
         """Download ``bitstream`` with ID ``bitstream_id`` to FPGA."""
+        # The registers of the new bitstream have nothing to do with the ones of the old one.
+        self._register_shadow.clear()
+        started_at = time.perf_counter()
         # Send consecutive chunks of bitstream.
-        # Sending 0th chunk resets the FPGA.
-        index = 0
-        while index * 1024 < len(bitstream):
-            await self.control_write(usb1.REQUEST_TYPE_VENDOR, REQ_FPGA_CFG,
-                                     0, index, bitstream[index * 1024:(index + 1) * 1024])
-            index += 1
+        # Sending 0th chunk resets the FPGA, so wait for it to complete before sending the rest.
+        chunks = [bitstream[offset:offset + 1024] for offset in range(0, len(bitstream), 1024)]
+        if chunks:
+            await self.control_write(usb1.REQUEST_TYPE_VENDOR, REQ_FPGA_CFG, 0, 0, chunks[0])
+        # The rest of the chunks are pipelined: control requests are completed in the order they
+        # are submitted, so keeping several of them in flight only removes the host round-trip
+        # between consecutive chunks.
+        in_flight = []
+        try:
+            for index, chunk in enumerate(chunks[1:], start=1):
+                if len(in_flight) == _fpga_cfg_chunks_in_flight:
+                    await in_flight.pop(0)
+                in_flight.append(asyncio.ensure_future(
+                    self.control_write(usb1.REQUEST_TYPE_VENDOR, REQ_FPGA_CFG, 0, index, chunk)))
+            while in_flight:
+                await in_flight.pop(0)
+        finally:
+            for task in in_flight:
+                task.cancel()
+            if in_flight:
+                await asyncio.wait(in_flight)
         # Complete configuration by setting bitstream ID.
         # This starts the FPGA.
         try:
@@ -473,6 +552,9 @@ class GlasgowHardwareDevice:
                                      0, 0, bitstream_id)
         except usb1.USBErrorPipe:
             raise GlasgowDeviceError("FPGA configuration failed")
+        elapsed = time.perf_counter() - started_at
+        logger.debug("downloaded %d bytes of bitstream in %.3f s (%.1f KiB/s)",
+                     len(bitstream), elapsed, len(bitstream) / elapsed / 1024)
 
     async def download_target(self, plan, *, reload=False):
         if await self.bitstream_id() == plan.bitstream_id and not reload:
@@ -667,15 +749,54 @@ class GlasgowHardwareDevice:
             value = await self.control_read(usb1.REQUEST_TYPE_VENDOR, REQ_REGISTER, addr, 0, width)
             value = int.from_bytes(value, byteorder="little")
             logger.trace("register %d read: %#04x", addr, value)
+            self._register_shadow[addr] = (value, width)
             return value
         except usb1.USBErrorPipe:
             await self._register_error(addr)
 
-    async def write_register(self, addr, value, width=1):
-        """Write ``value`` to ``width``-byte FPGA register at ``addr``."""
+    async def write_register(self, addr, value, width=1, *, shadow=False):
+        """
+        Write ``value`` to ``width``-byte FPGA register at ``addr``.
+
+        If ``shadow`` is true, the write is skipped if the register is known to already hold
+        ``value`` because it has been previously written or read. This must only be used for
+        read-write registers that are never changed by the gateware.
+        """
+        if shadow and self._register_shadow.get(addr) == (value, width):
+            logger.trace("register %d write: %#04x (skipped)", addr, value)
+            return
         try:
             logger.trace("register %d write: %#04x", addr, value)
-            value = value.to_bytes(width, byteorder="big")
-            await self.control_write(usb1.REQUEST_TYPE_VENDOR, REQ_REGISTER, addr, 0, value)
+            self._register_shadow.pop(addr, None)
+            await self.control_write(usb1.REQUEST_TYPE_VENDOR, REQ_REGISTER, addr, 0,
+                                     value.to_bytes(width, byteorder="big"))
+            self._register_shadow[addr] = (value, width)
         except usb1.USBErrorPipe:
             await self._register_error(addr)
+
+    async def access_registers(self, operations, *, shadow=False):
+        """
+        Perform a batch of FPGA register accesses.
+
+        Each of ``operations`` is an ``(addr, value, width)`` tuple; if ``value`` is ``None``,
+        the ``width``-byte register at ``addr`` is read, otherwise ``value`` is written to it.
+        All of the accesses are submitted to the device at once (the firmware performs one access
+        per control request, but there is no round-trip between the requests) and are performed
+        in order. The ``shadow`` argument has the same meaning as for :meth:`write_register`.
+
+        Returns a list with the value read for each read access, and ``None`` for each write
+        access.
+        """
+        accesses = []
+        for addr, value, width in operations:
+            if value is None:
+                accesses.append(self.read_register(addr, width))
+            else:
+                accesses.append(self.write_register(addr, value, width, shadow=shadow))
+        # Exceptions are collected rather than propagated immediately, so that every access is
+        # awaited even if one of them fails.
+        results = await asyncio.gather(*accesses, return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        return results
@@ -15,6 +15,18 @@ class GlasgowSimulationDevice:
         yield self._regs.regs_r[addr]
 
     @types.coroutine
-    def write_register(self, addr, value, width=1):
+    def write_register(self, addr, value, width=1, *, shadow=False):
         assert addr < self._target.registers.reg_count
         yield self._regs.regs_w[addr].eq(value)
+
+    @types.coroutine
+    def access_registers(self, operations, *, shadow=False):
+        results = []
+        for addr, value, width in operations:
+            if value is None:
+                assert addr < self._regs.reg_count
+                results.append((yield self._regs.regs_r[addr]))
+            else:
+                yield from self.write_register(addr, value, width)
+                results.append(None)
+        return results
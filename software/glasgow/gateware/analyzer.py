@@ -1,3 +1,4 @@
+import array
 from functools import reduce
 from collections import OrderedDict
 from amaranth import *
@@ -5,7 +6,8 @@ from amaranth.lib.fifo import FIFOInterface, SyncFIFOBuffered
 from amaranth.lib.coding import PriorityEncoder, PriorityDecoder
 
 
-__all__ = ["EventSource", "EventAnalyzer", "TraceDecodingError", "TraceDecoder"]
+__all__ = ["EventSource", "EventAnalyzer", "TraceDecodingError", "TraceEvents", "TraceDecoder",
+           "THROTTLE_SOURCE"]
 
 
 REPORT_DELAY        = 0b10000000
@@ -340,26 +342,72 @@ class TraceDecodingError(Exception):
     pass
 
 
+class TraceEvents:
+    """
+    A batch of decoded analyzer events.
+
+    The events are stored column-wise, in three parallel arrays: ``timestamps``; ``sources``,
+    containing the index of the event source, or ``THROTTLE_SOURCE`` for throttle events; and
+    ``values``, containing the event data (with all fields packed together), or zero for sources
+    without data. If any event source is wider than 64 bits, ``values`` is a list instead of
+    an array. Events that happen in the same cycle are adjacent.
+
+    If the trace has ended, ``end`` is ``"done"`` or ``"overrun"`` and ``end_timestamp`` is
+    the timestamp at which it ended; otherwise, both are ``None``.
+    """
+    def __init__(self, timestamps, sources, values, end=None, end_timestamp=None):
+        self.timestamps    = timestamps
+        self.sources       = sources
+        self.values        = values
+        self.end           = end
+        self.end_timestamp = end_timestamp
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __iter__(self):
+        return zip(self.timestamps, self.sources, self.values)
+
+
+THROTTLE_SOURCE = -1
+
+
 class TraceDecoder:
     """
     Event analyzer trace decoder.
 
     Decodes raw analyzer traces into a timestamped sequence of maps from event fields to
-    their values.
+    their values, or into batches of events stored in arrays (see :class:`TraceEvents`).
     """
     def __init__(self, event_sources, absolute_timestamps=True):
         self.event_sources       = event_sources
         self.absolute_timestamps = absolute_timestamps
 
+        # Number of data bytes following the event report of each source.
+        self._data_lengths = [(event_src.width + 7) // 8 for event_src in event_sources]
+
         self._state      = "IDLE"
         self._byte_off   = 0
+        self._residue    = b""
         self._timestamp  = 0
         self._delay      = 0
-        self._event_src  = 0
-        self._event_off  = 0
-        self._event_data = 0
-        self._pending    = OrderedDict()
-        self._timeline   = []
+        # Decoded events, stored with absolute timestamps regardless of `absolute_timestamps`.
+        # Events starting at `_pending_start` belong to the current cycle, which may get more
+        # events later, and are not returned by `flush_batch()` unless requested.
+        self._timestamps = array.array("Q")
+        self._sources    = array.array("b")
+        self._values     = self._values_array(max(self._data_lengths, default=0))
+        self._pending_start = 0
+        # Last two distinct timestamps returned, used to compute relative timestamps.
+        self._relative_state = (0, 0)
+
+    @staticmethod
+    def _values_array(data_length):
+        # `array` typecodes only guarantee a minimum width; "L" is 32 bits wide on Windows.
+        for typecode in ("B", "H", "L", "Q"):
+            if array.array(typecode).itemsize >= data_length:
+                return array.array(typecode)
+        return [] # events wider than 64 bits
 
     def events(self):
         """
@@ -374,91 +422,130 @@ class TraceDecoder:
             else:
                 yield (event_src.name, event_src.kind, event_src.width)
 
-    def _flush_timestamp(self):
-        if self._delay == 0:
-            return
-
-        if self._pending:
-            self._timeline.append((self._timestamp, self._pending))
-            self._pending = OrderedDict()
-
-        if self.absolute_timestamps:
-            self._timestamp += self._delay
-        else:
-            self._timestamp  = self._delay
-        self._delay = 0
-
     def process(self, data):
         """
         Incrementally parse a chunk of analyzer trace, and record events in it.
         """
-        for octet in data:
-            is_delay   = ((octet & REPORT_DELAY_MASK)   == REPORT_DELAY)
-            is_event   = ((octet & REPORT_EVENT_MASK)   == REPORT_EVENT)
-            is_special = ((octet & REPORT_SPECIAL_MASK) == REPORT_SPECIAL)
-            special    = octet & ~REPORT_SPECIAL
-
-            if self._state == "IDLE" and is_delay:
-                self._state = "DELAY"
-                self._delay = octet & ~REPORT_DELAY_MASK
-
-            elif self._state == "DELAY" and is_delay:
-                self._delay = (self._delay << 7) | (octet & ~REPORT_DELAY_MASK)
-
-            elif self._state == "DELAY" and is_special and \
-                        special in (SPECIAL_THROTTLE, SPECIAL_DETHROTTLE):
-                self._flush_timestamp()
-
-                if special == SPECIAL_THROTTLE:
-                    self._pending["throttle"] = 1
-                elif special == SPECIAL_DETHROTTLE:
-                    self._pending["throttle"] = 0
-
-            elif self._state in ("IDLE", "DELAY") and is_event:
-                self._flush_timestamp()
-
-                if (octet & ~REPORT_EVENT_MASK) > len(self.event_sources):
+        # The trace is parsed a report at a time rather than an octet at a time. A report with
+        # event data that is split between chunks is kept until the next chunk arrives.
+        buffer = self._residue + bytes(data)
+        base   = self._byte_off - len(self._residue)
+        length = len(buffer)
+
+        state     = self._state
+        timestamp = self._timestamp
+        delay     = self._delay
+        data_lengths   = self._data_lengths
+        source_count   = len(data_lengths)
+        add_timestamp  = self._timestamps.append
+        add_source     = self._sources.append
+        add_value      = self._values.append
+        from_bytes     = int.from_bytes
+
+        def invalid_byte(offset, octet, state):
+            return TraceDecodingError("at byte offset %d: invalid byte %#04x for state %s" %
+                                      (base + offset, octet, state))
+
+        offset = 0
+        while offset < length:
+            octet = buffer[offset]
+            if state in ("DONE", "OVERRUN"):
+                raise invalid_byte(offset, octet, state)
+
+            if octet & REPORT_DELAY_MASK == REPORT_DELAY:
+                delay = (delay << 7) | (octet & ~REPORT_DELAY_MASK)
+                state = "DELAY"
+                offset += 1
+                continue
+
+            if octet & REPORT_EVENT_MASK == REPORT_EVENT:
+                source = octet & ~REPORT_EVENT_MASK
+                if source >= source_count:
                     raise TraceDecodingError("at byte offset %d: event source out of bounds" %
-                                             self._byte_off)
-                self._event_src = self.event_sources[octet & ~REPORT_EVENT_MASK]
-                if self._event_src.width == 0:
-                    self._pending[self._event_src.name] = None
-                    self._state = "IDLE"
-                else:
-                    self._event_off  = self._event_src.width
-                    self._event_data = 0
-                    self._state = "EVENT"
-
-            elif self._state == "EVENT":
-                self._event_data <<= 8
-                self._event_data  |= octet
-                if self._event_off > 8:
-                    self._event_off -= 8
-                else:
-                    if self._event_src.fields:
-                        offset = 0
-                        for field_name, field_width in self._event_src.fields:
-                            self._pending["{}-{}".format(field_name, self._event_src.name)] = \
-                                (self._event_data >> offset) & ((1 << field_width) - 1)
-                            offset += field_width
-                    else:
-                        self._pending[self._event_src.name] = self._event_data
-
-                    self._state = "IDLE"
-
-            elif self._state in "DELAY" and is_special and \
-                        special in (SPECIAL_DONE, SPECIAL_OVERRUN):
-                self._flush_timestamp()
-                if special == SPECIAL_DONE:
-                    self._state = "DONE"
-                elif special == SPECIAL_OVERRUN:
-                    self._state = "OVERRUN"
-
-            else:
-                raise TraceDecodingError("at byte offset %d: invalid byte %#04x for state %s" %
-                                         (self._byte_off, octet, self._state))
-
-            self._byte_off += 1
+                                             (base + offset))
+                data_end = offset + 1 + data_lengths[source]
+                if data_end > length:
+                    break # event data is incomplete
+                if delay:
+                    timestamp += delay
+                    delay = 0
+                    self._pending_start = len(self._timestamps)
+                add_timestamp(timestamp)
+                add_source(source)
+                add_value(from_bytes(buffer[offset + 1:data_end], "big"))
+                state  = "IDLE"
+                offset = data_end
+                continue
+
+            special = octet & ~REPORT_SPECIAL_MASK
+            if state != "DELAY" or special not in (SPECIAL_THROTTLE, SPECIAL_DETHROTTLE,
+                                                   SPECIAL_DONE, SPECIAL_OVERRUN):
+                raise invalid_byte(offset, octet, state)
+            if delay:
+                timestamp += delay
+                delay = 0
+                self._pending_start = len(self._timestamps)
+            if special == SPECIAL_THROTTLE:
+                add_timestamp(timestamp)
+                add_source(THROTTLE_SOURCE)
+                add_value(1)
+            elif special == SPECIAL_DETHROTTLE:
+                add_timestamp(timestamp)
+                add_source(THROTTLE_SOURCE)
+                add_value(0)
+            elif special == SPECIAL_DONE:
+                state = "DONE"
+            elif special == SPECIAL_OVERRUN:
+                state = "OVERRUN"
+            offset += 1
+
+        self._residue   = buffer[offset:]
+        self._byte_off += len(data)
+        self._state     = state
+        self._timestamp = timestamp
+        self._delay     = delay
+
+    def _relative_timestamp(self, timestamp):
+        last_timestamp, base_timestamp = self._relative_state
+        if timestamp != last_timestamp:
+            last_timestamp, base_timestamp = timestamp, last_timestamp
+            self._relative_state = (last_timestamp, base_timestamp)
+        return timestamp - base_timestamp
+
+    def _flush_absolute(self, pending):
+        if self._state == "OVERRUN":
+            count, end = self._pending_start, "overrun"
+        elif self._state == "DONE":
+            count, end = len(self._timestamps), "done"
+        elif pending:
+            count, end = len(self._timestamps), None
+        else:
+            count, end = self._pending_start, None
+
+        timestamps, self._timestamps = self._timestamps[:count], self._timestamps[count:]
+        sources,    self._sources    = self._sources[:count],    self._sources[count:]
+        values,     self._values     = self._values[:count],     self._values[count:]
+        self._pending_start = max(self._pending_start - count, 0)
+        if end == "overrun":
+            # events in the cycle where the overrun occurred are incomplete; discard them
+            del self._timestamps[:], self._sources[:], self._values[:]
+            self._pending_start = 0
+        return TraceEvents(timestamps, sources, values, end,
+                           self._timestamp if end is not None else None)
+
+    def flush_batch(self, pending=False):
+        """
+        Return the events decoded since the start of decoding or the previous flush, as
+        a :class:`TraceEvents` batch. If ``pending`` is ``True``, also flushes pending events;
+        this may cause events in the same cycle to be split between batches if more events arrive
+        after the flush.
+        """
+        batch = self._flush_absolute(pending)
+        if not self.absolute_timestamps:
+            batch.timestamps = array.array("Q", map(self._relative_timestamp, batch.timestamps))
+            if batch.end_timestamp is not None:
+                batch.end_timestamp = self._relative_timestamp(batch.end_timestamp)
+        return batch
 
     def flush(self, pending=False):
         """
@@ -466,13 +553,37 @@ class TraceDecoder:
         If ``pending`` is ``True``, also flushes pending events; this may cause duplicate
         timestamps if more events arrive after the flush.
         """
-        if self._state == "OVERRUN":
-            self._timeline.append((self._timestamp, "overrun"))
-        elif pending and self._pending or self._state == "DONE":
-            self._timeline.append((self._timestamp, self._pending))
-            self._pending = OrderedDict()
+        if self.absolute_timestamps:
+            convert_timestamp = lambda timestamp: timestamp
+        else:
+            convert_timestamp = self._relative_timestamp
+
+        batch = self._flush_absolute(pending)
+        timeline = []
+        cycle_timestamp, cycle_events = None, None
+        for timestamp, source, value in batch:
+            if timestamp != cycle_timestamp:
+                cycle_timestamp, cycle_events = timestamp, OrderedDict()
+                timeline.append((convert_timestamp(cycle_timestamp), cycle_events))
+            if source == THROTTLE_SOURCE:
+                cycle_events["throttle"] = value
+                continue
+            event_src = self.event_sources[source]
+            if event_src.fields:
+                offset = 0
+                for field_name, field_width in event_src.fields:
+                    cycle_events["{}-{}".format(field_name, event_src.name)] = \
+                        (value >> offset) & ((1 << field_width) - 1)
+                    offset += field_width
+            elif event_src.width == 0:
+                cycle_events[event_src.name] = None
+            else:
+                cycle_events[event_src.name] = value
 
-        timeline, self._timeline = self._timeline, []
+        if batch.end == "overrun":
+            timeline.append((convert_timestamp(batch.end_timestamp), "overrun"))
+        elif batch.end == "done" and batch.end_timestamp != cycle_timestamp:
+            timeline.append((convert_timestamp(batch.end_timestamp), OrderedDict()))
         return timeline
 
     def is_done(self):
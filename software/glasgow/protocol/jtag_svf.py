@@ -4,6 +4,7 @@
 # Accession: G00023
 
 import re
+import binascii
 from abc import ABCMeta, abstractmethod
 
 from ..support.bits import *
@@ -13,7 +14,15 @@ __all__ = ["SVFParser", "SVFEventHandler"]
 
 
 def _hex_to_bits(input_nibbles):
-    return bits(int(input_nibbles, 16))
+    # Rather than going through a Python `int` (which copies the data several times), unhexlify
+    # the digits and reverse the bytes to get LSB-first bits.
+    input_nibbles = input_nibbles.translate(None, b" \t\n\r\v\f").lstrip(b"0")
+    if not input_nibbles:
+        return bits()
+    length = 4 * (len(input_nibbles) - 1) + int(input_nibbles[:1], 16).bit_length()
+    if len(input_nibbles) % 2:
+        input_nibbles = b"0" + input_nibbles
+    return bits(binascii.unhexlify(input_nibbles)[::-1], length)
 
 
 _commands = (
@@ -54,38 +63,97 @@ class SVFLexer:
         * Literal (``(HLUDXZHHLL)``, ``(IN FOO)``, ...), returned as Python ``tuple(str,)``;
         * End of file, returned as Python ``None``.
 
-    :type buffer: str
-    :attr buffer:
-        Input buffer.
+    The input may be a ``str``, a bytes-like object (including an ``mmap.mmap``), or a binary
+    file, which is read in chunks of ``chunk_size`` bytes; in the latter case, only the data
+    after the position passed to :meth:`release` is kept in memory.
 
     :type position: int
     :attr position:
-        Offset into buffer from which the next token will be read.
+        Offset into the input from which the next token will be read.
     """
 
     _keywords = _commands + _parameters + _trst_modes + _tap_states + (";",)
-    _scanner  = tuple((re.compile(src, re.A|re.I|re.M), act) for src, act in (
-        (r"\s+",
-         None),
-        (r"(?:!|//)([^\n]*)(?:\n|\Z)",
-         None),
-        (r"({})(?=\s+|[;()]|\Z)".format("|".join(_keywords)),
-         lambda m: m[1]),
-        (r"(\d+)(?=[^0-9\.E])",
-         lambda m: int(m[1])),
-        (r"(\d+(?:\.\d+)?(?:E[+-]?\d+)?)",
-         lambda m: float(m[1])),
-        (r"\(\s*([0-9A-F\s]+)\s*\)",
-         lambda m: _hex_to_bits(re.sub(r"\s+", "", m[1]))),
-        (r"\(\s*(.+?)\s*\)",
-         lambda m: (m[1],)),
-        (r"\Z",
-         lambda m: None),
-    ))
-
-    def __init__(self, buffer):
-        self.buffer   = buffer
-        self.position = 0
+    _keyword_tokens = {keyword.encode(): keyword for keyword in _keywords}
+    _skip_re  = re.compile(rb"(?:\s+|(?:!|//)[^\n]*(?:\n|\Z))*", re.A)
+    _token_re = re.compile(rb"""
+        (?P<skip>(?:\s+|(?:!|//)[^\n]*(?:\n|\Z))*)
+        (?:
+            (?P<keyword>(?:""" + "|".join(map(re.escape, _keywords)).encode() + rb"""))
+                (?=\s|[;()]|\Z)
+          | (?P<integer>\d+)(?=[^0-9.E])
+          | (?P<real>\d+(?:\.\d+)?(?:E[+-]?\d+)?)
+          | \(\s*(?P<scan_data>[0-9A-F\s]+)\s*\)
+          | \(\s*(?P<literal>.+?)\s*\)
+          | (?P<eof>\Z)
+        )""", re.A|re.I|re.X)
+
+    def __init__(self, buffer, *, chunk_size=1 << 20):
+        if isinstance(buffer, str):
+            buffer = buffer.encode("utf-8")
+        if hasattr(buffer, "read"):
+            self._file = buffer
+            self._data = b""
+        else:
+            self._file = None
+            self._data = buffer
+        self._chunk_size = chunk_size
+        self._offset     = 0 # position of `self._data[0]`
+        self._release    = 0
+        self._cached     = None
+        # (position, line, line start) at the start of the data, and at the last position for
+        # which the line was computed
+        self._line_base  = (0, 1, 0)
+        self._line_cache = (0, 1, 0)
+        self.position    = 0
+
+    def release(self, position):
+        """
+        Allow the data before ``position`` to be discarded.
+
+        The position may not be moved back before ``position`` afterwards.
+        """
+        self._release = position
+
+    def text(self, start, end):
+        """Return the input between ``start`` and ``end`` as a ``str``."""
+        return bytes(self._data[start - self._offset:end - self._offset]).decode(
+            "utf-8", errors="replace")
+
+    def _fill(self):
+        if self._file is None:
+            return False
+        # Read at least as much as is buffered, so that a token much larger than the chunk size
+        # is not rescanned once per chunk.
+        chunk = self._file.read(max(self._chunk_size, len(self._data)))
+        if not chunk:
+            self._file = None
+            return False
+        if self._release > self._offset:
+            self._line_base = self._line_cache = self._find_line(self._release)
+            self._data   = self._data[self._release - self._offset:]
+            self._offset = self._release
+        self._data += chunk
+        return True
+
+    def _count_newlines(self, start, end):
+        if hasattr(self._data, "count"):
+            return self._data.count(b"\n", start, end)
+        else: # `mmap.mmap` has no `count()`
+            return self._data[start:end].count(b"\n")
+
+    def _find_line(self, position):
+        line_position, line, line_start = self._line_cache
+        if position >= line_position:
+            start, end = line_position - self._offset, position - self._offset
+            line += self._count_newlines(start, end)
+        else:
+            start, end = 0, position - self._offset
+            line -= self._count_newlines(end, line_position - self._offset)
+            line_start = self._line_base[2]
+        newline = self._data.rfind(b"\n", start, end)
+        if newline != -1:
+            line_start = self._offset + newline + 1
+        return position, line, line_start
 
     def line_column(self, position=None):
         """
@@ -93,28 +161,46 @@ class SVFLexer:
 
         Both the line and the column start at 1.
         """
-        line = len(re.compile(r"\n").findall(self.buffer, endpos=self.position))
-        if line > 1:
-            column = self.position - self.buffer.rindex("\n", 0, self.position)
-        else:
-            column = self.position
-        return line + 1, column + 1
+        if position is None:
+            position = self.position
+        self._line_cache = _position, line, line_start = self._find_line(position)
+        return line, position - line_start + 1
 
     def _lex(self):
+        if self._cached is not None and self.position in self._cached[:2]:
+            _position, self.position, token, end = self._cached
+            return token, end
+
         while True:
-            for token_re, action in self._scanner:
-                match = token_re.match(self.buffer, self.position)
-                # print(token_re, match)
-                if match:
-                    if action is None:
-                        self.position = match.end()
-                        break
-                    else:
-                        return action(match), match.end()
-            else:
-                raise SVFParsingError("unrecognized SVF data at line %d, column %d (%s...)"
-                                    % (*self.line_column(),
-                                       self.buffer[self.position:self.position + 16]))
+            match = self._token_re.match(self._data, self.position - self._offset)
+            # A token that ends near the end of the buffered data may continue past it; e.g. `1`
+            # may be the start of `1E+6`.
+            if match is not None and match.end() + 3 <= len(self._data) or not self._fill():
+                break
+        if match is None:
+            self.position = self._offset + \
+                self._skip_re.match(self._data, self.position - self._offset).end()
+            raise SVFParsingError("unrecognized SVF data at line %d, column %d (%s...)"
+                                  % (*self.line_column(),
+                                     self.text(self.position, self.position + 16)))
+
+        position, self.position = self.position, self._offset + match.end("skip")
+        kind = match.lastgroup
+        if kind == "scan_data":
+            token = _hex_to_bits(match[kind])
+        elif kind == "keyword":
+            token = self._keyword_tokens.get(match[kind]) or match[kind].decode()
+        elif kind == "integer":
+            token = int(match[kind])
+        elif kind == "real":
+            token = float(match[kind])
+        elif kind == "literal":
+            token = (match[kind].decode("utf-8", errors="replace"),)
+        else:
+            token = None
+        end = self._offset + match.end()
+        self._cached = position, self.position, token, end
+        return token, end
 
     def peek(self):
         """Return the next token without advancing the position."""
@@ -144,6 +230,8 @@ class SVFParser:
     This parser maintains and allows querying lexical state (e.g. "sticky" ``TDI`` is
     automatically tracked), and invokes the SVF event handler for all commands so that
     any necessary action may be taken.
+
+    The input may be anything accepted by :class:`SVFLexer`.
     """
     def __init__(self, buffer, handler):
         self._lexer     = SVFLexer(buffer)
@@ -151,6 +239,7 @@ class SVFParser:
         self._position  = 0
         self._token     = None
         self._cmd_pos   = 0
+        self._cmd_start = 0
 
         self._param_tdi   = \
             {"HIR": None, "HDR": None, "SIR": None, "SDR": None, "TIR": None, "TDR": None}
@@ -252,17 +341,18 @@ class SVFParser:
 
     def _parse_scan_data(self, length):
         value = self._parse_value(bits)
-        if int(value[length:]) != 0:
+        # Scan data is lexed without leading zeroes, so any bits past the command length are ones.
+        if len(value) > length:
             self._parse_error("scan data length %d exceeds command length %d"
                               % (len(value), length))
 
-        if length > len(value):
-            return value + bits(0, length - len(value))
-        else:
-            return value[:length]
+        return bits(bytes(value).ljust((length + 7) // 8, b"\x00"), length)
 
     def parse_command(self):
         self._cmd_pos = self._lexer.position
+        self._lexer.release(self._cmd_pos)
+        self._lexer.peek() # skip whitespace and comments
+        self._cmd_start = self._lexer.position
 
         command = self._parse_token()
         if command is None:
@@ -441,7 +531,12 @@ class SVFParser:
         return result or True
 
     def last_command(self):
-        return self._lexer.buffer[self._cmd_pos:self._lexer.position]
+        return self._lexer.text(self._cmd_pos, self._lexer.position)
+
+    def last_command_line(self):
+        """Return the line (starting at 1) on which the last command begins."""
+        line, _column = self._lexer.line_column(self._cmd_start)
+        return line
 
     def parse_file(self):
         while self.parse_command(): pass
@@ -0,0 +1,26 @@
+import os
+import tempfile
+
+
+__all__ = ["write_atomic"]
+
+
+def write_atomic(filename, data):
+    """
+    Replace the contents of ``filename`` with ``data`` (``bytes`` or ``str``).
+
+    The data is written to a temporary file in the same directory, which is then renamed over
+    ``filename``, so that a concurrently running reader can only ever see either the old or
+    the new contents. The name of the temporary file starts with ``.`` and ends with ``.tmp``;
+    it is removed if writing or renaming it fails or is interrupted.
+    """
+    fd, temp_filename = tempfile.mkstemp(dir=os.path.dirname(filename), prefix=".", suffix=".tmp")
+    replaced = False
+    try:
+        with os.fdopen(fd, "w" if isinstance(data, str) else "wb") as file:
+            file.write(data)
+        os.replace(temp_filename, filename)
+        replaced = True
+    finally:
+        if not replaced:
+            os.unlink(temp_filename)
@@ -171,6 +171,13 @@ class _bits_base(Sequence):
                 res._bytes = self._bytes[start // 8 : (stop + 7) // 8]
                 res._len = stop - start
                 return res
+            elif step == 1:
+                # unaligned normal fastpath (shift only the bytes covered by the slice)
+                value = int.from_bytes(self._bytes[start // 8 : (stop + 7) // 8], 'little')
+                return self.from_int(value >> (start % 8), stop - start)
+            elif step == -1:
+                # unaligned reverse fastpath
+                return self[stop + 1 : start + 1].reversed()
             else:
                 # slow path
                 return self.from_iter(self[i] for i in range(start, stop, step))
@@ -216,7 +223,8 @@ class _bits_base(Sequence):
             res._bytes = self._bytes + other._bytes
             res._len = self._len + other._len
             return res
-        return self.from_iter(itertools.chain(self, other))
+        return self.from_int(self.to_int() | other.to_int() << self._len,
+                             self._len + other._len)
 
     def __radd__(self, other) -> Self:
         if isinstance(other, (str, Iterable)):
@@ -228,7 +236,8 @@ class _bits_base(Sequence):
             res._bytes = other._bytes + self._bytes
             res._len = other._len + self._len
             return res
-        return self.from_iter(itertools.chain(other, self))
+        return self.from_int(other.to_int() | self.to_int() << other._len,
+                             other._len + self._len)
 
     def __mul__(self, other) -> Self:
         if not isinstance(other, int):
@@ -250,7 +259,8 @@ class _bits_base(Sequence):
         if len(other) != len(self):
             raise ValueError("mismatched bitwise operator widths")
         res = object.__new__(self.__class__)
-        res._bytes = self._bytestype(op(a, b) for (a, b) in zip(self._bytes, other._bytes))
+        res._bytes = self._bytestype(
+            op(self.to_int(), other.to_int()).to_bytes(len(self._bytes), 'little'))
         res._len = self._len
         return res
 
@@ -270,18 +280,7 @@ class _bits_base(Sequence):
     __rxor__ = __xor__
 
     def __invert__(self) -> Self:
-        if self._len % 8 == 0:
-            pad_idx = None
-        else:
-            pad_idx = self._len // 8
-            pad_mask = ~(-1 << self._len % 8)
-        res = object.__new__(self.__class__)
-        res._bytes = self._bytestype(
-            ~x & pad_mask if i == pad_idx else ~x & 0xff
-            for i, x in enumerate(self._bytes)
-        )
-        res._len = self._len
-        return res
+        return self.from_int(~self.to_int(), self._len)
 
     def reversed(self) -> Self:
         """Returns a reversed copy of this bit string. Equivalent to ``from_iter(reversed(self))``."""
@@ -291,7 +290,9 @@ class _bits_base(Sequence):
             res._len = self._len
             return res
         else:
-            return self.from_iter(reversed(self))
+            # reverse whole bytes, then shift out the padding, which ends up at the LSB
+            value = int.from_bytes(self._bytes.translate(_byterev_lut)[::-1], 'little')
+            return self.from_int(value >> (-self._len % 8), self._len)
 
     def byte_reversed(self) -> Self:
         """Returns a copy of this bit string with bits reversed within each byte.
@@ -492,7 +493,7 @@ class bitarray(_bits_base, MutableSequence):
             self._bytes = self._bytes.translate(_byterev_lut)
             self._bytes.reverse()
         else:
-            super().reverse()
+            self._bytes = self.reversed()._bytes
 
     def byte_reverse(self) -> None:
         """Reverses the bits within every byte of this bitarray in-place. The length
@@ -503,8 +504,17 @@ class bitarray(_bits_base, MutableSequence):
             raise ValueError("byte_reverse requires a bitstream of length divisible by 8")
 
     def extend(self, values) -> None:
-        if isinstance(values, (str, _bits_base)):
-            self[self._len:] = values
+        if isinstance(values, str):
+            values = bits(values)
+        if isinstance(values, _bits_base):
+            if self._len % 8 == 0:
+                self._bytes[len(self._bytes):] = values._bytes
+            else:
+                # unaligned fastpath (shift the values into the partially filled last byte)
+                offset = self._len % 8
+                value = values.to_int() << offset | self._bytes[-1]
+                self._bytes[-1:] = value.to_bytes(_byte_len(offset + values._len), 'little')
+            self._len += values._len
         else:
             super().extend(values)
 
@@ -9,56 +9,72 @@ class ChunkedFIFO:
     A first-in first-out byte buffer that uses discontiguous storage to operate without copying.
     """
     def __init__(self):
-        self._queue  = deque()
-        self._chunk  = None
-        self._offset = 0
-        self._length = 0
-        self._rtotal = 0
-        self._wtotal = 0
+        self._queue   = deque()
+        self._release = deque()
+        self._chunk   = None
+        self._chunk_release = None
+        self._offset  = 0
+        self._length  = 0
+        self._rtotal  = 0
+        self._wtotal  = 0
 
     def clear(self):
         """Remove all data from the buffer."""
+        if self._chunk_release is not None:
+            self._chunk_release()
+        for release in self._release:
+            if release is not None:
+                release()
         self._queue.clear()
+        self._release.clear()
         self._chunk  = None
+        self._chunk_release = None
         self._offset = 0
         self._length = 0
 
-    def write(self, data):
-        """Enqueue ``data``."""
+    def write(self, data, release=None):
+        """
+        Enqueue ``data``.
+
+        If ``release`` is specified, it is called without arguments once ``data`` has been
+        entirely dequeued (or the buffer has been cleared), which allows the storage backing
+        ``data`` to be reused. Such chunks should be dequeued with :meth:`read_into`, since
+        the views returned by :meth:`read` would refer to storage that may be overwritten.
+        """
         try:
             data = memoryview(data)
         except TypeError:
             data = memoryview(bytes(data))
 
         if not data:
+            if release is not None:
+                release()
             return
         self._length += len(data)
         self._wtotal += len(data)
         self._queue.append(data)
+        self._release.append(release)
 
-    def read(self, max_length=None):
-        """
-        Dequeue at most ``max_length`` bytes. If ``max_length`` is not specified, dequeue
-        the maximum possible contiguous amount of bytes (at least one).
-
-        Regardless of what was written into the FIFO, ``read`` always returns a ``memoryview``
-        object.
-        """
+    def _dequeue(self, max_length):
+        # Returns the dequeued view, and the release callback for the chunk it belongs to if this
+        # view was the last one to refer to that chunk; the callback must be called by the caller.
         if max_length is None and self._chunk is None:
             # Fast path.
-            chunk = self._queue.popleft()
+            chunk   = self._queue.popleft()
+            release = self._release.popleft()
             self._length -= len(chunk)
             self._rtotal += len(chunk)
-            return chunk
+            return chunk, release
 
         if max_length == 0:
-            return memoryview(b"")
+            return memoryview(b""), None
 
         if self._chunk is None:
             if not self._queue:
-                return memoryview(b"")
+                return memoryview(b""), None
 
             self._chunk  = self._queue.popleft()
+            self._chunk_release = self._release.popleft()
             self._offset = 0
 
         if max_length is None:
@@ -66,15 +82,49 @@ class ChunkedFIFO:
         else:
             result = self._chunk[self._offset:self._offset + max_length]
 
+        release = None
         if self._offset + len(result) == len(self._chunk):
+            release = self._chunk_release
             self._chunk = None
+            self._chunk_release = None
         else:
             self._offset += len(result)
 
         self._length -= len(result)
         self._rtotal += len(result)
+        return result, release
+
+    def read(self, max_length=None):
+        """
+        Dequeue at most ``max_length`` bytes. If ``max_length`` is not specified, dequeue
+        the maximum possible contiguous amount of bytes (at least one).
+
+        Regardless of what was written into the FIFO, ``read`` always returns a ``memoryview``
+        object.
+        """
+        result, release = self._dequeue(max_length)
+        if release is not None:
+            release()
         return result
 
+    def read_into(self, buffer):
+        """
+        Dequeue at most ``len(buffer)`` bytes, copying them into ``buffer``, which must be
+        a writable bytes-like object. Returns the amount of bytes copied.
+
+        Unlike :meth:`read`, this method copies data across chunk boundaries, and the data it
+        returns remains valid after the storage backing the chunks it was copied from is reused.
+        """
+        buffer = memoryview(buffer).cast("B")
+        offset = 0
+        while offset < len(buffer) and self:
+            chunk, release = self._dequeue(len(buffer) - offset)
+            buffer[offset:offset + len(chunk)] = chunk
+            offset += len(chunk)
+            if release is not None:
+                release()
+        return offset
+
     def __bool__(self):
         """Check whether there are any bytes in the FIFO."""
         return bool(self._queue) or self._chunk is not None
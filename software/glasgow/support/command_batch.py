@@ -0,0 +1,56 @@
+import asyncio
+
+
+__all__ = ["CommandBatch"]
+
+
+class CommandBatch:
+    """
+    A sequence of commands that is sent to an applet as a single command stream, with
+    the responses to all of them read back at once.
+
+    Subclasses append commands to ``_commands``, and register the length of each response they
+    expect with :meth:`_result`, which returns an :class:`asyncio.Future` that is resolved once
+    the batch is executed. The batch is executed with :meth:`execute`, or automatically at the end
+    of an ``async with`` block.
+    """
+    def __init__(self, lower):
+        self._lower    = lower
+        self._commands = bytearray()
+        self._results  = []
+
+    def _result(self, count, decode):
+        """
+        Expect a response of ``count`` bytes, and return a future that will be resolved with
+        the result of calling ``decode`` on it.
+        """
+        future = asyncio.Future()
+        self._results.append((count, decode, future))
+        return future
+
+    async def execute(self):
+        """
+        Send the commands added since the batch was created or last executed, and resolve
+        their results. If this fails, the results are resolved with the exception.
+        """
+        commands, self._commands = self._commands, bytearray()
+        results,  self._results  = self._results,  []
+        try:
+            if commands:
+                await self._lower.write(commands)
+            in_data = await self._lower.read(sum(count for count, *_ in results))
+        except BaseException as exc:
+            for _count, _decode, future in results:
+                future.set_exception(exc)
+            raise
+        offset = 0
+        for count, decode, future in results:
+            future.set_result(decode(in_data[offset:offset + count]))
+            offset += count
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            await self.execute()
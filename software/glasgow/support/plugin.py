@@ -1,13 +1,18 @@
 import re
 import os
 import sys
+import json
 import traceback
+import importlib.machinery
 import importlib.metadata
 import packaging.requirements
 import pathlib
+import platformdirs
 import sysconfig
 import logging
 
+from .atomic_file import write_atomic
+
 
 __all__ = ["PluginRequirementsUnmet", "PluginLoadError", "PluginMetadata"]
 
@@ -44,6 +49,145 @@ def _entry_points(*, group, name=None):
                 yield entry_point
 
 
+# Discovering plugins requires scanning the metadata of every installed distribution, and describing
+# them (e.g. in the command line help) requires importing every plugin module; together, this takes
+# most of the time spent starting up. To avoid this, both the entry points and the descriptions of
+# plugins are cached on disk.
+#
+# The entry points are invalidated whenever any directory on `sys.path` is modified, which happens
+# whenever a distribution is installed, upgraded, or removed. The description of each plugin is
+# invalidated whenever the file containing its module is modified.
+_plugin_cache_filename = \
+    platformdirs.user_cache_path("GlasgowEmbedded", appauthor=False) / "plugins.json"
+_plugin_cache = None
+_plugin_cache_dirty = False
+
+
+def _load_plugin_cache():
+    global _plugin_cache
+    if _plugin_cache is None:
+        try:
+            with open(_plugin_cache_filename) as file:
+                _plugin_cache = json.load(file)
+            if not isinstance(_plugin_cache, dict):
+                raise ValueError("malformed plugin cache")
+        except (OSError, ValueError):
+            _plugin_cache = {}
+    return _plugin_cache
+
+
+def _save_plugin_cache():
+    global _plugin_cache_dirty
+    if not _plugin_cache_dirty:
+        return
+    try:
+        _plugin_cache_filename.parent.mkdir(parents=True, exist_ok=True)
+        write_atomic(_plugin_cache_filename, json.dumps(_plugin_cache))
+    except OSError as error:
+        logger.debug(f"could not write plugin cache: {error}")
+    _plugin_cache_dirty = False
+
+
+def _sys_path_fingerprint():
+    fingerprint = []
+    for path in sys.path:
+        if path and os.path.isdir(path): # the empty path is the working directory; ignore it
+            fingerprint.append([path, os.stat(path).st_mtime_ns])
+    return fingerprint
+
+
+def _module_fingerprint(module_name):
+    # locate the module without importing it or any of its parent packages
+    spec = None
+    search_path = None
+    components = module_name.split(".")
+    for index in range(len(components)):
+        spec = importlib.machinery.PathFinder.find_spec(
+            ".".join(components[:index + 1]), search_path)
+        if spec is None:
+            return None
+        search_path = spec.submodule_search_locations
+    if spec.origin is None or not os.path.isfile(spec.origin):
+        return None
+    stat = os.stat(spec.origin)
+    return [spec.origin, stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
+
+class _CachedDistribution:
+    def __init__(self, name, requires):
+        self.name = name
+        self.requires = requires
+
+
+class _CachedEntryPoint:
+    def __init__(self, name, value, group, dist):
+        self.name = name
+        self.value = value
+        self.group = group
+        self.dist = dist
+        self._entry_point = importlib.metadata.EntryPoint(name, value, group)
+
+    @property
+    def module(self):
+        return self._entry_point.module
+
+    @property
+    def attr(self):
+        return self._entry_point.attr
+
+    @property
+    def extras(self):
+        return self._entry_point.extras
+
+    def load(self):
+        return self._entry_point.load()
+
+
+def _cached_entry_points(*, group, name=None):
+    global _plugin_cache_dirty
+    plugin_cache = _load_plugin_cache()
+    fingerprint = _sys_path_fingerprint()
+    if plugin_cache.get("fingerprint") != fingerprint:
+        plugin_cache["fingerprint"] = fingerprint
+        plugin_cache["entry_points"] = {}
+    if group not in plugin_cache["entry_points"]:
+        plugin_cache["entry_points"][group] = [
+            {
+                "name":     entry_point.name,
+                "value":    entry_point.value,
+                "dist":     entry_point.dist.name,
+                "requires": entry_point.dist.requires,
+            }
+            for entry_point in _entry_points(group=group)
+        ]
+        _plugin_cache_dirty = True
+    for record in plugin_cache["entry_points"][group]:
+        if name is None or record["name"] == name:
+            yield _CachedEntryPoint(record["name"], record["value"], group,
+                                    _CachedDistribution(record["dist"], record["requires"]))
+
+
+def _cached_plugin_description(key, fingerprint):
+    if None in fingerprint:
+        return None
+    cache_entry = _load_plugin_cache().get("plugins", {}).get(key)
+    if isinstance(cache_entry, dict) and cache_entry.get("fingerprint") == fingerprint:
+        return cache_entry["synopsis"], cache_entry["description"], cache_entry["attributes"]
+
+
+def _store_plugin_description(key, fingerprint, synopsis, description, attributes):
+    global _plugin_cache_dirty
+    if None in fingerprint:
+        return
+    _load_plugin_cache().setdefault("plugins", {})[key] = {
+        "fingerprint": fingerprint,
+        "synopsis":    synopsis,
+        "description": description,
+        "attributes":  attributes,
+    }
+    _plugin_cache_dirty = True
+
+
 def _requirements_for_optional_dependencies(distribution, depencencies):
     requirements = map(packaging.requirements.Requirement, distribution.requires)
     selected_requirements = set()
@@ -125,12 +269,27 @@ class PluginMetadata:
 
     @classmethod
     def get(cls, handle):
-        entry_point, *_ = _entry_points(group=cls.GROUP_NAME, name=handle)
-        return cls(entry_point)
+        entry_point, *_ = _cached_entry_points(group=cls.GROUP_NAME, name=handle)
+        metadata = cls(entry_point)
+        _save_plugin_cache()
+        return metadata
 
     @classmethod
     def all(cls):
-        return {ep.name: cls(ep) for ep in _entry_points(group=cls.GROUP_NAME) if cls._loadable(ep)}
+        metadata = {ep.name: cls(ep) for ep in _cached_entry_points(group=cls.GROUP_NAME)
+                    if cls._loadable(ep)}
+        _save_plugin_cache()
+        return metadata
+
+    @classmethod
+    def _describe(cls, plugin_cls):
+        """Plugin attributes.
+
+        Returns a dictionary of JSON-serializable attributes of ``plugin_cls`` that are necessary
+        to describe the plugin. These are cached alongside its synopsis and description, so that
+        the plugin does not have to be loaded only to describe it.
+        """
+        return {}
 
     def __init__(self, entry_point):
         assert self._loadable(entry_point)
@@ -144,24 +303,22 @@ class PluginMetadata:
 
         # Person-side metadata (how to display it, etc.)
         self.handle = entry_point.name
+        self._entry_point = entry_point
+        self._cls = None
+        self._cached = False
         if not self.unmet_requirements:
-            try:
-                self._cls = entry_point.load()
-                self.synopsis = self._cls.help
-                self.description = self._cls.description
-            except Exception as exn:
-                self._cls = None
-                # traceback.format_exception_only can return multiple lines
-                self.synopsis = (
-                    f"/!\\ unavailable due to a load error: "
-                    "".join(traceback.format_exception_only(exn)).splitlines()[0])
-                # traceback.format_exception can return lines with internal newlines
-                self.description = (
-                    f"\nThis plugin is unavailable because attempting to load it has raised "
-                    f"an exception. The exception is:\n\n    " +
-                    "".join(traceback.format_exception(exn)).replace("\n", "\n    "))
+            cache_key = f"{self.GROUP_NAME}:{self.handle}"
+            fingerprint = [entry_point.value, _module_fingerprint(self.module)]
+            if cached := _cached_plugin_description(cache_key, fingerprint):
+                self._cached = True
+                self.synopsis, self.description, self.attributes = cached
+            else:
+                self._load()
+                if self._cls is not None:
+                    _store_plugin_description(cache_key, fingerprint,
+                        self.synopsis, self.description, self.attributes)
         else:
-            self._cls = None
+            self.attributes = {}
             self.synopsis = (
                 f"/!\\ unavailable due to unmet requirements: "
                 f"{', '.join(str(r) for r in self.unmet_requirements)}")
@@ -171,6 +328,26 @@ class PluginMetadata:
                 _install_command_for_requirements(self.unmet_requirements) +
                 f"\n")
 
+    def _load(self):
+        self._cached = False
+        try:
+            self._cls = self._entry_point.load()
+            self.synopsis = self._cls.help
+            self.description = self._cls.description
+            self.attributes = self._describe(self._cls)
+        except Exception as exn:
+            self._cls = None
+            self.attributes = {}
+            # traceback.format_exception_only can return multiple lines
+            self.synopsis = (
+                f"/!\\ unavailable due to a load error: "
+                "".join(traceback.format_exception_only(exn)).splitlines()[0])
+            # traceback.format_exception can return lines with internal newlines
+            self.description = (
+                f"\nThis plugin is unavailable because attempting to load it has raised "
+                f"an exception. The exception is:\n\n    " +
+                "".join(traceback.format_exception(exn)).replace("\n", "\n    "))
+
     @property
     def unmet_requirements(self):
         return _unmet_requirements_in(self.requirements)
@@ -181,11 +358,13 @@ class PluginMetadata:
 
     @property
     def loadable(self):
-        return self._cls is not None
+        return self._cached or self._cls is not None
 
     def load(self):
         if self.unmet_requirements:
             raise PluginRequirementsUnmet(self)
+        if self._cached:
+            self._load()
         if self._cls is None:
             raise PluginLoadError(self)
         return self._cls
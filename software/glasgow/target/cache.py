@@ -0,0 +1,160 @@
+import os
+import re
+import hashlib
+import logging
+import pathlib
+import contextlib
+import platformdirs
+from ..support.atomic_file import write_atomic
+
+
+__all__ = ["BitstreamCache"]
+
+
+logger = logging.getLogger(__name__)
+
+
+class BitstreamCache:
+    """A content-addressed bitstream cache with least-recently-used eviction.
+
+    Each entry consists of a bitstream and the log of the build that produced it, and is stored
+    in two files named after the bitstream ID, each of which is prefixed with its own hash so that
+    corrupted entries are detected and treated as missing. Entries are written atomically, and
+    entries are written and evicted under an exclusive lock, so the cache can be shared between
+    several concurrently running instances of Glasgow (e.g. on a network filesystem).
+
+    By default, the cache is located in the platform-appropriate cache directory; this can be
+    overridden with the ``GLASGOW_BITSTREAM_CACHE`` environment variable. The size of the cache is
+    limited to 1 GiB by default; this can be overridden with the ``GLASGOW_BITSTREAM_CACHE_SIZE``
+    environment variable, which accepts a number of bytes with an optional ``K``, ``M``, or ``G``
+    suffix, or ``0`` to disable eviction.
+    """
+
+    DEFAULT_SIZE_LIMIT = 1 << 30
+
+    @staticmethod
+    def parse_size(size):
+        if matches := re.match(r"^\s*(\d+)\s*([KMG]?)i?B?\s*$", size, re.I):
+            return int(matches[1]) << {"": 0, "K": 10, "M": 20, "G": 30}[matches[2].upper()]
+        raise ValueError(f"{size!r} is not a valid cache size")
+
+    @classmethod
+    def from_environment(cls):
+        """Create a cache configured according to the environment variables described above."""
+        if cache_path := os.environ.get("GLASGOW_BITSTREAM_CACHE"):
+            path = pathlib.Path(cache_path)
+        else:
+            # bitstreams aren't large, but it is good etiquette to indicate to the OS that they can
+            # be wiped without concern
+            path = platformdirs.user_cache_path("GlasgowEmbedded", appauthor=False) / "bitstreams"
+        size_limit = cls.DEFAULT_SIZE_LIMIT
+        if size_env := os.environ.get("GLASGOW_BITSTREAM_CACHE_SIZE"):
+            try:
+                size_limit = cls.parse_size(size_env) or None
+            except ValueError as e:
+                logger.warning(f"ignoring GLASGOW_BITSTREAM_CACHE_SIZE: {e}; using default size")
+        return cls(path, size_limit=size_limit)
+
+    def __init__(self, path, *, size_limit=DEFAULT_SIZE_LIMIT):
+        self.path = pathlib.Path(path)
+        self.size_limit = size_limit
+
+    def _filenames(self, bitstream_id):
+        bitstream_filename = self.path / bitstream_id.hex()
+        return bitstream_filename, bitstream_filename.with_suffix(".output")
+
+    @contextlib.contextmanager
+    def _lock(self):
+        self.path.mkdir(parents=True, exist_ok=True)
+        with open(self.path / ".lock", "a+b") as lock_file:
+            if os.name == "nt":
+                import msvcrt
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                try:
+                    yield
+                finally:
+                    lock_file.seek(0)
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def get(self, bitstream_id):
+        """Retrieve an entry.
+
+        Returns a ``(bitstream_data, stdout_data)`` tuple, or ``None`` if the entry does not exist
+        or is corrupted.
+        """
+        bitstream_filename, stdout_filename = self._filenames(bitstream_id)
+        try:
+            with bitstream_filename.open("rb") as bitstream_file:
+                bitstream_hash = bitstream_file.read(hashlib.blake2s().digest_size)
+                bitstream_data = bitstream_file.read()
+            with stdout_filename.open("rb") as stdout_file:
+                stdout_hash = stdout_file.read(hashlib.blake2s().digest_size * 2 + 1)
+                stdout_data = stdout_file.read()
+        except FileNotFoundError:
+            # also happens if the entry is evicted while being read
+            return None
+        if hashlib.blake2s(bitstream_data).digest() != bitstream_hash:
+            return None
+        if hashlib.blake2s(stdout_data).hexdigest().encode() != stdout_hash.rstrip():
+            return None
+        # the modification time is used as the access time for eviction purposes, since access
+        # times are commonly not updated by the OS
+        try:
+            os.utime(bitstream_filename)
+        except OSError:
+            pass # the cache may be read-only; it is still useful
+        logger.trace(f"bitstream was read from {str(bitstream_filename)!r}")
+        return bitstream_data, stdout_data
+
+    def put(self, bitstream_id, bitstream_data, stdout_data):
+        """Store an entry, evicting least recently used entries if the cache is over its limit."""
+        bitstream_filename, stdout_filename = self._filenames(bitstream_id)
+        with self._lock():
+            # the build log is written first, so that an entry with a bitstream is never missing it
+            write_atomic(stdout_filename,
+                hashlib.blake2s(stdout_data).hexdigest().encode() + b"\n" + # keep it a text file
+                stdout_data)
+            write_atomic(bitstream_filename,
+                hashlib.blake2s(bitstream_data).digest() +
+                bitstream_data)
+            logger.trace(f"bitstream was written to {str(bitstream_filename)!r}")
+            self._evict()
+
+    def _evict(self):
+        if self.size_limit is None:
+            return
+
+        entries = []
+        total_size = 0
+        for bitstream_filename in self.path.iterdir():
+            if bitstream_filename.name.startswith(".") or bitstream_filename.suffix:
+                continue # lock file, temporary files, and build logs
+            stdout_filename = bitstream_filename.with_suffix(".output")
+            try:
+                bitstream_stat = bitstream_filename.stat()
+                entry_size = bitstream_stat.st_size
+                if stdout_filename.exists():
+                    entry_size += stdout_filename.stat().st_size
+            except FileNotFoundError:
+                continue
+            entries.append((bitstream_stat.st_mtime, entry_size, bitstream_filename))
+            total_size += entry_size
+
+        for _mtime, entry_size, bitstream_filename in sorted(entries):
+            if total_size <= self.size_limit:
+                break
+            logger.trace(f"evicting bitstream {str(bitstream_filename)!r}")
+            for filename in (bitstream_filename, bitstream_filename.with_suffix(".output")):
+                try:
+                    filename.unlink()
+                except FileNotFoundError:
+                    pass
+            total_size -= entry_size
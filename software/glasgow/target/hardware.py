@@ -6,7 +6,7 @@ import logging
 import hashlib
 import pathlib
 import subprocess
-import platformdirs
+import concurrent.futures
 from amaranth import *
 from amaranth.lib import io
 from amaranth.build import ResourceError
@@ -17,9 +17,10 @@ from ..gateware.registers import I2CRegisters
 from ..gateware.fx2_crossbar import FX2Crossbar
 from .analyzer import GlasgowAnalyzer
 from .toolchain import find_toolchain
+from .cache import BitstreamCache
 
 
-__all__ = ["GlasgowHardwareTarget"]
+__all__ = ["GlasgowHardwareTarget", "build_bitstreams"]
 
 
 logger = logging.getLogger(__name__)
@@ -153,7 +154,7 @@ class GlasgowBuildPlan:
     # this function is only public for paranoid people who don't trust our excellent cache system.
     # it's very unlikely to fail, but people are rightfully distrustful of cache systems, so
     # be sympathetic to that.
-    def execute(self, build_dir=None, *, debug=False):
+    def execute(self, build_dir=None, *, debug=False, log_prefix="build"):
         if build_dir is None:
             build_dir = tempfile.mkdtemp(prefix="glasgow_")
         try:
@@ -181,11 +182,11 @@ class GlasgowBuildPlan:
                     stdout=subprocess.PIPE, stderr=subprocess.STDOUT) as proc:
                 for stdout_line in proc.stdout:
                     stdout_lines.append(stdout_line)
-                    logger.trace(f"build: %s", stdout_line.rstrip())
+                    logger.trace(f"%s: %s", log_prefix, stdout_line.rstrip())
                 if proc.wait():
                     if not logger.isEnabledFor(logging.TRACE): # don't print the log twice
                         for stdout_line in stdout_lines:
-                            logger.info(f"build: %s", stdout_line.rstrip())
+                            logger.info(f"%s: %s", log_prefix, stdout_line.rstrip())
                     if logger.isEnabledFor(logging.INFO):
                         raise GatewareBuildError(
                             f"gateware build failed with exit code {proc.returncode}; "
@@ -206,50 +207,70 @@ class GlasgowBuildPlan:
                 shutil.rmtree(build_dir)
         return bitstream_data, stdout_data
 
-    def get_bitstream(self, *, debug=False):
-        # locate the caches in the platform-appropriate cache directory; bitstreams aren't large,
-        # but it is good etiquette to indicate to the OS that they can be wiped without concern
-        cache_path = platformdirs.user_cache_path("GlasgowEmbedded", appauthor=False)
-        bitstream_filename = cache_path / "bitstreams" / self.bitstream_id.hex()
-        stdout_filename = bitstream_filename.with_suffix(".output")
+    def get_bitstream(self, *, debug=False, cache=None, log_prefix="build"):
+        if cache is None:
+            cache = BitstreamCache.from_environment()
         # ensure that the cache and the build log (a) exist, (b) aren't corrupted; if anything goes
         # wrong at this stage, proceed as-if the cache was never there
-        cache_exists = (bitstream_filename.exists() and stdout_filename.exists())
-        if cache_exists:
-            with bitstream_filename.open("rb") as bitstream_file:
-                bitstream_hash = bitstream_file.read(hashlib.blake2s().digest_size)
-                bitstream_data = bitstream_file.read()
-                if hashlib.blake2s(bitstream_data).digest() != bitstream_hash:
-                    cache_exists = False
-            with stdout_filename.open("rb") as stdout_file:
-                stdout_hash = stdout_file.read(hashlib.blake2s().digest_size * 2 + 1)
-                stdout_data = stdout_file.read()
-                if hashlib.blake2s(stdout_data).hexdigest().encode() != stdout_hash.rstrip():
-                    cache_exists = False
-        if cache_exists:
+        if cached := cache.get(self.bitstream_id):
             # the cache exists; skip building the bitstream, and reproduce the stdout to our log
             # if anyone would actually see it
+            bitstream_data, stdout_data = cached
             logger.debug(f"bitstream ID {self.bitstream_id.hex()} is cached")
-            logger.trace(f"bitstream was read from {str(bitstream_filename)!r}")
             if logger.isEnabledFor(logging.TRACE):
                 for stdout_line in stdout_data.decode().splitlines():
-                    logger.trace(f"build: %s", stdout_line)
+                    logger.trace(f"%s: %s", log_prefix, stdout_line)
         else:
             # the cache does not exist; build it (`execute` directs the stdout to our log, so we
-            # don't have to forward it here) and write the artifacts to the platform-appropriate
-            # cache directory
+            # don't have to forward it here) and write the artifacts to the cache, which may be
+            # shared with other concurrently running builds
             logger.debug(f"bitstream ID {self.bitstream_id.hex()} is not cached, executing build")
-            bitstream_data, stdout_data = self.execute(debug=debug)
-            bitstream_hash = hashlib.blake2s(bitstream_data).digest()
-            stdout_hash = hashlib.blake2s(stdout_data).hexdigest().encode()
-            bitstream_filename.parent.mkdir(parents=True, exist_ok=True)
-            with bitstream_filename.open("wb") as bitstream_file:
-                bitstream_file.write(bitstream_hash)
-                bitstream_file.write(bitstream_data)
-            with stdout_filename.open("wb") as stdout_file:
-                stdout_file.write(stdout_hash + b"\n") # keep it a text file
-                stdout_file.write(stdout_data)
-            logger.trace(f"bitstream was written to {str(bitstream_filename)!r}")
+            bitstream_data, stdout_data = self.execute(debug=debug, log_prefix=log_prefix)
+            cache.put(self.bitstream_id, bitstream_data, stdout_data)
         # finally, we have a bitstream! and chances are, we have obtained it much faster than we
         # would have otherwise.
         return bitstream_data
+
+
+def build_bitstreams(plans, *, jobs=None, debug=False, cache=None):
+    """Build several bitstreams concurrently.
+
+    ``plans`` is a mapping of names (used to tag the build logs) to build plans. Plans with
+    identical bitstream IDs are built only once, and bitstreams that are already cached are not
+    rebuilt. At most ``jobs`` builds (by default, as many as there are CPU cores) run at once.
+
+    Returns a mapping of names to bitstreams. If any of the builds fail, the first exception is
+    re-raised once all of the other builds finish.
+    """
+    if cache is None:
+        cache = BitstreamCache.from_environment()
+
+    unique_plans = {}
+    for name, plan in plans.items():
+        if plan.bitstream_id in unique_plans:
+            same_name, _ = unique_plans[plan.bitstream_id]
+            logger.info(f"bitstream for {name} is identical to bitstream for {same_name}")
+        else:
+            unique_plans[plan.bitstream_id] = (name, plan)
+
+    if jobs is None:
+        jobs = os.cpu_count()
+
+    # the toolchain always runs in a subprocess, so worker threads are enough to occupy every core;
+    # this avoids having to send the (large) build plans to worker processes
+    futures = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        for bitstream_id, (name, plan) in unique_plans.items():
+            futures[bitstream_id] = executor.submit(plan.get_bitstream,
+                debug=debug, cache=cache, log_prefix=f"build {name}")
+
+    bitstreams = {}
+    for name, plan in plans.items():
+        if futures[plan.bitstream_id].exception() is not None:
+            logger.error(f"failed to build bitstream for {name}")
+        else:
+            bitstreams[name] = futures[plan.bitstream_id].result()
+    for future in futures.values():
+        if future.exception() is not None:
+            raise future.exception()
+    return bitstreams
@@ -8,7 +8,11 @@ import sysconfig
 import logging
 import subprocess
 import re
+import json
+import time
+import platformdirs
 from ..support.lazy import lazy
+from ..support.atomic_file import write_atomic
 
 
 __all__ = ["ToolchainNotFound", "find_toolchain"]
@@ -21,6 +25,51 @@ class ToolchainNotFound(Exception):
     pass
 
 
+# Computing a tool identifier requires hashing the tool and all of its data files, which takes
+# a noticeable amount of time on every startup (even if the bitstream is already cached, since
+# the bitstream ID includes the toolchain identifier). To avoid this, identifiers are cached
+# on disk together with a fingerprint consisting of the path, size, modification time, and inode
+# number of every file that contributes to the identifier. If any of these files are replaced or
+# modified, the fingerprint changes and the identifier is recomputed.
+_identifier_cache_filename = \
+    platformdirs.user_cache_path("GlasgowEmbedded", appauthor=False) / "toolchain-identifiers.json"
+
+
+def _file_fingerprint(filename):
+    stat = os.stat(filename)
+    return [os.fspath(filename), stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
+
+def _cached_identifier(key, get_fingerprint, compute_identifier):
+    started_at = time.perf_counter()
+    try:
+        fingerprint = get_fingerprint()
+    except OSError:
+        return compute_identifier() # something is unusual about this installation; don't cache it
+    try:
+        with open(_identifier_cache_filename) as file:
+            identifier_cache = json.load(file)
+    except (OSError, ValueError):
+        identifier_cache = {}
+
+    if (isinstance(entry := identifier_cache.get(key), dict) and
+            entry.get("fingerprint") == fingerprint):
+        identifier = bytes.fromhex(entry["identifier"])
+        logger.debug(f"identifier of {key} read from cache in "
+                     f"{time.perf_counter() - started_at:.3f} s")
+        return identifier
+
+    identifier = compute_identifier()
+    logger.debug(f"identifier of {key} computed in {time.perf_counter() - started_at:.3f} s")
+    identifier_cache[key] = {"fingerprint": fingerprint, "identifier": identifier.hex()}
+    try:
+        _identifier_cache_filename.parent.mkdir(parents=True, exist_ok=True)
+        write_atomic(_identifier_cache_filename, json.dumps(identifier_cache))
+    except OSError as error:
+        logger.debug(f"could not write toolchain identifier cache: {error}")
+    return identifier
+
+
 class Tool(metaclass=ABCMeta):
     def __init__(self, name):
         self.name = str(name)
@@ -114,15 +163,35 @@ class WasmTool(Tool):
             # This makes querying the version at least as fast as for the native tools.
             return (*importlib.metadata.version(self.python_package).split("."),)
 
+    def _compute_identifier(self):
+        hasher = hashlib.blake2s()
+        for file_entry in importlib.metadata.files(self.python_package):
+            if file_entry.hash is None:
+                continue # RECORD, *.pyc, etc
+            hasher.update(file_entry.hash.value.encode("utf-8"))
+        return hasher.digest()[:16]
+
+    _identifier_cache = None
+
     @property
     def identifier(self):
         if self.available:
-            hasher = hashlib.blake2s()
-            for file_entry in importlib.metadata.files(self.python_package):
-                if file_entry.hash is None:
-                    continue # RECORD, *.pyc, etc
-                hasher.update(file_entry.hash.value.encode("utf-8"))
-            return hasher.digest()[:16]
+            if self._identifier_cache is None:
+                # The launcher script is rewritten whenever the package is (re)installed, which
+                # changes its fingerprint even if the version stays the same. Unlike `command`,
+                # its filename includes the extension used on some platforms (e.g. `.exe`).
+                def get_fingerprint():
+                    launcher = shutil.which(self.PREFIX + self.name,
+                                            path=sysconfig.get_path('scripts'))
+                    if launcher is None:
+                        raise FileNotFoundError(f"launcher for {self.name} not found")
+                    return [
+                        importlib.metadata.version(self.python_package),
+                        _file_fingerprint(launcher),
+                    ]
+                self._identifier_cache = _cached_identifier(f"builtin {self.name}",
+                    get_fingerprint, self._compute_identifier)
+            return self._identifier_cache
 
 
 class SystemTool(Tool):
@@ -198,13 +267,16 @@ class SystemTool(Tool):
     def identifier(self):
         if self.available:
             if self._identifier_cache is None:
-                hasher = hashlib.blake2s()
-                with open(self.command, "rb") as file:
-                    hasher.update(file.read())
-                for data_filename in self._iter_data_files():
-                    with open(data_filename, "rb") as file:
-                        hasher.update(file.read())
-                self._identifier_cache = hasher.digest()[:16]
+                filenames = [self.command, *self._iter_data_files()]
+                def compute_identifier():
+                    hasher = hashlib.blake2s()
+                    for filename in filenames:
+                        with open(filename, "rb") as file:
+                            hasher.update(file.read())
+                    return hasher.digest()[:16]
+                get_fingerprint = lambda: [_file_fingerprint(filename) for filename in filenames]
+                self._identifier_cache = _cached_identifier(f"system {self.name}",
+                    get_fingerprint, compute_identifier)
             return self._identifier_cache
 
 
@@ -1,9 +1,12 @@
 import unittest
+from types import SimpleNamespace
 from amaranth import *
 from amaranth.lib.fifo import SyncFIFOBuffered
 
 from glasgow.gateware import simulation_test
-from glasgow.gateware.analyzer import EventAnalyzer, TraceDecoder, REPORT_DELAY, REPORT_EVENT, REPORT_SPECIAL, SPECIAL_DONE, SPECIAL_OVERRUN
+from glasgow.gateware.analyzer import (EventAnalyzer, TraceDecoder, TraceDecodingError,
+    THROTTLE_SOURCE, REPORT_DELAY, REPORT_EVENT, REPORT_SPECIAL,
+    SPECIAL_DONE, SPECIAL_OVERRUN, SPECIAL_THROTTLE)
 
 
 class EventAnalyzerTestbench(Elaboratable):
@@ -378,3 +381,98 @@ class EventAnalyzerTestCase(unittest.TestCase):
         ], [
             (0x10000, "overrun"),
         ], flush_pending=False)
+
+
+class TraceDecoderTestCase(unittest.TestCase):
+    def setUp(self):
+        self.event_sources = [
+            SimpleNamespace(name="a", kind="change", width=12, fields=()),
+            SimpleNamespace(name="b", kind="strobe", width=0,  fields=()),
+            SimpleNamespace(name="c", kind="change", width=8,  fields=(("x", 3), ("y", 5))),
+        ]
+        self.trace = bytes([
+            REPORT_DELAY|1, REPORT_DELAY|2,
+            REPORT_EVENT|0, 0x0a, 0xbc,
+            REPORT_EVENT|1,
+            REPORT_DELAY|3,
+            REPORT_SPECIAL|SPECIAL_THROTTLE,
+            REPORT_EVENT|2, 0b10101_011,
+            REPORT_DELAY|1,
+            REPORT_SPECIAL|SPECIAL_DONE,
+        ])
+        self.timeline = [
+            (130, {"a": 0xabc, "b": None}),
+            (133, {"throttle": 1, "x-c": 0b011, "y-c": 0b10101}),
+            (134, {}),
+        ]
+
+    def test_batch(self):
+        decoder = TraceDecoder(self.event_sources)
+        decoder.process(self.trace)
+        batch = decoder.flush_batch()
+        self.assertEqual(list(batch), [
+            (130, 0, 0xabc),
+            (130, 1, 0),
+            (133, THROTTLE_SOURCE, 1),
+            (133, 2, 0b10101_011),
+        ])
+        self.assertEqual((batch.end, batch.end_timestamp), ("done", 134))
+        self.assertTrue(decoder.is_done())
+
+    def test_pending(self):
+        decoder = TraceDecoder(self.event_sources)
+        decoder.process(self.trace[:6])
+        self.assertEqual(len(decoder.flush_batch()), 0)
+        self.assertEqual(list(decoder.flush_batch(pending=True)), [
+            (130, 0, 0xabc),
+            (130, 1, 0),
+        ])
+
+    def test_chunked(self):
+        decoder = TraceDecoder(self.event_sources)
+        timeline = []
+        for octet in self.trace:
+            decoder.process([octet])
+            timeline += decoder.flush()
+        self.assertEqual(timeline, self.timeline)
+
+    def test_relative(self):
+        decoder = TraceDecoder(self.event_sources, absolute_timestamps=False)
+        decoder.process(self.trace)
+        self.assertEqual(decoder.flush(), [
+            (130, {"a": 0xabc, "b": None}),
+            (3,   {"throttle": 1, "x-c": 0b011, "y-c": 0b10101}),
+            (1,   {}),
+        ])
+
+    def test_overrun(self):
+        decoder = TraceDecoder(self.event_sources)
+        decoder.process([REPORT_DELAY|1, REPORT_EVENT|1, REPORT_DELAY|2,
+                         REPORT_SPECIAL|SPECIAL_OVERRUN])
+        self.assertEqual(decoder.flush(), [
+            (1, {"b": None}),
+            (3, "overrun"),
+        ])
+
+    def test_wide_event(self):
+        decoder = TraceDecoder([
+            SimpleNamespace(name="w", kind="change", width=72, fields=()),
+        ])
+        decoder.process([REPORT_DELAY|1, REPORT_EVENT|0, *range(1, 10),
+                         REPORT_DELAY|1, REPORT_SPECIAL|SPECIAL_DONE])
+        self.assertEqual(list(decoder.flush_batch()), [
+            (1, 0, 0x010203040506070809),
+        ])
+
+    def test_invalid_byte(self):
+        decoder = TraceDecoder(self.event_sources)
+        decoder.process([REPORT_DELAY|1])
+        with self.assertRaisesRegex(TraceDecodingError,
+                r"^at byte offset 2: invalid byte 0x00 for state IDLE$"):
+            decoder.process([REPORT_EVENT|1, REPORT_SPECIAL|SPECIAL_DONE])
+
+    def test_out_of_bounds(self):
+        decoder = TraceDecoder(self.event_sources)
+        with self.assertRaisesRegex(TraceDecodingError,
+                r"^at byte offset 0: event source out of bounds$"):
+            decoder.process([REPORT_EVENT|3])
@@ -1,4 +1,6 @@
+import io
 import re
+import random
 import unittest
 
 from glasgow.support.bits import *
@@ -63,6 +65,39 @@ class SVFLexerTestCase(unittest.TestCase):
         with self.assertRaises(SVFParsingError):
             SVFLexer("XXX").next()
 
+    def test_bytes(self):
+        self.assertLexes(b"SIR 8 TDI (aa);",
+                         ["SIR", 8, "TDI", bits("10101010"), ";"])
+
+    def test_stream(self):
+        source = b"FREQUENCY 1.5E+6 HZ;\n! comment\nSDR 16 TDI (1234\n5678) TDO (ABCD);\nPIO (HLZ);"
+        for chunk_size in (1, 2, 3, 7, 1 << 20):
+            with self.subTest(chunk_size=chunk_size):
+                lexer = SVFLexer(io.BytesIO(source), chunk_size=chunk_size)
+                self.assertEqual(list(lexer), list(SVFLexer(source)))
+
+    def test_peek(self):
+        lexer = SVFLexer("TRST  OFF;")
+        self.assertEqual(lexer.next(), "TRST")
+        self.assertEqual(lexer.peek(), "OFF")
+        self.assertEqual(lexer.position, 6)
+        self.assertEqual(lexer.next(), "OFF")
+        self.assertEqual(lexer.next(), ";")
+
+    def test_line_column(self):
+        lexer = SVFLexer("TRST OFF;\n\nSIR 8\n  TDI (aa);")
+        tokens = []
+        while (token := lexer.peek()) is not None:
+            tokens.append((token, lexer.line_column()))
+            lexer.next()
+        self.assertEqual(tokens, [
+            ("TRST", (1, 1)), ("OFF", (1, 6)), (";", (1, 9)),
+            ("SIR", (3, 1)), (8, (3, 5)),
+            ("TDI", (4, 3)), (bits("10101010"), (4, 7)), (";", (4, 11)),
+        ])
+        self.assertEqual(lexer.line_column(13), (3, 3))
+        self.assertEqual(lexer.line_column(0), (1, 1))
+
 
 class SVFMockEventHandler:
     def __init__(self):
@@ -361,6 +396,49 @@ class SVFParserTestCase(unittest.TestCase):
         parser.parse_command()
         self.assertEqual(parser.last_command(), " SIR 8 TDI (aa);")
 
+    def test_last_command_line(self):
+        handler = SVFMockEventHandler()
+        parser = SVFParser("TRST OFF;\n\n// comment\n  SIR 8\nTDI (aa);\nTRST ON;", handler)
+        parser.parse_command()
+        self.assertEqual(parser.last_command_line(), 1)
+        parser.parse_command()
+        self.assertEqual(parser.last_command_line(), 4)
+        parser.parse_command()
+        self.assertEqual(parser.last_command_line(), 6)
+
+    def test_stream(self):
+        source = _generate_svf(commands=10, length=1024)
+        handler = SVFMockEventHandler()
+        SVFParser(source, handler).parse_file()
+        for chunk_size in (1, 5, 64):
+            with self.subTest(chunk_size=chunk_size):
+                stream_handler = SVFMockEventHandler()
+                parser = SVFParser(io.BytesIO(source), stream_handler)
+                parser._lexer._chunk_size = chunk_size
+                parser.parse_file()
+                self.assertEqual(stream_handler.events, handler.events)
+
+    def test_stream_error(self):
+        with self.assertRaisesRegex(SVFParsingError,
+                r"^expected semicolon, found end of file at line 3, column 15"):
+            parser = SVFParser(io.BytesIO(b"TRST OFF;\n\nSIR 8 TDI (aa)"), SVFMockEventHandler())
+            parser._lexer._chunk_size = 3
+            parser.parse_file()
+
+
+def _generate_svf(commands, length):
+    # Resembles the output of FPGA vendor tools: long scan data split over many lines.
+    rng = random.Random(0)
+    lines = ["! generated\n", "TRST OFF;\n", "ENDIR IDLE;\n", "ENDDR IDLE;\n"]
+    for _ in range(commands):
+        lines.append("SIR 8 TDI (ab) TDO (01) MASK (03);\n")
+        data = format(rng.getrandbits(length), f"0{length // 4}x")
+        lines.append(f"SDR {length} TDI (" +
+                     "\n\t".join(data[i:i + 64] for i in range(0, len(data), 64)) + ");\n")
+        lines.append("RUNTEST 100 TCK;\n")
+    return "".join(lines).encode()
+
+
 # -------------------------------------------------------------------------------------------------
 
 class SVFPrintingEventHandler:
@@ -0,0 +1,33 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from glasgow.support.atomic_file import write_atomic
+
+
+class WriteAtomicTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tempdir.name, "file")
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_write(self):
+        write_atomic(self.filename, b"\x00\x01")
+        with open(self.filename, "rb") as file:
+            self.assertEqual(file.read(), b"\x00\x01")
+        write_atomic(self.filename, "text")
+        with open(self.filename) as file:
+            self.assertEqual(file.read(), "text")
+        self.assertEqual(os.listdir(self.tempdir.name), ["file"])
+
+    def test_interrupted(self):
+        write_atomic(self.filename, b"old")
+        with mock.patch("os.replace", side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                write_atomic(self.filename, b"new")
+        with open(self.filename, "rb") as file:
+            self.assertEqual(file.read(), b"old")
+        self.assertEqual(os.listdir(self.tempdir.name), ["file"])
@@ -146,6 +146,8 @@ class BitsTestCase(unittest.TestCase):
         self.assertBits(some[8:24], 16, 0b0101010110011001)
         self.assertBits(some[23:7:-1], 16, 0b1001100110101010)
         self.assertBits(some[::-1], 32, 0b01010101100110011010101001100110)
+        self.assertBits(some[3:29], 26, 0b110010101011001100110101)
+        self.assertBits(some[26:2:-1], 24, 0b101011001100110101010011)
 
     def test_getitem_wrong(self):
         with self.assertRaisesRegex(TypeError,
@@ -169,6 +171,8 @@ class BitsTestCase(unittest.TestCase):
         self.assertBits((0,1,1,1) + bits("1010"), 8, 0b10101110)
         self.assertEqual(bits(b"\x10\x32") + bits(b"\x54\x06", 12), bits(b"\x10\x32\x54\x06", 28))
         self.assertEqual("01010101" + bits("1010"), bits("101001010101"))
+        self.assertEqual(bits("101") + bits(b"\x0f\xf0"), bits("1111000000001111101"))
+        self.assertEqual(bits(b"\x0f\xf0").__radd__(bits("101")), bits("1111000000001111101"))
 
     def test_mul(self):
         self.assertBits(bits("1011") * 4, 16, 0b1011101110111011)
@@ -204,6 +208,7 @@ class BitsTestCase(unittest.TestCase):
         self.assertBits(bits("1010").reversed(), 4, 0b0101)
         self.assertBits(bits("10101100").reversed(), 8, 0b00110101)
         self.assertEqual(bits(b"\x99\x55").reversed(), bits(b"\xaa\x99"))
+        self.assertEqual(bits("1010110011100").reversed(), bits("0011100110101"))
 
     def test_byte_reversed(self):
         self.assertBits(bits("10101100").byte_reversed(), 8, 0b00110101)
@@ -415,6 +420,10 @@ class BitarrayTestCase(unittest.TestCase):
         some.reverse()
         self.assertEqual(some, bits(b"\x66\xaa\x99\x55"))
 
+        some = bitarray("1010110011100")
+        some.reverse()
+        self.assertEqual(some, bits("0011100110101"))
+
     def test_byte_reverse(self):
         some = bitarray("101001")
         with self.assertRaises(ValueError):
@@ -428,6 +437,15 @@ class BitarrayTestCase(unittest.TestCase):
         some = bitarray("1011")
         some += [1, 0]
         self.assertBitarray(some, 6, 0b011011)
+        some.extend(bits(b"\x0f\xf0"))
+        self.assertBitarray(some, 22, 0b1111000000001111011011)
+        some.extend("10")
+        self.assertBitarray(some, 24, 0b101111000000001111011011)
+        some.extend(bits(b"\xa5"))
+        self.assertBitarray(some, 32, 0b10100101101111000000001111011011)
+        some = bitarray("101")
+        some.extend(some)
+        self.assertBitarray(some, 6, 0b101101)
 
     def test_imul(self):
         some = bitarray("1011")
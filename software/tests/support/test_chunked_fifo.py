@@ -74,3 +74,26 @@ class ChunkedFIFOTestCase(unittest.TestCase):
         self.fifo.write(bits("1010"))
         self.assertEqual(len(self.fifo), 1)
         self.assertEqual(self.fifo.read(1), b"\x0a")
+
+    def test_read_into(self):
+        self.fifo.write(b"ABCD")
+        self.fifo.write(b"EF")
+        buffer = bytearray(5)
+        self.assertEqual(self.fifo.read_into(buffer), 5)
+        self.assertEqual(buffer, b"ABCDE")
+        self.assertEqual(self.fifo.read_into(buffer), 1)
+        self.assertEqual(buffer, b"FBCDE")
+        self.assertEqual(self.fifo.read_into(buffer), 0)
+
+    def test_release(self):
+        released = []
+        self.fifo.write(b"ABCD", release=lambda: released.append(1))
+        self.fifo.write(b"EF",   release=lambda: released.append(2))
+        self.fifo.write(b"GH",   release=lambda: released.append(3))
+        buffer = bytearray(3)
+        self.fifo.read_into(buffer)
+        self.assertEqual(released, [])
+        self.fifo.read_into(buffer)
+        self.assertEqual(released, [1, 2])
+        self.fifo.clear()
+        self.assertEqual(released, [1, 2, 3])
@@ -0,0 +1,63 @@
+import asyncio
+import unittest
+
+from glasgow.support.command_batch import CommandBatch
+
+
+class _FakeLower:
+    def __init__(self, in_data=b"", error=None):
+        self.written = bytearray()
+        self.in_data = in_data
+        self.error   = error
+
+    async def write(self, data):
+        self.written += data
+
+    async def read(self, length):
+        if self.error is not None:
+            raise self.error
+        assert length == len(self.in_data)
+        return self.in_data
+
+
+class CommandBatchTestCase(unittest.TestCase):
+    async def do_test_execute(self):
+        lower = _FakeLower(b"\x01\x02\x03")
+        async with CommandBatch(lower) as batch:
+            batch._commands += b"AB"
+            result_1 = batch._result(1, lambda data: data[0])
+            batch._commands += b"C"
+            result_2 = batch._result(2, bytes)
+            with self.assertRaises(asyncio.InvalidStateError):
+                result_1.result()
+        self.assertEqual(lower.written, b"ABC")
+        self.assertEqual(result_1.result(), 1)
+        self.assertEqual(await result_2, b"\x02\x03")
+
+    def test_execute(self):
+        asyncio.get_event_loop().run_until_complete(
+            self.do_test_execute())
+
+    async def do_test_execute_error(self):
+        batch  = CommandBatch(_FakeLower(error=EOFError()))
+        result = batch._result(1, bytes)
+        with self.assertRaises(EOFError):
+            await batch.execute()
+        with self.assertRaises(EOFError):
+            result.result()
+
+    def test_execute_error(self):
+        asyncio.get_event_loop().run_until_complete(
+            self.do_test_execute_error())
+
+    async def do_test_aexit_error(self):
+        lower = _FakeLower()
+        with self.assertRaises(ZeroDivisionError):
+            async with CommandBatch(lower) as batch:
+                batch._commands += b"A"
+                1 / 0
+        self.assertEqual(lower.written, b"")
+
+    def test_aexit_error(self):
+        asyncio.get_event_loop().run_until_complete(
+            self.do_test_aexit_error())
@@ -0,0 +1,43 @@
+import threading
+import unittest
+
+from glasgow.gateware import GatewareBuildError
+from glasgow.target.hardware import build_bitstreams
+
+
+class _MockBuildPlan:
+    def __init__(self, bitstream_id, fail=False):
+        self.bitstream_id = bitstream_id
+        self.fail = fail
+        self.builds = 0
+        self._lock = threading.Lock()
+
+    def get_bitstream(self, *, debug=False, cache=None, log_prefix="build"):
+        with self._lock:
+            self.builds += 1
+        if self.fail:
+            raise GatewareBuildError("failed")
+        return b"bitstream " + self.bitstream_id
+
+
+class BuildBitstreamsTestCase(unittest.TestCase):
+    def test_deduplicate(self):
+        plan_a = _MockBuildPlan(b"a")
+        plan_b = _MockBuildPlan(b"b")
+        plan_a2 = _MockBuildPlan(b"a")
+        bitstreams = build_bitstreams({"x": plan_a, "y": plan_b, "z": plan_a2},
+                                      jobs=2, cache=object())
+        self.assertEqual(bitstreams, {
+            "x": b"bitstream a",
+            "y": b"bitstream b",
+            "z": b"bitstream a",
+        })
+        self.assertEqual((plan_a.builds, plan_b.builds, plan_a2.builds), (1, 1, 0))
+
+    def test_failure(self):
+        plan_a = _MockBuildPlan(b"a", fail=True)
+        plan_b = _MockBuildPlan(b"b")
+        with self.assertLogs("glasgow.target.hardware", "ERROR"):
+            with self.assertRaises(GatewareBuildError):
+                build_bitstreams({"x": plan_a, "y": plan_b}, cache=object())
+        self.assertEqual(plan_b.builds, 1)
@@ -0,0 +1,78 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from glasgow.target.cache import BitstreamCache
+
+
+class BitstreamCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.cache = BitstreamCache(self.tempdir.name, size_limit=None)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_miss(self):
+        self.assertIsNone(self.cache.get(b"\x00" * 16))
+
+    def test_put_get(self):
+        self.cache.put(b"\x01" * 16, b"bitstream", b"log\n")
+        self.assertEqual(self.cache.get(b"\x01" * 16), (b"bitstream", b"log\n"))
+        self.assertEqual(sorted(name for name in os.listdir(self.tempdir.name)
+                                if not name.startswith(".")),
+                         ["01" * 16, "01" * 16 + ".output"])
+
+    def test_corrupted(self):
+        self.cache.put(b"\x01" * 16, b"bitstream", b"log\n")
+        with open(os.path.join(self.tempdir.name, "01" * 16), "r+b") as f:
+            f.seek(-1, os.SEEK_END)
+            f.write(b"!")
+        self.assertIsNone(self.cache.get(b"\x01" * 16))
+
+    def test_evict_lru(self):
+        self.cache.size_limit = 500 # three entries, with overhead
+        for index in range(3):
+            bitstream_id = bytes([index]) * 16
+            self.cache.put(bitstream_id, b"x" * 50, b"")
+            # make the access order unambiguous regardless of filesystem timestamp resolution
+            os.utime(os.path.join(self.tempdir.name, bitstream_id.hex()), (index, index))
+        # touch the oldest entry, making the second one least recently used
+        self.assertIsNotNone(self.cache.get(b"\x00" * 16))
+        self.cache.put(b"\x03" * 16, b"x" * 50, b"")
+        self.assertIsNotNone(self.cache.get(b"\x00" * 16))
+        self.assertIsNone(self.cache.get(b"\x01" * 16))
+        self.assertIsNotNone(self.cache.get(b"\x02" * 16))
+        self.assertIsNotNone(self.cache.get(b"\x03" * 16))
+
+    def test_parse_size(self):
+        self.assertEqual(BitstreamCache.parse_size("1234"), 1234)
+        self.assertEqual(BitstreamCache.parse_size("4K"), 4096)
+        self.assertEqual(BitstreamCache.parse_size("2 MiB"), 2 << 20)
+        self.assertEqual(BitstreamCache.parse_size("1g"), 1 << 30)
+        with self.assertRaises(ValueError):
+            BitstreamCache.parse_size("lots")
+
+    def test_from_environment(self):
+        with mock.patch.dict(os.environ, {"GLASGOW_BITSTREAM_CACHE": self.tempdir.name,
+                                          "GLASGOW_BITSTREAM_CACHE_SIZE": "16M"}):
+            self.assertEqual(BitstreamCache.from_environment().size_limit, 16 << 20)
+        with mock.patch.dict(os.environ, {"GLASGOW_BITSTREAM_CACHE": self.tempdir.name,
+                                          "GLASGOW_BITSTREAM_CACHE_SIZE": "0"}):
+            self.assertIsNone(BitstreamCache.from_environment().size_limit)
+
+    def test_from_environment_invalid_size(self):
+        with mock.patch.dict(os.environ, {"GLASGOW_BITSTREAM_CACHE": self.tempdir.name,
+                                          "GLASGOW_BITSTREAM_CACHE_SIZE": "lots"}):
+            with self.assertLogs("glasgow.target.cache", "WARNING") as logs:
+                cache = BitstreamCache.from_environment()
+        self.assertEqual(cache.size_limit, BitstreamCache.DEFAULT_SIZE_LIMIT)
+        self.assertIn("'lots' is not a valid cache size", logs.output[0])
+
+    def test_write_interrupted(self):
+        with mock.patch("os.replace", side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                self.cache.put(b"\x01" * 16, b"bitstream", b"log\n")
+        self.assertEqual([name for name in os.listdir(self.tempdir.name)
+                          if name.endswith(".tmp")], [])
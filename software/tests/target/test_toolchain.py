@@ -0,0 +1,63 @@
+import os
+import stat
+import pathlib
+import tempfile
+import unittest
+from unittest import mock
+
+from glasgow.target import toolchain
+from glasgow.target.toolchain import SystemTool, WasmTool
+
+
+class ToolIdentifierCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.tool_filename = pathlib.Path(self.tempdir.name) / "icepack"
+        self.tool_filename.write_bytes(b"#!/bin/sh\n")
+        self.tool_filename.chmod(self.tool_filename.stat().st_mode | stat.S_IXUSR)
+        self.cache_filename = pathlib.Path(self.tempdir.name) / "cache" / "identifiers.json"
+        self.patches = [
+            mock.patch.dict(os.environ, {"ICEPACK": str(self.tool_filename)}),
+            mock.patch.object(toolchain, "_identifier_cache_filename", self.cache_filename),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in reversed(self.patches):
+            patch.stop()
+        self.tempdir.cleanup()
+
+    def test_cached(self):
+        identifier = SystemTool("icepack").identifier
+        self.assertTrue(self.cache_filename.exists())
+        with self.assertLogs("glasgow.target.toolchain", "DEBUG") as logs:
+            self.assertEqual(SystemTool("icepack").identifier, identifier)
+        self.assertIn("read from cache", logs.output[0])
+
+    def test_invalidated(self):
+        identifier = SystemTool("icepack").identifier
+        self.tool_filename.write_bytes(b"#!/bin/sh\nexit 1\n")
+        with self.assertLogs("glasgow.target.toolchain", "DEBUG") as logs:
+            self.assertNotEqual(SystemTool("icepack").identifier, identifier)
+        self.assertIn("computed", logs.output[0])
+
+    def test_corrupted(self):
+        identifier = SystemTool("icepack").identifier
+        self.cache_filename.write_text("{")
+        self.assertEqual(SystemTool("icepack").identifier, identifier)
+
+    def test_wasm_tool(self):
+        scripts_path = pathlib.Path(self.tempdir.name) / "scripts"
+        scripts_path.mkdir()
+        launcher_filename = scripts_path / "yowasp-yosys"
+        launcher_filename.write_bytes(b"")
+        launcher_filename.chmod(launcher_filename.stat().st_mode | stat.S_IXUSR)
+        with mock.patch.object(WasmTool, "available", True), \
+                mock.patch("sysconfig.get_path", return_value=str(scripts_path)), \
+                mock.patch("importlib.metadata.version", return_value="0.0"), \
+                mock.patch.object(WasmTool, "_compute_identifier", return_value=b"\x01" * 16):
+            identifier = WasmTool("yosys").identifier
+            with self.assertLogs("glasgow.target.toolchain", "DEBUG") as logs:
+                self.assertEqual(WasmTool("yosys").identifier, identifier)
+        self.assertIn("read from cache", logs.output[0])
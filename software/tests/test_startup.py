@@ -0,0 +1,76 @@
+import os
+import sys
+import time
+import tempfile
+import subprocess
+import statistics
+import unittest
+
+
+# The commands whose startup time is tracked by the benchmark; run `python -m tests.test_startup`
+# to measure them.
+_benchmark_commands = [
+    ["--help"],
+    ["list"],
+    ["run", "uart", "--help"],
+]
+
+
+def _run_glasgow(args, env=None, check=True):
+    return subprocess.run([sys.executable, "-m", "glasgow.cli", *args],
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, env=env, check=check)
+
+
+class StartupTestCase(unittest.TestCase):
+    def setUp(self):
+        # keep the plugin cache away from the user's cache directory (where supported)
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.env = {**os.environ, "XDG_CACHE_HOME": self.cache_dir.name}
+
+    def tearDown(self):
+        self.cache_dir.cleanup()
+
+    def run_python(self, code):
+        return subprocess.run([sys.executable, "-c", code],
+            stdout=subprocess.PIPE, text=True, env=self.env, check=True).stdout
+
+    def test_lazy_applets(self):
+        code = (
+            "import sys\n"
+            "from glasgow.cli import get_argparser\n"
+            "args = get_argparser().parse_args(\n"
+            "    ['build', '--rev', 'C3', 'uart', '--parity', 'odd'])\n"
+            "assert args.parity == 'odd'\n"
+            "print('glasgow.applet.interface.uart' in sys.modules)\n"
+            "print('glasgow.applet.interface.spi_controller' in sys.modules)\n"
+        )
+        self.run_python(code) # populate the plugin cache
+        self.assertEqual(self.run_python(code).split(), ["True", "False"])
+
+    def test_applet_help(self):
+        for _ in range(2): # with the plugin cache empty and populated
+            output = _run_glasgow(["run", "uart", "--help"], env=self.env).stdout
+            self.assertIn("--baud", output)
+            self.assertIn("--mirror-voltage", output)
+
+    def test_applet_list(self):
+        for _ in range(2): # with the plugin cache empty and populated
+            output = _run_glasgow(["tool", "--help"], env=self.env).stdout
+            self.assertIn("memory-floppy", output)
+            self.assertNotIn("uart", output) # has no tool
+
+
+def benchmark(iterations=5):
+    for args in _benchmark_commands:
+        _run_glasgow(args, check=False) # populate the plugin cache
+        timings = []
+        for _ in range(iterations):
+            started_at = time.perf_counter()
+            _run_glasgow(args, check=False)
+            timings.append(time.perf_counter() - started_at)
+        print(f"glasgow {' '.join(args)}: {statistics.median(timings):.3f} s "
+              f"(median of {iterations})")
+
+
+if __name__ == "__main__":
+    benchmark()